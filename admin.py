@@ -1,12 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session, send_file
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session, Response, send_file, jsonify
 from flask_login import login_required, current_user
-import json
 import os
-import csv
-import io
-import time
+import tempfile
+import queue
 from datetime import datetime
-from auth import generate_token, User
+from models import Talk, Speaker, User, Rating, Comment
+from events import event_broker, format_event
+from conditional import conditional
+from analytics import RatingAnalytics
+import exports
+from exports import ranked_talk_ids, summary_rows, detailed_rows, stream_csv, write_columnar, COLUMNAR_FORMATS
 
 admin = Blueprint('admin', __name__)
 
@@ -15,69 +18,79 @@ def dashboard():
     """Admin dashboard."""
     # Admin check is now handled by the before_request in app.py
     
-    # Load users data
-    users = {}
-    try:
-        with open(current_app.config['USERS_FILE'], 'r') as f:
-            users = json.load(f)
-    except Exception as e:
-        flash(f'Fehler beim Laden der Benutzerdaten: {str(e)}', 'danger')
-    
-    # Load talks data
-    talks = {}
-    try:
-        with open(current_app.config['TALKS_FILE'], 'r') as f:
-            talks = json.load(f)
-    except Exception as e:
-        flash(f'Fehler beim Laden der Vorträge: {str(e)}', 'danger')
+    # Load users and talks data
+    users = User.load_all(copy=False)
+    talks = Talk.get_all()
     
-    # Load ratings data
-    ratings = {}
-    try:
-        with open(current_app.config['RATINGS_FILE'], 'r') as f:
-            ratings = json.load(f)
-    except Exception as e:
-        flash(f'Fehler beim Laden der Bewertungen: {str(e)}', 'danger')
-    
-    # Calculate average ratings for each talk
-    avg_ratings = {}
-    for talk_id in talks:
-        ratings_for_talk = []
-        for user_ratings in ratings.values():
-            if talk_id in user_ratings:
-                ratings_for_talk.append(user_ratings[talk_id])
-        
-        if ratings_for_talk:
-            avg_ratings[talk_id] = sum(ratings_for_talk) / len(ratings_for_talk)
-        else:
-            avg_ratings[talk_id] = 0
+    # Statistics per talk and topic, computed once per ratings version
+    analytics = Rating.get_analytics()
+    avg_ratings = analytics.averages()
     
-    # Sort talks by average rating (descending)
+    # Sort talks by the selected ranking mode (descending), unrated talks last
+    rank = request.args.get('rank', 'average')
+    if rank not in RatingAnalytics.RANKING_MODES:
+        rank = 'average'
+    scores = analytics.scores(rank)
     sorted_talks = sorted(
         [(talk_id, talks[talk_id], avg_ratings.get(talk_id, 0)) for talk_id in talks],
-        key=lambda x: x[2],
+        key=lambda x: (x[0] in scores, scores.get(x[0], 0)),
         reverse=True
     )
     
     return render_template('admin/dashboard.html', 
                           users=users,
                           sorted_talks=sorted_talks,
+                          talk_stats=analytics.talks,
+                          topic_stats=analytics.topics,
+                          rank=rank,
+                          ranking_modes=RatingAnalytics.RANKING_MODES,
+                          scores=scores,
+                          intervals=analytics.confidence_intervals() if rank == 'bootstrap' else {},
+                          parquet_available=exports.pyarrow is not None,
                           user_count=len(users),
+                          rating_count=sum(stats['count'] for stats in analytics.talks.values()),
+                          comment_count=Comment.count_all(),
                           talk_count=len(talks),
                           max_rating=current_app.config['MAX_RATING'])
 
+@admin.route('/events')
+def events():
+    """Stream live updates of ratings and comments as Server-Sent Events.
+    
+    Each event carries the changed talk's new numbers, so the dashboard can
+    update in place instead of being reloaded.
+    """
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    subscription = event_broker.subscribe(last_event_id)
+    keepalive = current_app.config['EVENTS_KEEPALIVE_INTERVAL']
+    
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event_id, event, data = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_event(event_id, event, data)
+                if event == 'reload':
+                    return
+        finally:
+            event_broker.unsubscribe(subscription)
+    
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @admin.route('/users')
 def manage_users():
     """User management page."""
     # Admin check is now handled by the before_request in app.py
     
     # Load users data
-    users = {}
-    try:
-        with open(current_app.config['USERS_FILE'], 'r') as f:
-            users = json.load(f)
-    except Exception as e:
-        flash(f'Fehler beim Laden der Benutzerdaten: {str(e)}', 'danger')
+    users = User.load_all(copy=False)
     
     return render_template('admin/users.html', users=users)
 
@@ -93,42 +106,13 @@ def add_user():
         flash('Bitte geben Sie Name und E-Mail-Adresse ein.', 'danger')
         return redirect(url_for('admin.manage_users'))
     
-    # Load current users
-    users = {}
-    try:
-        with open(current_app.config['USERS_FILE'], 'r') as f:
-            users = json.load(f)
-    except Exception as e:
-        flash(f'Fehler beim Laden der Benutzerdaten: {str(e)}', 'danger')
-        return redirect(url_for('admin.manage_users'))
-    
-    # Check if email already exists
-    for user_data in users.values():
-        if user_data.get('email') == email:
-            flash(f'Ein Benutzer mit der E-Mail-Adresse {email} existiert bereits.', 'danger')
-            return redirect(url_for('admin.manage_users'))
-    
-    # Generate user ID and token
-    user_id = f"user_{int(time.time())}_{len(users) + 1}"
-    token = generate_token()
-    
-    # Add new user
-    users[user_id] = {
-        'name': name,
-        'email': email,
-        'token': token,
-        'created_at': datetime.now().isoformat()
-    }
-    
-    # Save updated users
-    try:
-        with open(current_app.config['USERS_FILE'], 'w') as f:
-            json.dump(users, f, indent=4)
-    except Exception as e:
-        flash(f'Fehler beim Speichern des Benutzers: {str(e)}', 'danger')
+    # Create the user (checks that the email address is unique)
+    user, result = User.create(name, email)
+    if not user:
+        flash(result, 'danger')
         return redirect(url_for('admin.manage_users'))
     
-    flash(f'Benutzer {name} erfolgreich hinzugefügt. Access-Token: {token}', 'success')
+    flash(f'Benutzer {name} erfolgreich hinzugefügt. Access-Token: {result}', 'success')
     return redirect(url_for('admin.manage_users'))
 
 @admin.route('/users/regenerate-token/<user_id>', methods=['POST'])
@@ -136,33 +120,19 @@ def regenerate_token(user_id):
     """Regenerate access token for a user."""
     # Admin check is now handled by the before_request in app.py
     
-    # Load current users
-    users = {}
-    try:
-        with open(current_app.config['USERS_FILE'], 'r') as f:
-            users = json.load(f)
-    except Exception as e:
-        flash(f'Fehler beim Laden der Benutzerdaten: {str(e)}', 'danger')
-        return redirect(url_for('admin.manage_users'))
-    
     # Check if user exists
-    if user_id not in users:
+    user = User.get_by_id(user_id)
+    if not user:
         flash('Benutzer nicht gefunden.', 'danger')
         return redirect(url_for('admin.manage_users'))
     
-    # Generate new token
-    new_token = generate_token()
-    users[user_id]['token'] = new_token
-    
-    # Save updated users
-    try:
-        with open(current_app.config['USERS_FILE'], 'w') as f:
-            json.dump(users, f, indent=4)
-    except Exception as e:
-        flash(f'Fehler beim Speichern des neuen Tokens: {str(e)}', 'danger')
+    # Generate and save new token
+    new_token, error = User.regenerate_token(user_id)
+    if error:
+        flash(error, 'danger')
         return redirect(url_for('admin.manage_users'))
     
-    flash(f'Neues Access-Token für {users[user_id]["name"]} generiert: {new_token}', 'success')
+    flash(f'Neues Access-Token für {user.name} generiert: {new_token}', 'success')
     return redirect(url_for('admin.manage_users'))
 
 @admin.route('/users/delete/<user_id>', methods=['POST'])
@@ -170,176 +140,173 @@ def delete_user(user_id):
     """Delete a user."""
     # Admin check is now handled by the before_request in app.py
     
-    # Load current users
-    users = {}
-    try:
-        with open(current_app.config['USERS_FILE'], 'r') as f:
-            users = json.load(f)
-    except Exception as e:
-        flash(f'Fehler beim Laden der Benutzerdaten: {str(e)}', 'danger')
-        return redirect(url_for('admin.manage_users'))
-    
     # Check if user exists
-    if user_id not in users:
+    user = User.get_by_id(user_id)
+    if not user:
         flash('Benutzer nicht gefunden.', 'danger')
         return redirect(url_for('admin.manage_users'))
     
-    user_name = users[user_id]['name']
-    
-    # Delete user
-    del users[user_id]
-    
-    # Save updated users
-    try:
-        with open(current_app.config['USERS_FILE'], 'w') as f:
-            json.dump(users, f, indent=4)
-    except Exception as e:
-        flash(f'Fehler beim Löschen des Benutzers: {str(e)}', 'danger')
+    # Delete user together with their ratings
+    success, error = User.delete(user_id)
+    if not success:
+        flash(error, 'danger')
         return redirect(url_for('admin.manage_users'))
     
-    # Also remove user's ratings
-    try:
-        with open(current_app.config['RATINGS_FILE'], 'r') as f:
-            ratings = json.load(f)
-            if user_id in ratings:
-                del ratings[user_id]
-        
-        with open(current_app.config['RATINGS_FILE'], 'w') as f:
-            json.dump(ratings, f, indent=4)
-    except Exception as e:
-        flash(f'Fehler beim Löschen der Bewertungen des Benutzers: {str(e)}', 'warning')
-    
-    flash(f'Benutzer {user_name} erfolgreich gelöscht.', 'success')
+    flash(f'Benutzer {user.name} erfolgreich gelöscht.', 'success')
     return redirect(url_for('admin.manage_users'))
 
 @admin.route('/ratings-matrix')
+@conditional(Talk)
 def ratings_matrix():
-    """Show matrix of all ratings with talks as rows and users as columns."""
-    # Load all data
-    talks = {}
-    users = {}
-    speakers = {}
-    ratings = {}
+    """Show the matrix of all ratings with talks as rows and users as columns.
     
-    try:
-        with open(current_app.config['TALKS_FILE'], 'r') as f:
-            talks = json.load(f)
-        with open(current_app.config['USERS_FILE'], 'r') as f:
-            users = json.load(f)
-        with open(current_app.config['SPEAKERS_FILE'], 'r') as f:
-            speakers = json.load(f)
-        with open(current_app.config['RATINGS_FILE'], 'r') as f:
-            ratings = json.load(f)
-    except Exception as e:
-        flash(f'Error loading data: {str(e)}', 'danger')
-        return redirect(url_for('admin.dashboard'))
+    The page only holds the filters; the matrix is loaded page by page from
+    ratings_matrix_data() and rendered in the browser.
+    """
+    return render_template('admin/ratings_matrix.html',
+                         topics=Talk.get_all_topics())
 
-    # Prepare talk data with speaker names
-    talk_data = []
-    for talk_id, talk in talks.items():
-        speaker_name = ""
-        if 'speakerId' in talk and talk['speakerId']:
-            speaker = speakers.get(str(talk['speakerId']))
-            if speaker:
-                speaker_name = f"{speaker.get('firstName', '')} {speaker.get('surName', '')}"
-        
-        talk_data.append({
+# Ascending sort keys of the matrix rows; None keeps the stored order
+MATRIX_SORTS = {
+    'id': None,
+    'title': lambda talk_id, talk, stats: talk.get('title', '').casefold(),
+    'average': lambda talk_id, talk, stats: stats['mean'],
+    'count': lambda talk_id, talk, stats: stats['count']
+}
+# Unrated talks come last in both directions for these sorts
+MATRIX_RATED_FIRST = ('average', 'count')
+MATRIX_PAGE_SIZE = 50
+MATRIX_MAX_PAGE_SIZE = 500
+
+def _page_arg(name, default):
+    """Get a non-negative paging argument, page sizes limited to MATRIX_MAX_PAGE_SIZE."""
+    value = max(request.args.get(name, default, type=int), 0)
+    return min(value, MATRIX_MAX_PAGE_SIZE) if name.endswith('limit') else value
+
+@admin.route('/ratings-matrix/data')
+@conditional(Talk, Speaker, User, Rating)
+def ratings_matrix_data():
+    """One page of the ratings matrix as sparse JSON.
+    
+    Rows (talks) are paged with ``offset``/``limit``, filtered by ``topic``
+    and sorted by ``sort`` (id, title, average or count). Columns (users)
+    are paged with ``user_offset``/``user_limit``, filtered by ``reviewer``
+    (part of the name or e-mail address) and sorted by ``user_sort`` (name
+    or count); ``active=1`` leaves out users without ratings. ``cells``
+    lists only the rated cells as [row, column, rating] within the page.
+    """
+    talks = Talk.get_all()
+    users = User.load_all(copy=False)
+    analytics = Rating.get_analytics()
+    matrix = analytics.matrix
+    
+    # Rows: filtered and sorted talk IDs, only the page is looked at further
+    topic = request.args.get('topic', '')
+    talk_ids = [talk_id for talk_id, talk in talks.items() if not topic or talk.get('topicId') == topic]
+    sort = request.args.get('sort', 'id')
+    sort_key = MATRIX_SORTS.get(sort)
+    descending = request.args.get('order') == 'desc'
+    if sort_key is not None:
+        talk_ids.sort(key=lambda talk_id: sort_key(talk_id, talks[talk_id], analytics.get(talk_id)),
+                      reverse=descending)
+        if sort in MATRIX_RATED_FIRST:
+            # Stable, so the order within rated and unrated talks is kept
+            talk_ids.sort(key=lambda talk_id: analytics.get(talk_id)['count'] == 0)
+    elif descending:
+        talk_ids.reverse()
+    offset, limit = _page_arg('offset', 0), _page_arg('limit', MATRIX_PAGE_SIZE)
+    page_talk_ids = talk_ids[offset:offset + limit]
+    
+    # Columns: filtered and sorted user IDs
+    reviewer = request.args.get('reviewer', '').strip().casefold()
+    user_ids = [user_id for user_id, user in users.items()
+                if not reviewer or reviewer in user.get('name', '').casefold()
+                or reviewer in user.get('email', '').casefold()]
+    user_sort = request.args.get('user_sort')
+    if user_sort == 'count' or request.args.get('active') == '1':
+        user_counts = matrix.user_counts()
+        if request.args.get('active') == '1':
+            user_ids = [user_id for user_id in user_ids if user_id in user_counts]
+        if user_sort == 'count':
+            user_ids.sort(key=lambda user_id: -user_counts.get(user_id, 0))
+    elif user_sort == 'name':
+        user_ids.sort(key=lambda user_id: users[user_id].get('name', '').casefold())
+    user_offset, user_limit = _page_arg('user_offset', 0), _page_arg('user_limit', MATRIX_PAGE_SIZE)
+    page_user_ids = user_ids[user_offset:user_offset + user_limit]
+    
+    speakers = Speaker.get_all()
+    rows = []
+    for talk_id in page_talk_ids:
+        talk = talks[talk_id]
+        speaker = speakers.get(str(talk.get('speakerId'))) if talk.get('speakerId') else None
+        stats = analytics.get(talk_id)
+        rows.append({
             'id': talk_id,
             'title': talk.get('title', ''),
-            'speaker': speaker_name,
-            'ratings': {}
+            'speaker': f"{speaker.get('firstName', '')} {speaker.get('surName', '')}" if speaker else '',
+            'topic': talk.get('topicId', ''),
+            'average': stats['mean'] if stats['count'] else None,
+            'count': stats['count']
         })
-
-    # Add ratings for each user
-    for user_id in users:
-        user_ratings = ratings.get(user_id, {})
-        for talk in talk_data:
-            talk['ratings'][user_id] = user_ratings.get(talk['id'])
-
-    return render_template('admin/ratings_matrix.html',
-                         talks=talk_data,
-                         users=users,
-                         max_rating=current_app.config['MAX_RATING'])
+    columns = [{'id': user_id, 'name': users[user_id].get('name', ''), 'email': users[user_id].get('email', '')}
+               for user_id in page_user_ids]
+    
+    return jsonify(total_rows=len(talk_ids),
+                   total_columns=len(user_ids),
+                   offset=offset,
+                   user_offset=user_offset,
+                   rows=rows,
+                   columns=columns,
+                   cells=matrix.block(page_talk_ids, page_user_ids))
 
 @admin.route('/export-ratings')
+@conditional(Talk, User, Rating, key=lambda: 'gzip' in request.accept_encodings)
 def export_ratings():
-    """Export ratings as CSV file."""
+    """Export ratings as CSV file, streamed row by row.
+    
+    ``rank`` selects the ranking mode the talks are sorted by, ``layout=detailed``
+    exports one column per user instead of the statistics. The file is
+    gzip-compressed for clients that accept it. ``format`` selects one of the
+    columnar formats instead (npz, or parquet and arrow with pyarrow installed).
+    """
     # Admin check is now handled by the before_request in app.py
     
     # Load talks data
-    talks = {}
-    try:
-        with open(current_app.config['TALKS_FILE'], 'r') as f:
-            talks = json.load(f)
-    except Exception as e:
-        flash(f'Fehler beim Laden der Vorträge: {str(e)}', 'danger')
-        return redirect(url_for('admin.dashboard'))
-    
-    # Load ratings data
-    ratings = {}
-    try:
-        with open(current_app.config['RATINGS_FILE'], 'r') as f:
-            ratings = json.load(f)
-    except Exception as e:
-        flash(f'Fehler beim Laden der Bewertungen: {str(e)}', 'danger')
-        return redirect(url_for('admin.dashboard'))
-    
-    # Load users data
-    users = {}
-    try:
-        with open(current_app.config['USERS_FILE'], 'r') as f:
-            users = json.load(f)
-    except Exception as e:
-        flash(f'Fehler beim Laden der Benutzerdaten: {str(e)}', 'danger')
-        return redirect(url_for('admin.dashboard'))
-    
-    # Calculate average ratings for each talk
-    avg_ratings = {}
-    for talk_id in talks:
-        ratings_for_talk = []
-        for user_ratings in ratings.values():
-            if talk_id in user_ratings:
-                ratings_for_talk.append(user_ratings[talk_id])
-        
-        if ratings_for_talk:
-            avg_ratings[talk_id] = sum(ratings_for_talk) / len(ratings_for_talk)
-        else:
-            avg_ratings[talk_id] = 0
-    
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['Talk ID', 'Booking Number', 'Title', 'Topic', 'Average Rating', 'Number of Ratings'])
+    talks = Talk.get_all()
     
-    # Write data rows
-    for talk_id, talk_data in talks.items():
-        # Count ratings for this talk
-        rating_count = sum(1 for user_ratings in ratings.values() if talk_id in user_ratings)
-        
-        writer.writerow([
-            talk_id,
-            talk_data.get('bookingNumber', ''),
-            talk_data.get('title', ''),
-            talk_data.get('topicId', ''),
-            f"{avg_ratings.get(talk_id, 0):.2f}",
-            rating_count
-        ])
-    
-    # Prepare response
-    output.seek(0)
+    # Statistics and rankings per talk, computed once per ratings version
+    analytics = Rating.get_analytics()
+    talk_ids = ranked_talk_ids(analytics, talks, request.args.get('rank', 'average'))
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
-    # Create a BytesIO object from the StringIO
-    mem = io.BytesIO()
-    mem.write(output.getvalue().encode('utf-8'))
-    mem.seek(0)
-    output.close()
-    
-    return send_file(
-        mem,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'jfs2025_ratings_export_{timestamp}.csv'
-    )
+    export_format = request.args.get('format', 'csv')
+    if export_format != 'csv':
+        if export_format not in COLUMNAR_FORMATS:
+            flash(f'Unbekanntes Exportformat: {export_format}', 'danger')
+            return redirect(url_for('admin.dashboard'))
+        if export_format != 'npz' and exports.pyarrow is None:
+            flash('Für den Export als Parquet oder Arrow muss pyarrow installiert sein.', 'danger')
+            return redirect(url_for('admin.dashboard'))
+        
+        # Written to a temporary file, not kept in memory
+        output = tempfile.TemporaryFile()
+        write_columnar(output, export_format, analytics.matrix, talks, talk_ids, User.load_all(copy=False))
+        output.seek(0)
+        mimetype, extension = COLUMNAR_FORMATS[export_format]
+        return send_file(output, mimetype=mimetype, as_attachment=True,
+                         download_name=f'jfs2025_ratings_{timestamp}.{extension}')
+    
+    if request.args.get('layout') == 'detailed':
+        rows = detailed_rows(analytics.matrix, analytics, talks, talk_ids, User.load_all(copy=False))
+        name = 'jfs2025_ratings_detailed'
+    else:
+        rows = summary_rows(analytics, talks, talk_ids)
+        name = 'jfs2025_ratings_export'
+    
+    compress = 'gzip' in request.accept_encodings
+    response = Response(stream_csv(rows, compress), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={name}_{timestamp}.csv'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
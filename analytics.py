@@ -0,0 +1,292 @@
+import math
+import random
+import threading
+
+try:
+    import numpy
+except ImportError:  # Same results from plain Python loops over the histograms
+    numpy = None
+
+
+class RatingAnalytics:
+    """Rating statistics per talk and per topic, computed from a RatingMatrix.
+
+    Everything is derived from one histogram per talk (how often each
+    rating value was given). With NumPy the histograms are counted on the
+    whole talk x user matrix at once and the statistics are computed for all
+    talks in vectorized form; without it the same numbers come from byte
+    counts per column. Ratings are small integers, so the median and the
+    standard deviation follow exactly from the histogram.
+
+    ``talks`` holds per-talk dicts with count, mean, median, std (population
+    standard deviation) and histogram (histogram[i] counts the rating i + 1)
+    for every rated talk; ``topics`` the same for all ratings of the talks
+    of a topic, plus the number of talks and rated talks in the topic.
+
+    scores(mode) ranks the rated talks by one of RANKING_MODES; the scores
+    of each mode are computed for all talks at once on first use and kept
+    with the analytics, i.e. until the ratings change.
+    """
+
+    RANKING_MODES = {
+        'average': 'Durchschnitt',
+        'zscore': 'Z-Score (Bewerter-normalisiert)',
+        'bayesian': 'Bayes-Durchschnitt',
+        'wilson': 'Wilson-Untergrenze',
+        'bootstrap': 'Bootstrap-Untergrenze (95 %)'
+    }
+
+    def __init__(self, matrix, talks, max_rating=5, prior_weight=None, bootstrap_samples=1000):
+        self.max_rating = max_rating
+        self.prior_weight = prior_weight
+        self.bootstrap_samples = bootstrap_samples
+        self.matrix = matrix
+        self._scores = {}
+        self._intervals = None
+        talk_ids = list(matrix.talk_ids)
+        topic_of = {talk_id: talk.get('topicId') or '' for talk_id, talk in talks.items()}
+
+        if numpy is not None:
+            cells = matrix.to_array()
+            histograms = self._count_histograms(cells)
+            topic_names = sorted(set(topic_of.values()) - {''})
+            topic_index = {topic: i for i, topic in enumerate(topic_names)}
+            columns = numpy.array([topic_index.get(topic_of.get(talk_id, ''), -1) for talk_id in talk_ids],
+                                  dtype=numpy.int64)
+            topic_histograms = numpy.zeros((len(topic_names), max_rating), dtype=numpy.int64)
+            known = columns >= 0
+            numpy.add.at(topic_histograms, columns[known], histograms[known])
+
+            self.talks = self._summarize_all(talk_ids, histograms)
+            self.topics = self._summarize_all(topic_names, topic_histograms, keep_empty=True)
+            self._scores['zscore'] = self._zscores_numpy(cells, talk_ids)
+        else:
+            self.talks = {}
+            topic_histograms = {topic: [0] * max_rating for topic in set(topic_of.values()) - {''}}
+            for talk_id in talk_ids:
+                column = matrix.column(talk_id)
+                histogram = [column.count(value) for value in range(1, max_rating + 1)]
+                if any(histogram):
+                    self.talks[talk_id] = self._summarize(histogram)
+                topic = topic_of.get(talk_id, '')
+                if topic:
+                    topic_histograms[topic] = [a + b for a, b in zip(topic_histograms[topic], histogram)]
+            self.topics = {topic: self._summarize(topic_histograms[topic]) for topic in sorted(topic_histograms)}
+            self._scores['zscore'] = self._zscores_python(matrix, talk_ids)
+
+        talk_counts, rated_counts = {}, {}
+        for talk_id, topic in topic_of.items():
+            talk_counts[topic] = talk_counts.get(topic, 0) + 1
+            if talk_id in self.talks:
+                rated_counts[topic] = rated_counts.get(topic, 0) + 1
+        for topic, stats in self.topics.items():
+            stats['talks'] = talk_counts.get(topic, 0)
+            stats['rated_talks'] = rated_counts.get(topic, 0)
+
+    def _count_histograms(self, cells):
+        """Count every rating value per talk: a talks x max_rating array."""
+        if not cells.shape[1]:
+            return numpy.zeros((0, self.max_rating), dtype=numpy.int64)
+        return numpy.stack([numpy.count_nonzero(cells == value, axis=0)
+                            for value in range(1, self.max_rating + 1)], axis=1).astype(numpy.int64)
+
+    def _summarize_all(self, names, histograms, keep_empty=False):
+        values = numpy.arange(1, self.max_rating + 1)
+        counts = histograms.sum(axis=1)
+        safe_counts = numpy.maximum(counts, 1)
+        means = (histograms @ values) / safe_counts
+        variances = (histograms @ (values ** 2)) / safe_counts - means ** 2
+        stds = numpy.sqrt(numpy.maximum(variances, 0))
+
+        # The median is the mean of the values at positions (n-1)//2 and n//2
+        cumulative = histograms.cumsum(axis=1)
+        lower = numpy.argmax(cumulative > ((counts - 1) // 2)[:, None], axis=1) + 1
+        upper = numpy.argmax(cumulative > (counts // 2)[:, None], axis=1) + 1
+        medians = (lower + upper) / 2
+
+        summary = {}
+        for i, name in enumerate(names):
+            if counts[i] or keep_empty:
+                summary[name] = {
+                    'count': int(counts[i]),
+                    'mean': float(means[i]) if counts[i] else 0.0,
+                    'median': float(medians[i]) if counts[i] else 0.0,
+                    'std': float(stds[i]) if counts[i] else 0.0,
+                    'histogram': [int(n) for n in histograms[i]]
+                }
+        return summary
+
+    @staticmethod
+    def _summarize(histogram):
+        count = sum(histogram)
+        if not count:
+            return {'count': 0, 'mean': 0.0, 'median': 0.0, 'std': 0.0, 'histogram': list(histogram)}
+        mean = sum(value * n for value, n in enumerate(histogram, 1)) / count
+        variance = sum(value * value * n for value, n in enumerate(histogram, 1)) / count - mean * mean
+
+        def value_at(position):
+            seen = 0
+            for value, n in enumerate(histogram, 1):
+                seen += n
+                if seen > position:
+                    return value
+
+        return {
+            'count': count,
+            'mean': mean,
+            'median': (value_at((count - 1) // 2) + value_at(count // 2)) / 2,
+            'std': math.sqrt(max(variance, 0)),
+            'histogram': list(histogram)
+        }
+
+    def _zscores_numpy(self, cells, talk_ids):
+        """Average per talk of the ratings as z-scores within each reviewer's ratings."""
+        rated = cells > 0
+        values = cells.astype(numpy.float64)
+        per_user = numpy.maximum(rated.sum(axis=1), 1)
+        means = values.sum(axis=1) / per_user
+        stds = numpy.sqrt(numpy.maximum((values ** 2).sum(axis=1) / per_user - means ** 2, 0))
+        # Reviewers who give every talk the same rating carry no ranking information
+        usable = rated & (stds > 0)[:, None]
+        z = numpy.where(usable, (values - means[:, None]) / numpy.where(stds > 0, stds, 1)[:, None], 0.0)
+        counts = rated.sum(axis=0)
+        totals = z.sum(axis=0)
+        return {talk_id: float(totals[i] / counts[i]) for i, talk_id in enumerate(talk_ids) if counts[i]}
+
+    def _zscores_python(self, matrix, talk_ids):
+        totals = [0.0] * len(talk_ids)
+        counts = [0] * len(talk_ids)
+        for user_id in matrix.user_ids:
+            row = matrix.row(user_id)
+            rated = [(c, rating) for c, rating in enumerate(row) if rating]
+            if not rated:
+                continue
+            mean = sum(rating for _, rating in rated) / len(rated)
+            std = math.sqrt(max(sum(rating * rating for _, rating in rated) / len(rated) - mean * mean, 0))
+            for c, rating in rated:
+                counts[c] += 1
+                if std > 0:
+                    totals[c] += (rating - mean) / std
+        return {talk_id: totals[c] / counts[c] for c, talk_id in enumerate(talk_ids) if counts[c]}
+
+    def scores(self, mode='average'):
+        """Get {talk_id: score} of the rated talks for a ranking mode; higher is better."""
+        if mode not in self.RANKING_MODES:
+            raise ValueError(f"Unknown ranking mode: {mode}")
+        if mode not in self._scores:
+            if mode == 'average':
+                self._scores[mode] = self.averages()
+            elif mode == 'bayesian':
+                self._scores[mode] = self._bayesian_averages()
+            elif mode == 'wilson':
+                self._scores[mode] = self._wilson_lower_bounds()
+            elif mode == 'bootstrap':
+                self._scores[mode] = {talk_id: low for talk_id, (low, _) in self.confidence_intervals().items()}
+        return self._scores[mode]
+
+    def ranking(self, mode='average'):
+        """Get the talk IDs of the rated talks, best first."""
+        scores = self.scores(mode)
+        return sorted(scores, key=lambda talk_id: -scores[talk_id])
+
+    def _bayesian_averages(self):
+        """Averages shrunk towards the overall mean by ``prior_weight`` virtual votes.
+
+        Without a configured weight the average number of ratings per rated
+        talk is used.
+        """
+        total = sum(stats['count'] for stats in self.talks.values())
+        if not total:
+            return {}
+        overall = sum(stats['mean'] * stats['count'] for stats in self.talks.values()) / total
+        weight = self.prior_weight if self.prior_weight is not None else total / len(self.talks)
+        return {talk_id: (weight * overall + stats['mean'] * stats['count']) / (weight + stats['count'])
+                for talk_id, stats in self.talks.items()}
+
+    def _wilson_lower_bounds(self, z=1.96):
+        """Wilson score lower bound of the average, mapped to the 0..1 range and back."""
+        bounds = {}
+        span = max(self.max_rating - 1, 1)
+        for talk_id, stats in self.talks.items():
+            n = stats['count']
+            p = (stats['mean'] - 1) / span
+            center = p + z * z / (2 * n)
+            margin = z * math.sqrt(max(p * (1 - p), 0) / n + z * z / (4 * n * n))
+            bounds[talk_id] = 1 + span * (center - margin) / (1 + z * z / n)
+        return bounds
+
+    def confidence_intervals(self, level=0.95):
+        """Get bootstrap confidence intervals {talk_id: (low, high)} of the average ratings.
+
+        Resampling a talk's n ratings with replacement is a multinomial draw
+        from its histogram, so all resamples of a talk are drawn at once.
+        Uses a fixed seed, so intervals do not change between page loads.
+        """
+        if self._intervals is None:
+            alpha = (1 - level) / 2
+            intervals = {}
+            if numpy is not None:
+                generator = numpy.random.default_rng(2025)
+                values = numpy.arange(1, self.max_rating + 1)
+                for talk_id, stats in self.talks.items():
+                    n = stats['count']
+                    draws = generator.multinomial(n, numpy.array(stats['histogram']) / n, size=self.bootstrap_samples)
+                    means = draws @ values / n
+                    low, high = numpy.quantile(means, [alpha, 1 - alpha])
+                    intervals[talk_id] = (float(low), float(high))
+            else:
+                generator = random.Random(2025)
+                values = range(1, self.max_rating + 1)
+                # Fewer resamples without NumPy to keep the page responsive
+                samples = min(self.bootstrap_samples, 200)
+                for talk_id, stats in self.talks.items():
+                    n = stats['count']
+                    means = sorted(sum(generator.choices(values, weights=stats['histogram'], k=n)) / n
+                                   for _ in range(samples))
+                    intervals[talk_id] = (means[int(alpha * (samples - 1))], means[int((1 - alpha) * (samples - 1))])
+            self._intervals = intervals
+        return self._intervals
+
+    def get(self, talk_id):
+        """Get the statistics of one talk; unrated talks get zeros."""
+        stats = self.talks.get(talk_id)
+        if stats is None:
+            return self._summarize([0] * self.max_rating)
+        return stats
+
+    def averages(self):
+        return {talk_id: stats['mean'] for talk_id, stats in self.talks.items()}
+
+    def counts(self):
+        return {talk_id: stats['count'] for talk_id, stats in self.talks.items()}
+
+
+_cached = None
+_cached_lock = threading.Lock()
+
+
+def get_analytics(matrix, talks, max_rating=5, version=None, **options):
+    """Get the RatingAnalytics for a rating matrix and the talk catalog.
+
+    With ``version``, which identifies the ratings and talks data (see
+    JSONStorageModel.data_version), the result is reused while the version
+    is unchanged; ``matrix`` and ``talks`` are then functions loading them,
+    called only when the analytics are computed again. Without it the result
+    is reused until the matrix changes (see RatingMatrix.version) or is
+    asked for with a different matrix or talks object. Other options always
+    compute new analytics.
+    """
+    global _cached
+    settings = (max_rating, sorted(options.items()))
+    with _cached_lock:
+        if version is not None:
+            current = _cached is not None and _cached[1] == version and _cached[3] == settings
+        else:
+            current = (_cached is not None and _cached[0] is matrix and _cached[1] == matrix.version
+                       and _cached[2] is talks and _cached[3] == settings)
+        if not current:
+            if version is not None:
+                matrix, talks = matrix(), talks()
+            _cached = (matrix, version if version is not None else matrix.version, talks, settings,
+                       RatingAnalytics(matrix, talks, max_rating, **options))
+        return _cached[4]
@@ -1,11 +1,11 @@
 from flask import Flask, session, request, redirect, url_for, flash
 from flask_login import LoginManager, current_user
 import os
-import json
 from datetime import timedelta
 
 from config import Config
-from models import User
+from models import User, RequestSnapshot
+from storage import write_json, copy_file
 
 def create_app(config_class=Config):
     """Create and configure the Flask application."""
@@ -26,32 +26,20 @@ def create_app(config_class=Config):
     os.makedirs(app.config['LOG_DIR'], exist_ok=True)
     
     # Create empty data files if they don't exist
-    if not os.path.exists(app.config['USERS_FILE']):
-        with open(app.config['USERS_FILE'], 'w') as f:
-            json.dump({}, f)
-    
-    if not os.path.exists(app.config['RATINGS_FILE']):
-        with open(app.config['RATINGS_FILE'], 'w') as f:
-            json.dump({}, f)
-    
-    if not os.path.exists(app.config['COMMENTS_FILE']):
-        with open(app.config['COMMENTS_FILE'], 'w') as f:
-            json.dump({}, f)
+    for data_file in ('USERS_FILE', 'RATINGS_FILE', 'COMMENTS_FILE'):
+        if not os.path.exists(app.config[data_file]):
+            write_json(app.config[data_file], {})
     
     # Copy demo data files if they don't exist
     if not os.path.exists(app.config['TALKS_FILE']):
         try:
-            with open(app.config['TALKS_DEMO_FILE'], 'r') as src:
-                with open(app.config['TALKS_FILE'], 'w') as dst:
-                    dst.write(src.read())
+            copy_file(app.config['TALKS_DEMO_FILE'], app.config['TALKS_FILE'])
         except Exception as e:
             print(f"Error copying talks demo file: {e}")
     
     if not os.path.exists(app.config['SPEAKERS_FILE']):
         try:
-            with open(app.config['SPEAKERS_DEMO_FILE'], 'r') as src:
-                with open(app.config['SPEAKERS_FILE'], 'w') as dst:
-                    dst.write(src.read())
+            copy_file(app.config['SPEAKERS_DEMO_FILE'], app.config['SPEAKERS_FILE'])
         except Exception as e:
             print(f"Error copying speakers demo file: {e}")
     
@@ -62,7 +50,7 @@ def create_app(config_class=Config):
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.get_by_id(user_id)
+        return User.load_cached(user_id)
     
     # Register blueprints
     from auth import auth as auth_blueprint
@@ -108,4 +96,13 @@ def create_app(config_class=Config):
                 flash('Admin-Sitzung abgelaufen. Bitte melden Sie sich erneut an.', 'warning')
                 return redirect(url_for('auth.admin_login'))
     
+    @app.after_request
+    def report_data_loads(response):
+        # Debug counter: how often this request read data from storage
+        if app.debug or app.config.get('DEBUG_DATA_LOADS'):
+            snapshot = RequestSnapshot.current()
+            response.headers['X-Data-Loads'] = str(snapshot.loads)
+            app.logger.debug(f"{request.method} {request.path}: {snapshot.loads} data loads")
+        return response
+    
     return app
@@ -4,7 +4,6 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
 import time
 import os
-import json
 import markdown
 from models import User
 
@@ -114,27 +113,13 @@ def admin_login():
                 token='admin-token'
             )
             
-            # Save admin user to the users file to ensure it exists
-            users = {}
-            try:
-                with open(current_app.config['USERS_FILE'], 'r') as f:
-                    users = json.load(f)
-            except Exception as e:
-                print(f"Error loading users: {e}")
-                
-            # Add or update admin user
-            users['admin'] = {
+            # Add or update the admin user in the user storage to ensure it exists
+            if not User.save_user('admin', {
                 'name': 'Administrator',
                 'email': 'admin@example.com',
                 'token': 'admin-token'
-            }
-            
-            # Save updated users
-            try:
-                with open(current_app.config['USERS_FILE'], 'w') as f:
-                    json.dump(users, f, indent=4)
-            except Exception as e:
-                print(f"Error saving admin user: {e}")
+            }):
+                print("Error saving admin user")
             
             # Now login the user
             login_user(admin_user, remember=True)
@@ -0,0 +1,104 @@
+import functools
+import glob
+import hashlib
+import os
+from datetime import datetime, timezone
+
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+
+# Session values the base template renders on every page
+SESSION_KEYS = ('is_admin', 'show_info_box')
+
+_code_version = None
+_static_version = None
+
+
+def code_version():
+    """Identify the deployed modules and templates by their modification times.
+
+    Part of every ETag, so pages are rendered again after an update even if
+    the data did not change.
+    """
+    global _code_version
+    if _code_version is None:
+        root = current_app.root_path
+        paths = glob.glob(os.path.join(root, '*.py'))
+        paths += glob.glob(os.path.join(root, current_app.template_folder, '**', '*.html'), recursive=True)
+        digest = hashlib.sha1()
+        for path in sorted(paths):
+            digest.update(f'{path}:{os.stat(path).st_mtime_ns};'.encode('utf-8'))
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def static_version():
+    """Identify the static files by their content.
+
+    Used as the cache version of the service worker, so browsers drop their
+    cached scripts and styles once they changed.
+    """
+    global _static_version
+    if _static_version is None:
+        root = current_app.static_folder
+        digest = hashlib.sha1()
+        for path in sorted(glob.glob(os.path.join(root, '**', '*'), recursive=True)):
+            if os.path.isfile(path):
+                digest.update(os.path.relpath(path, root).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        _static_version = digest.hexdigest()[:12]
+    return _static_version
+
+
+def _set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+
+
+def conditional(*models, key=None):
+    """Answer GET requests with 304 Not Modified while the page's data is unchanged.
+
+    A view declares the models it renders. The strong ETag covers their data
+    versions (see JSONStorageModel.data_version), the URL, the current user
+    and the session values of the base template; ``key`` may return further
+    state the response depends on. Last-Modified is the time of the latest
+    change of the models. The versions are read before the view runs, so a
+    change while rendering only makes the next request render again.
+
+    Pages with pending flashed messages are always rendered and not cached,
+    since the messages are shown only once.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            versions = [model.data_version() for model in models]
+            digest = hashlib.sha1()
+            for part in (code_version(), request.endpoint, request.full_path,
+                         current_user.get_id() if current_user.is_authenticated else None,
+                         [session.get(name) for name in SESSION_KEYS],
+                         key() if key is not None else None,
+                         [version for version, _ in versions]):
+                digest.update(repr(part).encode('utf-8'))
+                digest.update(b'\0')
+            etag = digest.hexdigest()
+            modified = max((modified for _, modified in versions), default=0)
+            last_modified = datetime.fromtimestamp(int(modified), timezone.utc) if modified else None
+
+            # Answer from the validators alone if the client's copy is current
+            response = make_response('')
+            _set_validators(response, etag, last_modified)
+            if response.make_conditional(request).status_code == 304:
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not session.get('_flashes'):
+                _set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
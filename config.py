@@ -22,6 +22,44 @@ class Config:
     RATINGS_FILE = os.path.join(DATA_DIR, 'ratings.json')
     COMMENTS_FILE = os.path.join(DATA_DIR, 'comments.json')
     
+    # Results of synced offline votes and comments by idempotency key, kept
+    # for SYNC_KEY_TTL seconds so a resent batch is not applied twice
+    SYNC_KEYS_FILE = os.path.join(DATA_DIR, 'sync_keys.json')
+    SYNC_KEY_TTL = 7 * 24 * 3600
+    SYNC_BATCH_LIMIT = 200  # Maximum number of items per sync request
+    
+    # Storage backend: 'json' keeps every model in its JSON file above, 'sqlite'
+    # stores all models in SQLITE_DATABASE (import the JSON files first with
+    # tools/migrate_json_to_sqlite.py)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND') or 'json'
+    SQLITE_DATABASE = os.environ.get('SQLITE_DATABASE') or os.path.join(DATA_DIR, 'jfs2025.sqlite3')
+    
+    # Rating storage for the JSON backend: 'json' rewrites ratings.json on every
+    # vote, 'journal' appends each vote to RATINGS_JOURNAL_FILE and folds the
+    # journal into ratings.json once it holds RATINGS_JOURNAL_COMPACT_THRESHOLD
+    # records
+    RATINGS_STORAGE = os.environ.get('RATINGS_STORAGE') or 'json'
+    RATINGS_JOURNAL_FILE = os.path.join(DATA_DIR, 'ratings.journal')
+    RATINGS_JOURNAL_COMPACT_THRESHOLD = int(os.environ.get('RATINGS_JOURNAL_COMPACT_THRESHOLD') or 1000)
+    # Every vote is fsynced before the request returns; votes arriving while an
+    # fsync is pending share the next one. A window (in seconds) makes the
+    # syncing request wait for more votes first; 'off' leaves flushing to the OS
+    _fsync_window = os.environ.get('RATINGS_JOURNAL_FSYNC_WINDOW') or '0'
+    RATINGS_JOURNAL_FSYNC_WINDOW = None if _fsync_window == 'off' else float(_fsync_window)
+    
+    # Ratings and comments in JSON files are written by one writer thread per
+    # file that saves all changes queued meanwhile in one rewrite; the batch
+    # window (seconds) makes it wait for more changes first
+    WRITE_BATCH_WINDOW = float(os.environ.get('WRITE_BATCH_WINDOW') or 0)
+    WRITE_QUEUE_TIMEOUT = 30
+    
+    # Per-talk rating statistics, persisted so restarted workers can skip the rebuild
+    RATINGS_AGGREGATES_FILE = os.path.join(DATA_DIR, 'rating_aggregates.json')
+    
+    # Report the number of data loads per request in the X-Data-Loads header
+    # (always on in debug mode)
+    DEBUG_DATA_LOADS = os.environ.get('DEBUG_DATA_LOADS', '').lower() in ('1', 'true', 'yes')
+    
     # Logging configuration
     LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
     RATING_LOG_FILE = os.path.join(LOG_DIR, 'ratings.log')
@@ -33,6 +71,13 @@ class Config:
     
     # Application settings
     MAX_RATING = 5  # Maximum rating value (5 stars)
+    TALKS_PER_PAGE = 24  # Talks per page in the overview
+    USER_CACHE_SIZE = 1024  # Logged-in users kept in memory by the user loader
+    FRAGMENT_CACHE_SIZE = 2048  # Rendered talk cards and detail sections kept in memory
+    FRAGMENT_CACHE_CHARS = 8 * 1024 * 1024  # Upper bound for the total size of the cached fragments
+    RANKING_PRIOR_WEIGHT = None  # Virtual votes of the Bayesian average (None: average votes per talk)
+    BOOTSTRAP_SAMPLES = 1000  # Resamples per talk for the bootstrap confidence intervals
+    EVENTS_KEEPALIVE_INTERVAL = 15  # Seconds between keepalives on the admin live update stream
     BASE_DIR = os.path.abspath(os.path.dirname(__file__))
     
     @staticmethod
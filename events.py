@@ -0,0 +1,96 @@
+import json
+import queue
+import threading
+from collections import deque
+
+
+class Subscription:
+    """Queue of the events for one subscriber, see EventBroker.subscribe()."""
+
+    def __init__(self, max_size):
+        self.queue = queue.Queue(max_size)
+        # Set when the subscriber fell too far behind and missed events
+        self.lagging = False
+
+    def get(self, timeout=None):
+        """Get the next (event_id, event, data), raising queue.Empty after the timeout.
+
+        A subscriber that missed events gets a 'reload' event instead.
+        """
+        if self.lagging:
+            return None, 'reload', {}
+        return self.queue.get(timeout=timeout)
+
+
+class EventBroker:
+    """In-process publish/subscribe for live updates, e.g. Server-Sent Events.
+
+    Events get increasing IDs and the last ones are kept, so a client that
+    reconnects with the ID of the last event it saw receives what it
+    missed. Without subscribers events are not built or kept, only counted;
+    a client that missed those (or more than the kept ones) gets a 'reload'
+    event. Subscribers only see events of their own process.
+    """
+
+    def __init__(self, history_size=100, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._history = deque(maxlen=history_size)
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, event, data):
+        """Send an event to all subscribers.
+
+        ``data`` may be a function returning the data, which is only called
+        if anyone is subscribed.
+        """
+        if not self._subscribers:
+            with self._lock:
+                self._last_id += 1
+                self._history.clear()
+            return
+        if callable(data):
+            data = data()
+        with self._lock:
+            self._last_id += 1
+            entry = (self._last_id, event, data)
+            self._history.append(entry)
+            for subscription in self._subscribers:
+                try:
+                    subscription.queue.put_nowait(entry)
+                except queue.Full:
+                    subscription.lagging = True
+
+    def subscribe(self, last_event_id=None):
+        """Register a subscriber; with ``last_event_id`` missed events are replayed first."""
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            if last_event_id is not None and last_event_id < self._last_id:
+                missed = [entry for entry in self._history if entry[0] > last_event_id]
+                if not missed or missed[0][0] != last_event_id + 1 or len(missed) > self.queue_size:
+                    subscription.lagging = True
+                else:
+                    for entry in missed:
+                        subscription.queue.put_nowait(entry)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+
+def format_event(event_id, event, data):
+    """Format an event in the text/event-stream format."""
+    lines = [] if event_id is None else [f'id: {event_id}']
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+# Global event broker instance
+event_broker = EventBroker()
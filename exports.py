@@ -0,0 +1,235 @@
+import csv
+import json
+import operator
+import zipfile
+import zlib
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Parquet and Arrow exports are only offered with pyarrow installed
+    pyarrow = None
+
+from analytics import RatingAnalytics
+
+# Rows are collected into chunks of about this many bytes before they are sent
+CHUNK_SIZE = 64 * 1024
+
+# Score columns of the summary export; the bootstrap ranking is the lower
+# end of the confidence interval
+SCORE_COLUMNS = [('zscore', 'Z-Score'), ('bayesian', 'Bayesian Average'), ('wilson', 'Wilson Lower Bound')]
+
+
+def ranked_talk_ids(analytics, talks, rank):
+    """Order the talk IDs by a ranking mode, unrated talks last in catalog order."""
+    if rank not in RatingAnalytics.RANKING_MODES:
+        rank = 'average'
+    talk_ids = [talk_id for talk_id in analytics.ranking(rank) if talk_id in talks]
+    return talk_ids + [talk_id for talk_id in talks if talk_id not in analytics.talks]
+
+
+def summary_rows(analytics, talks, talk_ids):
+    """Yield the header and one row of statistics and scores per talk."""
+    scores = {mode: analytics.scores(mode) for mode, _ in SCORE_COLUMNS}
+    intervals = analytics.confidence_intervals()
+
+    yield (['Talk ID', 'Booking Number', 'Title', 'Topic', 'Average Rating', 'Number of Ratings',
+            'Median Rating', 'Standard Deviation']
+           + [f'{value} Stars' for value in range(1, analytics.max_rating + 1)]
+           + [label for _, label in SCORE_COLUMNS] + ['CI Lower', 'CI Upper'])
+
+    for talk_id in talk_ids:
+        talk = talks[talk_id]
+        stats = analytics.get(talk_id)
+        interval = intervals.get(talk_id)
+        yield ([
+            talk_id,
+            talk.get('bookingNumber', ''),
+            talk.get('title', ''),
+            talk.get('topicId', ''),
+            f"{stats['mean']:.2f}",
+            stats['count'],
+            f"{stats['median']:.1f}",
+            f"{stats['std']:.2f}"
+        ] + stats['histogram']
+            + [f"{scores[mode][talk_id]:.3f}" if talk_id in scores[mode] else '' for mode, _ in SCORE_COLUMNS]
+            + ([f"{interval[0]:.2f}", f"{interval[1]:.2f}"] if interval else ['', '']))
+
+
+def detailed_rows(matrix, analytics, talks, talk_ids, users):
+    """Yield the header and one row per talk with a column per user.
+
+    Each row is read as one column of the rating matrix; cells of users
+    without a rating for the talk stay empty.
+    """
+    yield (['Talk ID', 'Title', 'Average Rating', 'Number of Ratings']
+           + [users[user_id].get('name', user_id) for user_id in users])
+    rows = [matrix.user_rows.get(user_id) for user_id in users]
+    for talk_id in talk_ids:
+        stats = analytics.get(talk_id)
+        column = matrix.column(talk_id)
+        yield [talk_id, talks[talk_id].get('title', ''), f"{stats['mean']:.2f}", stats['count']] + [
+            (column[row] or '') if row is not None else '' for row in rows
+        ]
+
+
+class _Line:
+    """File-like target for csv.writer that hands back each written line."""
+
+    def write(self, line):
+        return line
+
+
+def stream_csv(rows, compress=False):
+    """Encode CSV rows as UTF-8 and yield them in chunks, optionally gzip-compressed.
+
+    Only one chunk is held at a time, so memory use does not grow with
+    the size of the export.
+    """
+    writer = csv.writer(_Line())
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    chunk, size = [], 0
+    for row in rows:
+        line = writer.writerow(row).encode('utf-8')
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            data = b''.join(chunk)
+            chunk, size = [], 0
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    data = b''.join(chunk)
+    if compressor is not None:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+# Talk fields in the columnar exports as (catalog field, column name)
+TALK_COLUMNS = [
+    ('bookingNumber', 'booking_number'),
+    ('title', 'title'),
+    ('topicId', 'topic_id'),
+    ('levelId', 'level_id'),
+    ('languageId', 'language_id')
+]
+
+# Columnar formats as (mimetype, file extension); parquet and arrow need pyarrow
+COLUMNAR_FORMATS = {
+    'npz': ('application/octet-stream', 'npz'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow')
+}
+
+
+def rating_rows(matrix, talk_ids, user_ids):
+    """Yield each user's ratings as bytes with one byte per talk in ``talk_ids``.
+
+    Talks and users the matrix does not know yet get zeros (unrated). The
+    columns are looked up once; columns only ever get appended, so talks
+    added to the matrix while the rows are streamed do not shift them.
+    """
+    columns = [matrix.talk_columns.get(talk_id) for talk_id in talk_ids]
+    known = [column for column in columns if column is not None]
+    if len(known) == 1:
+        getter = lambda row: (row[known[0]],)
+    elif known:
+        getter = operator.itemgetter(*known)
+    if not known:
+        gather = lambda row: bytes(len(columns))
+    elif len(known) == len(columns):
+        gather = lambda row: bytes(getter(row))
+    else:
+        # Unknown talks get an explicit 0 instead of a column of the matrix
+        def gather(row):
+            values = iter(getter(row))
+            return bytes(next(values) if column is not None else 0 for column in columns)
+    for user_id in user_ids:
+        if user_id in matrix.user_rows:
+            yield gather(matrix.row(user_id))
+        else:
+            yield bytes(len(columns))
+
+
+def _npy_header(descr, shape):
+    """Build a version 1.0 .npy header for a C-ordered array."""
+    header = repr({'descr': descr, 'fortran_order': False, 'shape': tuple(shape)}).encode('latin1')
+    # Magic, version and length take 10 bytes; the data starts 64-byte aligned
+    padding = -(10 + len(header) + 1) % 64
+    header += b' ' * padding + b'\n'
+    return b'\x93NUMPY\x01\x00' + len(header).to_bytes(2, 'little') + header
+
+
+def _write_npy(archive, name, descr, shape, chunks):
+    with archive.open(f'{name}.npy', 'w', force_zip64=True) as f:
+        f.write(_npy_header(descr, shape))
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def _write_strings(archive, name, values):
+    """Store strings as a fixed-width unicode array, like numpy.array(values) would."""
+    values = [str(value) if value is not None else '' for value in values]
+    width = max([len(value) for value in values] + [1])
+    _write_npy(archive, name, f'<U{width}', (len(values),),
+               (value.ljust(width, '\0').encode('utf-32-le') for value in values))
+
+
+def write_npz(fileobj, matrix, talks, talk_ids, users):
+    """Write the ratings and their labels as a NumPy .npz archive.
+
+    ``ratings`` is a users x talks uint8 array (0 = unrated) in the order of
+    ``user_ids`` and ``talk_ids``; the other arrays hold the user names and
+    the talk metadata (see TALK_COLUMNS). The .npy files are written
+    directly from the matrix rows, so NumPy is only needed to read them.
+    """
+    user_ids = list(users)
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as archive:
+        _write_npy(archive, 'ratings', '|u1', (len(user_ids), len(talk_ids)),
+                   rating_rows(matrix, talk_ids, user_ids))
+        _write_strings(archive, 'user_ids', user_ids)
+        _write_strings(archive, 'user_names', (users[user_id].get('name', '') for user_id in user_ids))
+        _write_strings(archive, 'talk_ids', talk_ids)
+        for field, column in TALK_COLUMNS:
+            _write_strings(archive, column, (talks[talk_id].get(field) for talk_id in talk_ids))
+
+
+def ratings_table(matrix, talks, talk_ids, users):
+    """Build a pyarrow Table with one row per talk and one uint8 column per user.
+
+    Columns are the talk ID, the talk metadata (see TALK_COLUMNS) and the
+    ratings of each user under the user's ID (null = unrated); the user
+    names are in the schema metadata as JSON.
+    """
+    if pyarrow is None:
+        raise RuntimeError("pyarrow is not installed")
+    columns = {'talk_id': pyarrow.array(talk_ids, type=pyarrow.string())}
+    for field, column in TALK_COLUMNS:
+        columns[column] = pyarrow.array([_text(talks[talk_id].get(field)) for talk_id in talk_ids],
+                                        type=pyarrow.string())
+    for user_id, row in zip(users, rating_rows(matrix, talk_ids, list(users))):
+        columns[user_id] = pyarrow.array([rating or None for rating in row], type=pyarrow.uint8())
+    names = {user_id: user.get('name', '') for user_id, user in users.items()}
+    return pyarrow.table(columns, metadata={'user_names': json.dumps(names, ensure_ascii=False)})
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def write_columnar(fileobj, export_format, matrix, talks, talk_ids, users):
+    """Write the ratings in one of COLUMNAR_FORMATS to a binary file object."""
+    if export_format == 'npz':
+        write_npz(fileobj, matrix, talks, talk_ids, users)
+        return
+    table = ratings_table(matrix, talks, talk_ids, users)
+    if export_format == 'parquet':
+        pyarrow.parquet.write_table(table, fileobj)
+    elif export_format == 'arrow':
+        with pyarrow.ipc.new_file(fileobj, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f"Unknown export format: {export_format}")
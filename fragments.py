@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+
+from flask import current_app, render_template
+from markupsafe import Markup, escape
+
+# Marks where a per-user slot is spliced into a cached fragment
+SLOT_MARKER = '<!--slot:{}-->'
+
+
+class FragmentCache:
+    """Bounded LRU cache of rendered template fragments.
+
+    Each fragment is kept with the version of the data it was rendered from
+    and is only returned while that version is still current, so there is
+    at most one version of a fragment in memory. The least recently used
+    fragments are dropped when there are more than ``max_entries`` or their
+    text exceeds ``max_chars`` characters in total.
+    """
+
+    def __init__(self, max_entries=2048, max_chars=8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.chars = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """Return the cached fragment, or None if it is missing or outdated."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, fragment):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.chars -= len(old[1])
+            self._entries[key] = (version, fragment)
+            self.chars += len(fragment)
+            while self._entries and (len(self._entries) > self.max_entries or self.chars > self.max_chars):
+                self.chars -= len(self._entries.popitem(last=False)[1][1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.chars = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'chars': self.chars,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+# Fragments of all templates, shared by all requests of the process
+fragment_cache = FragmentCache()
+
+
+def render_fragment(template_name, key, version, slots=None, **context):
+    """Render a partial template through the fragment cache.
+
+    ``key`` identifies the fragment within the template (e.g. the talk ID)
+    and ``version`` the data it shows (see JSONStorageModel.data_version);
+    the partial gets only ``context``, so it must not depend on the user.
+    Per-user parts are given as ``slots`` and replace the slot() markers of
+    the cached fragment.
+    """
+    fragment_cache.max_entries = current_app.config.get('FRAGMENT_CACHE_SIZE', 2048)
+    fragment_cache.max_chars = current_app.config.get('FRAGMENT_CACHE_CHARS', 8 * 1024 * 1024)
+    cache_key = (template_name, key)
+    fragment = fragment_cache.get(cache_key, version)
+    if fragment is None:
+        fragment = render_template(template_name, **context)
+        fragment_cache.put(cache_key, version, fragment)
+    for name, value in (slots or {}).items():
+        fragment = fragment.replace(SLOT_MARKER.format(name), escape(value))
+    return Markup(fragment)
+
+
+def slot(name):
+    """Marker in a partial template for a per-user part (see render_fragment)."""
+    return Markup(SLOT_MARKER.format(name))
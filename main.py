@@ -1,12 +1,16 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session, jsonify
 from flask_login import current_user, login_required
+import functools
 import json
 import logging
+import os
 import time
 from datetime import datetime
 
-from models import Talk, Speaker, User, Rating, Comment
+from models import Talk, TalkQuery, Speaker, User, Rating, Comment, SyncLog
 from utils import setup_logging, recover_ratings_from_log
+from conditional import conditional, static_version
+from fragments import render_fragment, slot
 
 # Create blueprint
 main = Blueprint('main', __name__)
@@ -17,70 +21,106 @@ def _jinja2_filter_strftime(timestamp, format='%Y-%m-%d %H:%M:%S'):
     """Convert a Unix timestamp to a formatted date string."""
     return datetime.fromtimestamp(timestamp).strftime(format)
 
+# Cached partial templates (see fragments.py)
+main.add_app_template_global(render_fragment, 'fragment')
+main.add_app_template_global(slot)
+
+# Overview filters: request argument and the session key remembering it
+FILTER_SESSION_KEYS = (('topic', 'topic_filter'), ('keyword', 'keyword_filter'),
+                       ('rated', 'rated_filter'), ('sort', 'sort_order'))
+
+def read_filters():
+    """Get the overview filters from the request, falling back to those stored in the session."""
+    return {name: request.args.get(name, session.get(session_key, '')) for name, session_key in FILTER_SESSION_KEYS}
+
+def remember_filters(view):
+    """Store the overview filters of the request in the session before the view.
+    
+    Applied outside @conditional, so the filters are also remembered when
+    the response is 304 Not Modified and the view does not run.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_user.is_authenticated:
+            for name, session_key in FILTER_SESSION_KEYS:
+                session[session_key] = request.args.get(name, session.get(session_key, ''))
+        return view(*args, **kwargs)
+    return wrapper
+
 @main.route('/')
+@remember_filters
+@conditional(Talk, Speaker, Rating, User, key=lambda: current_user.is_authenticated and read_filters())
 def index():
     """Home page route."""
     if not current_user.is_authenticated:
         return redirect(url_for('auth.login'))
     
-    # Load talks data
-    talks = Talk.get_all()
+    # Version of the talk cards, taken before the talks are read
+    fragment_version = Talk.data_version()[0]
     
-    # Load user's ratings if authenticated
-    user_ratings = {}
-    if current_user.is_authenticated:
-        user_ratings = Rating.get_for_user(current_user.id)
+    # Load user's ratings
+    user_ratings = Rating.get_for_user(current_user.id)
     
     # Get all unique topics from talks
     topics = Talk.get_all_topics()
     
-    # Count talks per topic
-    topic_counts = Talk.count_by_topic()
-    
-    # Get filter parameters from request or session
-    topic_filter = request.args.get('topic', session.get('topic_filter', ''))
-    keyword_filter = request.args.get('keyword', session.get('keyword_filter', ''))
-    rated_filter = request.args.get('rated', session.get('rated_filter', ''))  # New filter
-    
-    # Store filters in session
-    session['topic_filter'] = topic_filter
-    session['keyword_filter'] = keyword_filter
-    session['rated_filter'] = rated_filter  # Store new filter
-    
-    # Filter talks based on parameters
-    filtered_talks = talks
-    if rated_filter == 'yes' and current_user.is_authenticated:
-        filtered_talks = Talk.get_rated_by_user(current_user.id)
-    elif rated_filter == 'no' and current_user.is_authenticated:
-        filtered_talks = {k: v for k, v in talks.items() if k not in user_ratings}
-    
-    if topic_filter:
-        filtered_talks = {k: v for k, v in filtered_talks.items() if v.get('topicId') == topic_filter}
-    
-    if keyword_filter:
-        filtered_talks = Talk.search(keyword_filter)
-        if topic_filter:
-            filtered_talks = {k: v for k, v in filtered_talks.items() if v.get('topicId') == topic_filter}
-        if rated_filter == 'yes' and current_user.is_authenticated:
-            filtered_talks = {k: v for k, v in filtered_talks.items() if k in user_ratings}
-        elif rated_filter == 'no' and current_user.is_authenticated:
-            filtered_talks = {k: v for k, v in filtered_talks.items() if k not in user_ratings}
+    # Get filter parameters from request or session (see remember_filters)
+    filters = read_filters()
+    page = request.args.get('page', 1, type=int)
+    
+    # Filter, count topics, sort and paginate in one pass
+    query = TalkQuery(topic=filters['topic'],
+                      keyword=filters['keyword'],
+                      rated=filters['rated'],
+                      sort=filters['sort'],
+                      page=page,
+                      per_page=current_app.config.get('TALKS_PER_PAGE', 24))
+    result = query.run(user_ratings)
     
     return render_template('index.html', 
-                        talks=filtered_talks, 
+                        talks=result.talks, 
                         user_ratings=user_ratings,
                         topics=topics,
-                        topic_counts=topic_counts,
-                        total_talks=len(talks),
-                        filtered_count=len(filtered_talks),
+                        topic_counts=result.topic_counts,
+                        total_talks=len(Talk.get_all()),
+                        filtered_count=result.total,
+                        page=result.page,
+                        pages=result.pages,
+                        per_page=result.per_page,
+                        sort_options=TalkQuery.SORT_OPTIONS,
                         current_topic=session['topic_filter'],
                         current_keyword=session['keyword_filter'],
-                        current_rated=session['rated_filter'])  # Pass new filter state
+                        current_rated=session['rated_filter'],
+                        current_sort=query.sort,
+                        fragment_version=fragment_version)
+
+@main.route('/catalog.json')
+@login_required
+def catalog():
+    """Talk catalog and search index for filtering in the browser.
+    
+    Clients revalidate with the ETag and only download the catalog again
+    when talks or speakers changed; ``abstracts=1`` includes the abstracts.
+    """
+    body, etag = Talk.get_catalog(abstracts=request.args.get('abstracts') == '1')
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 @main.route('/talk/<talk_id>')
 @login_required
+@conditional(Talk, Speaker, Rating, Comment, User)
 def talk_detail(talk_id):
     """Talk detail page route."""
+    # Versions of the cached sections, taken before the data is read
+    talk_version = Talk.data_version()[0]
+    fragment_versions = {
+        'talk': talk_version,
+        'speakers': (talk_version, Speaker.data_version()[0]),
+        'comments': Comment.data_version()[0]
+    }
+    
     # Get talk data
     talk = Talk.get_by_id(talk_id)
     if not talk:
@@ -113,11 +153,12 @@ def talk_detail(talk_id):
     # Get all ratings for this talk with user info
     all_ratings = []
     ratings_data = Rating.get_for_talk(talk_id)
+    user_names = User.get_names(ratings_data)
     for user_id, rating in ratings_data.items():
-        user = User.get_by_id(user_id)
         all_ratings.append({
-            'user_name': user.name if user else 'Unknown',
-            'rating': rating
+            'user_name': user_names[user_id],
+            'rating': rating,
+            'own': user_id == current_user.id
         })
     
     return render_template('talk_detail.html', 
@@ -128,22 +169,68 @@ def talk_detail(talk_id):
                         user_rating=user_rating,
                         max_rating=current_app.config['MAX_RATING'],
                         comments=comments,
-                        all_ratings=all_ratings)
+                        all_ratings=all_ratings,
+                        fragment_versions=fragment_versions)
+
+def wants_json():
+    """Check whether the client asked for a JSON response instead of a redirect."""
+    return request.is_json or request.accept_mimetypes.best == 'application/json'
+
+def get_field(name, type=None):
+    """Get a submitted field from the JSON body or the form.
+    
+    JSON values are not converted: a value that is not already of ``type``
+    counts as missing, so e.g. ``true`` or ``4.7`` is no valid rating.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        value = data.get(name)
+        # bool is a subclass of int, but JSON true is no number
+        if type is not None and (not isinstance(value, type) or (isinstance(value, bool) and type is not bool)):
+            value = None
+        return value
+    return request.form.get(name, type=type)
 
 @main.route('/rate/<talk_id>', methods=['POST'])
 @login_required
 def rate_talk(talk_id):
-    """Rate a talk."""
-    rating = request.form.get('rating', type=int)
+    """Rate a talk.
+    
+    JSON requests get the new state of the talk's ratings instead of a
+    redirect to the detail page; with ``include_ratings`` it also lists all
+    ratings, for the first vote of the user.
+    """
+    rating = get_field('rating', type=int)
     
     # Validate rating
     if not rating or rating < 1 or rating > current_app.config['MAX_RATING']:
-        flash(f'Ungültige Bewertung. Bitte wählen Sie 1-{current_app.config["MAX_RATING"]} Sterne.', 'danger')
+        message = f'Ungültige Bewertung. Bitte wählen Sie 1-{current_app.config["MAX_RATING"]} Sterne.'
+        if wants_json():
+            return jsonify(success=False, message=message), 400
+        flash(message, 'danger')
         return redirect(url_for('main.talk_detail', talk_id=talk_id))
     
     # Set the rating
     success, message = Rating.set_rating(current_user.id, talk_id, rating)
     
+    if wants_json():
+        if not success:
+            return jsonify(success=False, message=message), 500
+        ratings_data = Rating.get_for_talk(talk_id)
+        result = {
+            'success': True,
+            'message': 'Bewertung erfolgreich gespeichert!',
+            'talk_id': talk_id,
+            'rating': rating,
+            'count': len(ratings_data),
+            'average': sum(ratings_data.values()) / len(ratings_data) if ratings_data else 0
+        }
+        if get_field('include_ratings'):
+            user_names = User.get_names(ratings_data)
+            result['ratings'] = [{'user_name': user_names[user_id], 'rating': value, 'own': user_id == current_user.id}
+                                 for user_id, value in ratings_data.items()]
+        return jsonify(result)
+    
     if success:
         flash(f'Bewertung erfolgreich gespeichert!', 'success')
     else:
@@ -154,12 +241,21 @@ def rate_talk(talk_id):
 @main.route('/comment/<talk_id>', methods=['POST'])
 @login_required
 def add_comment(talk_id):
-    """Add a comment to a talk."""
-    comment_text = request.form.get('comment', '')
+    """Add a comment to a talk; JSON requests get the created comment back."""
+    comment_text = get_field('comment', type=str) or ''
     
     # Add the comment
     success, message = Comment.add_comment(talk_id, current_user.id, current_user.name, comment_text)
     
+    if wants_json():
+        if not success:
+            return jsonify(success=False, message=message), 400
+        return jsonify(success=True,
+                       message='Kommentar erfolgreich hinzugefügt!',
+                       talk_id=talk_id,
+                       comment={'user_name': current_user.name, 'text': comment_text},
+                       count=len(Comment.get_for_talk(talk_id)))
+    
     if success:
         flash('Kommentar erfolgreich hinzugefügt!', 'success')
     else:
@@ -167,6 +263,90 @@ def add_comment(talk_id):
         
     return redirect(url_for('main.talk_detail', talk_id=talk_id))
 
+@main.route('/sync', methods=['POST'])
+@login_required
+def sync():
+    """Apply ratings and comments queued by the client while offline.
+    
+    Expects ``{"items": [{"key": ..., "type": "rating"|"comment", "talk_id":
+    ..., "rating"|"comment": ...}]}``. All ratings and all comments are saved
+    with one storage commit each. Each item needs a unique key; items whose
+    key was already synced are not applied again but get their recorded
+    result with ``duplicate`` set, so a batch can safely be resent.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list):
+        return jsonify(success=False, message='Ungültige Anfrage.'), 400
+    if len(items) > current_app.config.get('SYNC_BATCH_LIMIT', 200):
+        return jsonify(success=False, message='Zu viele Einträge in einer Anfrage.'), 413
+    
+    keys = [item.get('key') if isinstance(item, dict) else None for item in items]
+    recorded = SyncLog.get_results(current_user.id, [key for key in keys if isinstance(key, str)])
+    results = [None] * len(items)
+    first = {}
+    votes, comments = [], []
+    for i, (item, key) in enumerate(zip(items, keys)):
+        if not isinstance(key, str) or not key or len(key) > 100:
+            results[i] = {'key': key, 'success': False, 'message': 'Ungültiger Schlüssel.'}
+        elif key in recorded:
+            results[i] = dict(recorded[key], key=key, duplicate=True)
+        elif key in first:
+            # Sent twice in the same batch, answered after the first is applied
+            continue
+        elif (isinstance(item.get('talk_id'), bool) or not isinstance(item.get('talk_id'), (str, int))
+              or Talk.get_by_id(str(item['talk_id'])) is None):
+            results[i] = {'key': key, 'success': False, 'message': 'Vortrag nicht gefunden.'}
+        elif item.get('type') == 'rating':
+            first[key] = i
+            votes.append((i, str(item['talk_id']), item.get('rating')))
+        elif item.get('type') == 'comment' and isinstance(item.get('comment'), str):
+            first[key] = i
+            comments.append((i, str(item['talk_id']), item['comment']))
+        else:
+            results[i] = {'key': key, 'success': False, 'message': 'Ungültiger Eintrag.'}
+    
+    applied = {}
+    if votes:
+        saved = Rating.set_ratings(current_user.id, [(talk_id, rating) for _, talk_id, rating in votes])
+        for (i, _, _), (success, message) in zip(votes, saved):
+            results[i] = {'key': keys[i], 'success': success,
+                          'message': 'Bewertung erfolgreich gespeichert!' if success else message}
+    if comments:
+        saved = Comment.add_comments(current_user.id, current_user.name,
+                                     [(talk_id, text) for _, talk_id, text in comments])
+        for (i, _, _), (success, message) in zip(comments, saved):
+            results[i] = {'key': keys[i], 'success': success,
+                          'message': 'Kommentar erfolgreich hinzugefügt!' if success else message}
+    for key, i in first.items():
+        # Only applied items are recorded, failed ones may be sent again
+        if results[i]['success']:
+            applied[key] = {'success': True, 'message': results[i]['message']}
+    for i, key in enumerate(keys):
+        if results[i] is None:
+            results[i] = dict(results[first[key]], duplicate=True)
+    
+    if applied:
+        try:
+            SyncLog.record(current_user.id, applied)
+        except Exception as e:
+            logging.error(f"Error recording synced items: {str(e)}")
+    
+    return jsonify(success=True, results=[dict({'duplicate': False}, **result) for result in results])
+
+@main.route('/sw.js')
+def service_worker():
+    """Serve the service worker from the root, so it controls all pages.
+    
+    The version of the static files is filled in as its cache version, so an
+    update installs a new worker that drops the outdated cached assets.
+    """
+    with open(os.path.join(current_app.static_folder, 'js', 'sw.js'), encoding='utf-8') as f:
+        script = f.read().replace('__STATIC_VERSION__', static_version())
+    response = current_app.response_class(script, mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @main.route('/recover-ratings', methods=['POST'])
 @login_required
 def recover_ratings():
@@ -1,51 +1,245 @@
 import json
 import os
 import time
+import hmac
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from flask import current_app
+from flask import current_app, g, request, has_request_context
 from flask_login import UserMixin
+from jinja2.filters import do_truncate
+from markupsafe import Markup
+
+from storage import file_cache, clone_json, write_json, get_journal, get_write_queue, file_signature
+from sqlite_storage import get_storage
+from search import get_search_index
+from rating_matrix import RatingMatrix
+from analytics import get_analytics
+from events import event_broker
+
+class RequestSnapshot:
+    """The data read during one request, kept on flask.g.
+    
+    Models read each of their files at most once per request through
+    JSONStorageModel.load_shared(), so all views of a page see the same
+    version of the data. ``loads`` counts the reads from storage.
+    """
+    
+    def __init__(self, current_request):
+        self.request = current_request
+        self.entries = {}
+        self.loads = 0
+    
+    @classmethod
+    def current(cls):
+        """Get the snapshot of the current request, or None outside of requests."""
+        if not has_request_context():
+            return None
+        # g outlives the request if the app context was pushed before it
+        current = request._get_current_object()
+        snapshot = g.get('data_snapshot')
+        if snapshot is None or snapshot.request is not current:
+            snapshot = g.data_snapshot = cls(current)
+        return snapshot
+    
+    @classmethod
+    def count_load(cls):
+        """Count a read from storage that bypasses the snapshot."""
+        snapshot = cls.current()
+        if snapshot is not None:
+            snapshot.loads += 1
+
 
 class JSONStorageModel:
     """Base class for models that are stored in JSON files."""
     
+    # Table holding the model's data when the SQLite backend is enabled
+    storage_table = None
+    
     @classmethod
     def get_file_path(cls):
         """Get the file path for the model's JSON storage."""
         raise NotImplementedError("Subclasses must implement get_file_path")
     
     @classmethod
-    def load_all(cls):
-        """Load all items from the JSON file."""
+    def get_backend(cls):
+        """Get the SQLite storage if it is enabled, or None for JSON files."""
+        if cls.storage_table is None or current_app.config.get('STORAGE_BACKEND', 'json') != 'sqlite':
+            return None
+        return get_storage(current_app.config['SQLITE_DATABASE'])
+    
+    @classmethod
+    def _read_shared(cls, builders):
+        """Read the current data and the derived structures ``builders`` from storage.
+        
+        JSON data comes from the process-wide file cache and is shared, so it
+        must not be modified.
+        """
+        backend = cls.get_backend()
+        if backend is not None:
+            data = backend.load(cls.storage_table)
+            return data, {name: build(data) for name, build in builders.items()}
+        
+        data, derived = file_cache.load_derived(cls.get_file_path(), builders)
+        return (data if data is not None else {}), derived
+    
+    @classmethod
+    def data_version(cls):
+        """Get (version, last modified timestamp) of the stored data.
+        
+        The version changes with every write: it is the table's generation
+        counter with the SQLite backend, otherwise the signature of the files
+        (see get_version_paths).
+        """
+        backend = cls.get_backend()
+        if backend is not None:
+            version, modified = backend.data_version(cls.storage_table)
+            return f'{cls.storage_table}-{version}', modified
+        
+        signatures = [file_signature(path) for path in cls.get_version_paths()]
+        version = '-'.join('.'.join(map(str, signature)) if signature else '0' for signature in signatures)
+        modified = max((signature[0] / 1e9 for signature in signatures if signature), default=0.0)
+        return version, modified
+    
+    @classmethod
+    def get_version_paths(cls):
+        """Get the files whose changes make a new version of the data."""
+        return [cls.get_file_path()]
+    
+    @classmethod
+    def load_shared(cls, builders=None):
+        """Load the data and derived structures for read-only use.
+        
+        Within a request the data is read at most once and all callers get
+        the same version of it, with derived structures built for exactly
+        that version (see RequestSnapshot).
+        """
+        builders = builders or {}
+        snapshot = RequestSnapshot.current()
+        if snapshot is None:
+            return cls._read_shared(builders)
+        
+        key = cls.__name__
+        entry = snapshot.entries.get(key)
+        if entry is None:
+            data, derived = cls._read_shared(builders)
+            snapshot.loads += 1
+            entry = snapshot.entries[key] = (data, dict(derived))
+        else:
+            missing = {name: build for name, build in builders.items() if name not in entry[1]}
+            if missing:
+                data, derived = cls._read_shared(missing)
+                if data is not entry[0]:
+                    # The data changed since the snapshot was taken; build for the snapshot
+                    derived = {name: build(entry[0]) for name, build in missing.items()}
+                entry[1].update(derived)
+        return entry[0], {name: entry[1][name] for name in builders}
+    
+    @classmethod
+    def discard_snapshot(cls):
+        """Drop the model's data from the request snapshot after a change."""
+        snapshot = RequestSnapshot.current()
+        if snapshot is not None:
+            snapshot.entries.pop(cls.__name__, None)
+    
+    @classmethod
+    def load_all(cls, copy=True):
+        """Load all items from the JSON file.
+        
+        Parsed data is shared through the process-wide file cache. With
+        copy=False the request snapshot is returned and must not be
+        modified; callers that change the data need the default copy, which
+        is always read from the current data.
+        """
         try:
-            file_path = cls.get_file_path()
-            if not os.path.exists(file_path):
-                return {}
+            if not copy:
+                return cls.load_shared()[0]
             
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                return json.load(f)
+            data = cls._read_shared({})[0]
+            RequestSnapshot.count_load()
+            return data if cls.get_backend() is not None else clone_json(data)
         except Exception as e:
-            logging.error(f"Error loading data from {file_path}: {str(e)}")
+            logging.error(f"Error loading data for {cls.__name__}: {str(e)}")
             return {}
     
     @classmethod
-    def save_all(cls, data):
-        """Save all items to the JSON file."""
+    def save_all(cls, data, derived=None):
+        """Save all items to the JSON file, replacing its content.
+        
+        Written by the model's single writer like any other change (see
+        apply_write), so it is not interleaved with writes of other threads
+        or processes. The saved data becomes the cached copy of the file, so
+        it must not be modified afterwards. ``derived`` passes on cached
+        structures that match ``data`` (see FileCache.store); others are
+        built again on their next use.
+        """
+        cls.discard_snapshot()
         try:
-            file_path = cls.get_file_path()
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            backend = cls.get_backend()
+            if backend is not None:
+                backend.save(cls.storage_table, data)
+                return True
+            
+            def mutate(current, current_derived):
+                current.clear()
+                current.update(data)
+                # Structures derived from the replaced content no longer apply
+                current_derived.clear()
+                current_derived.update(derived or {})
+                return None, None
             
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
+            cls.apply_write(mutate)
             return True
         except Exception as e:
-            logging.error(f"Error saving data to {file_path}: {str(e)}")
+            logging.error(f"Error saving data for {cls.__name__}: {str(e)}")
             return False
+    
+    @classmethod
+    def get_write_queue(cls):
+        """Get the single writer of the model's JSON file (see WriteQueue)."""
+        app = current_app._get_current_object()
+        return get_write_queue(cls.get_file_path(),
+                               app.config.get('WRITE_BATCH_WINDOW', 0.0),
+                               app.app_context,
+                               cls._after_flush)
+    
+    @classmethod
+    def _after_flush(cls, data, derived):
+        """Called by the writer after each written batch (see WriteQueue)."""
+    
+    @classmethod
+    def apply_write(cls, mutate, builders=None):
+        """Apply a mutation through the write queue and return its result.
+        
+        Concurrent writes are batched into one file rewrite; exceptions
+        raised by the mutation or the write are raised here.
+        """
+        future = cls.get_write_queue().submit(mutate, builders)
+        try:
+            return future.result(timeout=current_app.config.get('WRITE_QUEUE_TIMEOUT', 30))
+        finally:
+            cls.discard_snapshot()
+    
+    @classmethod
+    def cache_stats(cls):
+        """Get hit/miss counters of the shared file cache."""
+        return file_cache.stats()
 
 
 class Talk(JSONStorageModel):
     """Model for conference talks."""
     
+    storage_table = 'talks'
+    
+    # Fields of the talks in the JSON catalog, see get_catalog()
+    CATALOG_FIELDS = ('title', 'subTitle', 'topicId', 'languageId', 'levelId', 'bookingNumber')
+    
+    # (data version, body, etag) of the last built catalog per variant
+    _catalogs = {}
+    _catalog_lock = threading.Lock()
+    
     @classmethod
     def get_file_path(cls):
         return current_app.config['TALKS_FILE']
@@ -53,81 +247,219 @@ class Talk(JSONStorageModel):
     @classmethod
     def get_by_id(cls, talk_id):
         """Get a talk by ID."""
-        talks = cls.load_all()
+        backend = cls.get_backend()
+        if backend is not None:
+            return backend.get_item('talks', talk_id)
+        
+        talks = cls.load_all(copy=False)
         return talks.get(str(talk_id))
     
     @classmethod
     def get_all(cls):
         """Get all talks."""
-        return cls.load_all()
+        return cls.load_all(copy=False)
     
     @classmethod
     def get_by_topic(cls, topic_id):
         """Get all talks for a specific topic."""
-        talks = cls.load_all()
+        backend = cls.get_backend()
+        if backend is not None:
+            return backend.talks_by_topic(topic_id)
+        
+        talks = cls.load_all(copy=False)
         return {k: v for k, v in talks.items() if v.get('topicId') == topic_id}
     
+    @classmethod
+    def get_search_index(cls):
+        """Get the full-text search index, built once per version of the talks and speakers."""
+        return get_search_index(cls.get_all, Speaker.get_all, version=cls._search_version())
+    
+    @classmethod
+    def _search_version(cls):
+        """Identify the talks and speakers data the search index is built from."""
+        return cls.data_version()[0], Speaker.data_version()[0]
+    
+    @classmethod
+    def search_ranked(cls, keyword=None, abstract=None):
+        """Search talks and return (talk_id, score) pairs, best match first.
+        
+        Returns None if neither a keyword nor an abstract text is given.
+        """
+        index = cls.get_search_index()
+        results = index.search(keyword) if keyword else None
+        
+        if abstract:
+            abstract_matches = dict(index.search(abstract, fields=('abstract',)))
+            if results is None:
+                results = list(abstract_matches.items())
+            else:
+                results = [(talk_id, score + abstract_matches[talk_id])
+                           for talk_id, score in results if talk_id in abstract_matches]
+                results.sort(key=lambda item: -item[1])
+        return results
+    
     @classmethod
     def search(cls, keyword=None, abstract=None):
-        """Search talks by keyword in title/abstract/keywords and/or abstract text."""
-        talks = cls.load_all()
+        """Search talks by keyword in title/subtitle/abstract/keywords/speakers and/or abstract text.
         
-        # Prepare search terms
-        keyword = keyword.lower() if keyword else None
-        abstract = abstract.lower() if abstract else None
+        All words of a query have to match, as a whole word or a word prefix.
+        The result is ordered by relevance, best match first.
+        """
+        talks = cls.get_all()
+        results = cls.search_ranked(keyword, abstract)
+        if results is None:
+            return dict(talks)
+        # The index may already be built from a newer version than this request's talks
+        return {talk_id: talks[talk_id] for talk_id, _ in results if talk_id in talks}
+    
+    @classmethod
+    def get_catalog(cls, abstracts=False):
+        """Get the talk catalog for filtering in the browser as (JSON body, ETag).
         
-        filtered = {}
-        for talk_id, talk in talks.items():
-            matches = True
-            
-            # Keyword search (title, abstract or keywords)
-            if keyword:
-                matches = (keyword in talk.get('title', '').lower() or 
-                         keyword in talk.get('abstract', '').lower() or 
-                         keyword in talk.get('keywords', '').lower())
-            
-            # Additional abstract search if keyword matched or no keyword search
-            if matches and abstract:
-                matches = abstract in talk.get('abstract', '').lower()
-            
-            if matches:
-                filtered[talk_id] = talk
+        The catalog holds a compact projection of every talk with a short
+        teaser instead of the abstract (unless ``abstracts`` is set), the
+        topics, the maximum rating for the stars and the exported search
+        index. It is built once per version
+        of the talks and speakers, like the search index, and the ETag is a
+        hash of the body.
+        """
+        version = cls._search_version()
+        with cls._catalog_lock:
+            cached = cls._catalogs.get(abstracts)
+            if cached is not None and cached[0] == version:
+                return cached[1], cached[2]
         
-        return filtered
+        index = cls.get_search_index()
+        talk_ids = list(index.talks)
+        projection = []
+        for talk_id in talk_ids:
+            talk = index.talks[talk_id]
+            item = {'id': talk_id}
+            item.update((field, talk[field]) for field in cls.CATALOG_FIELDS if talk.get(field))
+            text = Markup(talk.get('abstract') or '').striptags()
+            if abstracts:
+                item['abstract'] = text
+            else:
+                item['teaser'] = do_truncate(current_app.jinja_env, text, 100)
+            projection.append(item)
+        catalog = {
+            'talks': projection,
+            'topics': sorted(cls._count_topics(index.talks)),
+            'max_rating': current_app.config['MAX_RATING'],
+            'index': index.export(talk_ids)
+        }
+        body = json.dumps(catalog, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        etag = hashlib.sha1(body).hexdigest()
+        with cls._catalog_lock:
+            cls._catalogs[abstracts] = (version, body, etag)
+        return body, etag
+    
+    @staticmethod
+    def _count_topics(talks):
+        """Count talks per topic in one pass over the talks."""
+        counts = {}
+        for talk in talks.values():
+            topic = talk.get('topicId')
+            if topic:
+                counts[topic] = counts.get(topic, 0) + 1
+        return counts
     
     @classmethod
     def get_all_topics(cls):
         """Get all unique topics from talks."""
-        talks = cls.load_all()
-        topics = set()
-        for talk in talks.values():
-            if 'topicId' in talk and talk['topicId']:
-                topics.add(talk['topicId'])
-        return sorted(topics)
+        return sorted(cls.load_shared({'topic_counts': cls._count_topics})[1]['topic_counts'])
     
     @classmethod
     def count_by_topic(cls):
         """Count talks per topic."""
-        talks = cls.load_all()
-        topics = cls.get_all_topics()
-        
-        counts = {}
-        for topic in topics:
-            counts[topic] = sum(1 for talk in talks.values() if talk.get('topicId') == topic)
-        
-        return counts
+        counts = cls.load_shared({'topic_counts': cls._count_topics})[1]['topic_counts']
+        return {topic: counts[topic] for topic in sorted(counts)}
 
     @classmethod
     def get_rated_by_user(cls, user_id):
         """Get all talks rated by a specific user."""
-        talks = cls.load_all()
+        talks = cls.load_all(copy=False)
         ratings = Rating.get_for_user(user_id)
         return {talk_id: talk for talk_id, talk in talks.items() if talk_id in ratings}
 
 
+class TalkQuery:
+    """Filter, facet, sort and paginate the talk overview.
+    
+    All filters are applied in a single pass over the catalog (or over the
+    search results when a keyword is given). The topic facet counts are
+    taken in the same pass and reflect every filter except the topic itself,
+    so they tell how many talks a topic selection would show.
+    """
+    
+    # Without a sort option talks keep relevance order (keyword search) or catalog order
+    SORT_OPTIONS = {
+        'title': 'Titel',
+        'my_rating': 'Meine Bewertung',
+        'rating_count': 'Anzahl Bewertungen'
+    }
+    
+    def __init__(self, topic='', keyword='', rated='', sort='', page=1, per_page=24):
+        self.topic = topic
+        self.keyword = keyword.strip()
+        self.rated = rated if rated in ('yes', 'no') else ''
+        self.sort = sort if sort in self.SORT_OPTIONS else ''
+        self.page = max(page, 1)
+        self.per_page = max(per_page, 1)
+    
+    def run(self, user_ratings=None):
+        """Run the query and return a TalkQueryResult."""
+        user_ratings = user_ratings or {}
+        talks = Talk.get_all()
+        
+        if self.keyword:
+            ranked = Talk.search_ranked(self.keyword) or []
+            candidates = ((talk_id, talks[talk_id]) for talk_id, _ in ranked)
+        else:
+            candidates = talks.items()
+        
+        topic_counts = {}
+        matches = []
+        for talk_id, talk in candidates:
+            if self.rated and (talk_id in user_ratings) != (self.rated == 'yes'):
+                continue
+            topic = talk.get('topicId')
+            if topic:
+                topic_counts[topic] = topic_counts.get(topic, 0) + 1
+            if self.topic and topic != self.topic:
+                continue
+            matches.append((talk_id, talk))
+        
+        # Stable sorts keep relevance (or catalog) order among equal keys
+        if self.sort == 'title':
+            matches.sort(key=lambda item: item[1].get('title', '').casefold())
+        elif self.sort == 'my_rating':
+            matches.sort(key=lambda item: -user_ratings.get(item[0], 0))
+        elif self.sort == 'rating_count':
+            counts = Rating.get_rating_counts()
+            matches.sort(key=lambda item: -counts.get(item[0], 0))
+        
+        return TalkQueryResult(matches, topic_counts, self.page, self.per_page)
+
+
+class TalkQueryResult:
+    """One page of TalkQuery results together with the topic facet counts."""
+    
+    def __init__(self, matches, topic_counts, page, per_page):
+        self.total = len(matches)
+        self.pages = max((self.total + per_page - 1) // per_page, 1)
+        self.page = min(page, self.pages)
+        self.per_page = per_page
+        self.topic_counts = topic_counts
+        start = (self.page - 1) * per_page
+        self.talks = dict(matches[start:start + per_page])
+
+
 class Speaker(JSONStorageModel):
     """Model for conference speakers."""
     
+    storage_table = 'speakers'
+    
     @classmethod
     def get_file_path(cls):
         return current_app.config['SPEAKERS_FILE']
@@ -135,13 +467,17 @@ class Speaker(JSONStorageModel):
     @classmethod
     def get_by_id(cls, speaker_id):
         """Get a speaker by ID."""
-        speakers = cls.load_all()
+        backend = cls.get_backend()
+        if backend is not None:
+            return backend.get_item('speakers', speaker_id)
+        
+        speakers = cls.load_all(copy=False)
         return speakers.get(str(speaker_id))
     
     @classmethod
     def get_all(cls):
         """Get all speakers."""
-        return cls.load_all()
+        return cls.load_all(copy=False)
     
     @classmethod
     def get_sanitized(cls, speaker_id):
@@ -162,9 +498,107 @@ class Speaker(JSONStorageModel):
         return sanitized
 
 
+class UserIdentityMap:
+    """Bounded LRU cache of User objects for the Flask-Login user loader.
+    
+    Each entry remembers the version of the user data it was read from and
+    is only returned while that version is still current.
+    """
+    
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, user_id, version):
+        """Return the cached User, or None if it is missing or outdated."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+    
+    def put(self, user_id, version, user):
+        with self._lock:
+            self._entries[user_id] = (version, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, user_id=None):
+        """Drop one user, or all users if no ID is given."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+# Users restored from the session on every request
+user_identity_map = UserIdentityMap()
+
+
+class UserIndex:
+    """Token and email lookups over the users data.
+    
+    Tokens are indexed by their SHA-256 digest and verified against the stored
+    token with a constant-time comparison, so lookup timing does not depend on
+    how much of a guessed token matches. Emails are indexed lowercased.
+    """
+    
+    def __init__(self, users):
+        self.by_token = {}
+        self.by_email = {}
+        for user_id, user_data in users.items():
+            self.add(user_id, user_data)
+    
+    @staticmethod
+    def token_key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+    
+    @staticmethod
+    def email_key(email):
+        return email.strip().lower()
+    
+    def add(self, user_id, user_data):
+        if user_data.get('token'):
+            self.by_token[self.token_key(user_data['token'])] = user_id
+        if user_data.get('email'):
+            self.by_email[self.email_key(user_data['email'])] = user_id
+    
+    def remove(self, user_id, user_data):
+        if user_data.get('token'):
+            key = self.token_key(user_data['token'])
+            if self.by_token.get(key) == user_id:
+                del self.by_token[key]
+        if user_data.get('email'):
+            key = self.email_key(user_data['email'])
+            if self.by_email.get(key) == user_id:
+                del self.by_email[key]
+    
+    def find_token(self, token, users):
+        """Return the ID of the user with this token, or None."""
+        user_id = self.by_token.get(self.token_key(token))
+        if user_id is None or user_id not in users:
+            return None
+        if not hmac.compare_digest(str(users[user_id].get('token', '')), token):
+            return None
+        return user_id
+    
+    def find_email(self, email):
+        """Return the ID of the user with this email address (case-insensitive), or None."""
+        return self.by_email.get(self.email_key(email))
+
+
 class User(UserMixin, JSONStorageModel):
     """Model for application users."""
     
+    storage_table = 'users'
+    
     def __init__(self, id, name, email, token):
         self.id = id
         self.name = name
@@ -175,12 +609,21 @@ class User(UserMixin, JSONStorageModel):
     def get_file_path(cls):
         return current_app.config['USERS_FILE']
     
+    @classmethod
+    def get_index(cls):
+        """Get the token/email index for the current users file."""
+        return cls.load_shared({'user_index': UserIndex})[1]['user_index']
+    
     @classmethod
     def get_by_id(cls, user_id):
         """Get a user by ID."""
-        users = cls.load_all()
-        if user_id in users:
-            user_data = users[user_id]
+        backend = cls.get_backend()
+        if backend is not None:
+            user_data = backend.get_item('users', user_id)
+        else:
+            user_data = cls.load_all(copy=False).get(user_id)
+        
+        if user_data is not None:
             return cls(
                 id=user_id,
                 name=user_data.get('name', ''),
@@ -189,6 +632,55 @@ class User(UserMixin, JSONStorageModel):
             )
         return None
     
+    @classmethod
+    def load_cached(cls, user_id):
+        """Get a user by ID through the identity map; used by the Flask-Login user loader.
+        
+        With JSON storage a cached user costs one stat of users.json, so
+        changed or revoked tokens take effect with the next request. The
+        SQLite backend looks the user up by primary key instead.
+        """
+        if cls.get_backend() is not None:
+            return cls.get_by_id(user_id)
+        
+        version = file_signature(cls.get_file_path())
+        user = user_identity_map.get(user_id, version)
+        if user is None:
+            user = cls.get_by_id(user_id)
+            if user is not None:
+                user_identity_map.max_size = current_app.config.get('USER_CACHE_SIZE', 1024)
+                user_identity_map.put(user_id, version, user)
+        return user
+    
+    @classmethod
+    def get_many(cls, user_ids):
+        """Get several users by ID with a single data access.
+        
+        Returns a dict of user ID to User; unknown IDs are left out.
+        """
+        backend = cls.get_backend()
+        if backend is not None:
+            found = backend.get_items('users', user_ids)
+        else:
+            users = cls.load_all(copy=False)
+            found = {user_id: users[user_id] for user_id in user_ids if user_id in users}
+        
+        return {
+            user_id: cls(
+                id=user_id,
+                name=user_data.get('name', ''),
+                email=user_data.get('email', ''),
+                token=user_data.get('token', '')
+            )
+            for user_id, user_data in found.items()
+        }
+    
+    @classmethod
+    def get_names(cls, user_ids, default='Unknown'):
+        """Map user IDs to user names; unknown users get ``default``."""
+        users = cls.get_many(user_ids)
+        return {user_id: users[user_id].name if user_id in users else default for user_id in user_ids}
+    
     @classmethod
     def get_by_token(cls, token):
         """Get a user by access token with security checks."""
@@ -196,122 +688,496 @@ class User(UserMixin, JSONStorageModel):
             logging.warning(f"Invalid token format: {token}")
             return None
             
-        users = cls.load_all()
-        for user_id, user_data in users.items():
-            if user_data.get('token') == token:
-                # Check if token is expired (if we implement expiration)
-                if 'token_expires' in user_data and user_data['token_expires'] < time.time():
-                    logging.warning(f"Expired token attempt for user {user_id}")
-                    return None
-                    
-                return cls(
-                    id=user_id,
-                    name=user_data.get('name', ''),
-                    email=user_data.get('email', ''),
-                    token=token
-                )
-        logging.warning(f"Invalid token attempt: {token}")
-        return None
+        match = None
+        backend = cls.get_backend()
+        if backend is not None:
+            match = backend.user_by_token(token)
+        else:
+            users = cls.load_all(copy=False)
+            user_id = cls.get_index().find_token(token, users)
+            if user_id is not None:
+                match = (user_id, users[user_id])
+        
+        if match is None:
+            logging.warning(f"Invalid token attempt: {token}")
+            return None
+        
+        user_id, user_data = match
+        # Check if token is expired (if we implement expiration)
+        if 'token_expires' in user_data and user_data['token_expires'] < time.time():
+            logging.warning(f"Expired token attempt for user {user_id}")
+            return None
+            
+        return cls(
+            id=user_id,
+            name=user_data.get('name', ''),
+            email=user_data.get('email', ''),
+            token=token
+        )
     
     @classmethod
     def create(cls, name, email):
         """Create a new user."""
-        users = cls.load_all()
-        
-        # Check if email already exists
-        for user_data in users.values():
-            if user_data.get('email') == email:
-                return None, "Ein Benutzer mit dieser E-Mail-Adresse existiert bereits."
-        
-        # Generate user ID and token
         from auth import generate_token
-        user_id = f"user_{int(time.time())}_{len(users) + 1}"
         token = generate_token()
-        
-        # Add new user
-        users[user_id] = {
+        user_data = {
             'name': name,
             'email': email,
             'token': token,
             'created_at': datetime.now().isoformat()
         }
         
-        # Save updated users
-        if cls.save_all(users):
-            return cls(
-                id=user_id,
-                name=name,
-                email=email,
-                token=token
-            ), token
+        backend = cls.get_backend()
+        if backend is not None:
+            if backend.email_exists(email):
+                return None, "Ein Benutzer mit dieser E-Mail-Adresse existiert bereits."
+            user_id = cls._new_user_id(backend.count('users'))
+            try:
+                backend.put_user(user_id, user_data)
+            except Exception as e:
+                logging.error(f"Error saving user to database: {str(e)}")
+                return None, "Fehler beim Speichern des Benutzers."
+            cls.discard_snapshot()
+        else:
+            def mutate(users, derived):
+                # Checked against the current data; the index does not know
+                # users added earlier in the same batch
+                email_key = UserIndex.email_key(email)
+                if any(UserIndex.email_key(other.get('email') or '') == email_key for other in users.values()):
+                    return None, None
+                user_id = cls._new_user_id(len(users))
+                users[user_id] = user_data
+                
+                def on_saved(derived):
+                    # Missing if a save_all() in the same batch replaced the data
+                    index = derived.get('user_index')
+                    if index is not None:
+                        index.add(user_id, user_data)
+                return user_id, on_saved
+            
+            try:
+                user_id = cls.apply_write(mutate, {'user_index': UserIndex})
+            except Exception as e:
+                logging.error(f"Error saving user: {str(e)}")
+                return None, "Fehler beim Speichern des Benutzers."
+            if user_id is None:
+                return None, "Ein Benutzer mit dieser E-Mail-Adresse existiert bereits."
         
-        return None, "Fehler beim Speichern des Benutzers."
+        return cls(
+            id=user_id,
+            name=name,
+            email=email,
+            token=token
+        ), token
+    
+    @staticmethod
+    def _new_user_id(user_count):
+        return f"user_{int(time.time())}_{user_count + 1}"
+    
+    @classmethod
+    def save_user(cls, user_id, user_data):
+        """Add or replace a single user; returns True on success."""
+        user_identity_map.invalidate(user_id)
+        backend = cls.get_backend()
+        try:
+            if backend is not None:
+                backend.put_user(user_id, user_data)
+                cls.discard_snapshot()
+                return True
+            
+            def mutate(users, derived):
+                old_data = users.get(user_id)
+                users[user_id] = user_data
+                
+                def on_saved(derived):
+                    index = derived.get('user_index')
+                    if index is None:
+                        return
+                    if old_data is not None:
+                        index.remove(user_id, old_data)
+                    index.add(user_id, user_data)
+                return None, on_saved
+            
+            cls.apply_write(mutate, {'user_index': UserIndex})
+            return True
+        except Exception as e:
+            logging.error(f"Error saving user {user_id}: {str(e)}")
+            return False
     
     @classmethod
     def regenerate_token(cls, user_id):
         """Regenerate access token for a user."""
-        users = cls.load_all()
-        
-        if user_id not in users:
-            return None, "Benutzer nicht gefunden."
-        
-        # Generate new token
         from auth import generate_token
         new_token = generate_token()
-        users[user_id]['token'] = new_token
         
-        # Save updated users
-        if cls.save_all(users):
+        # The old token stops working right away
+        user_identity_map.invalidate(user_id)
+        backend = cls.get_backend()
+        if backend is not None:
+            user_data = backend.get_item('users', user_id)
+            if user_data is None:
+                return None, "Benutzer nicht gefunden."
+            user_data['token'] = new_token
+            backend.put_user(user_id, user_data)
+            cls.discard_snapshot()
             return new_token, None
         
-        return None, "Fehler beim Speichern des neuen Tokens."
+        def mutate(users, derived):
+            user_data = users.get(user_id)
+            if user_data is None:
+                return False, None
+            old_data = dict(user_data)
+            user_data['token'] = new_token
+            
+            def on_saved(derived):
+                index = derived.get('user_index')
+                if index is not None:
+                    index.remove(user_id, old_data)
+                    index.add(user_id, user_data)
+            return True, on_saved
+        
+        try:
+            if not cls.apply_write(mutate, {'user_index': UserIndex}):
+                return None, "Benutzer nicht gefunden."
+        except Exception as e:
+            logging.error(f"Error saving token of user {user_id}: {str(e)}")
+            return None, "Fehler beim Speichern des neuen Tokens."
+        return new_token, None
     
     @classmethod
     def delete(cls, user_id):
         """Delete a user."""
-        users = cls.load_all()
-        
-        if user_id not in users:
-            return False, "Benutzer nicht gefunden."
+        user_identity_map.invalidate(user_id)
+        backend = cls.get_backend()
+        if backend is not None:
+            # Removes the user's ratings in the same transaction
+            if not backend.delete_user(user_id):
+                return False, "Benutzer nicht gefunden."
+            cls.discard_snapshot()
+            Rating.discard_snapshot()
+            return True, None
         
-        # Delete user
-        del users[user_id]
+        def mutate(users, derived):
+            user_data = users.pop(user_id, None)
+            if user_data is None:
+                return False, None
+            
+            def on_saved(derived):
+                index = derived.get('user_index')
+                if index is not None:
+                    index.remove(user_id, user_data)
+            return True, on_saved
         
-        # Save updated users
-        if not cls.save_all(users):
+        try:
+            if not cls.apply_write(mutate, {'user_index': UserIndex}):
+                return False, "Benutzer nicht gefunden."
+        except Exception as e:
+            logging.error(f"Error deleting user {user_id}: {str(e)}")
             return False, "Fehler beim Löschen des Benutzers."
         
         # Also remove user's ratings
-        from .rating import Rating
         Rating.delete_for_user(user_id)
         
         return True, None
 
 
+class RatingAggregates:
+    """Running rating statistics per talk: sum, count, histogram and last update.
+    
+    Updated in O(1) per vote, so averages and counts never need a pass over
+    all ratings. histogram[i] counts the ratings with value i + 1.
+    """
+    
+    def __init__(self, ratings=None):
+        self.talks = {}
+        for user_ratings in (ratings or {}).values():
+            for talk_id, rating in user_ratings.items():
+                self._add(talk_id, rating, 1)
+    
+    def _add(self, talk_id, rating, sign):
+        stats = self.talks.get(talk_id)
+        if stats is None:
+            stats = self.talks[talk_id] = {'sum': 0, 'count': 0, 'histogram': [], 'updated_at': None}
+        stats['sum'] += sign * rating
+        stats['count'] += sign
+        histogram = stats['histogram']
+        if len(histogram) < rating:
+            histogram.extend([0] * (rating - len(histogram)))
+        histogram[rating - 1] += sign
+        if stats['count'] <= 0:
+            del self.talks[talk_id]
+        return stats
+    
+    def set_rating(self, user_id, talk_id, rating, old_rating):
+        if old_rating:
+            self._add(talk_id, old_rating, -1)
+        self._add(talk_id, rating, 1)['updated_at'] = time.time()
+    
+    def remove_user(self, user_id, user_ratings):
+        for talk_id, rating in user_ratings.items():
+            stats = self._add(talk_id, rating, -1)
+            stats['updated_at'] = time.time()
+    
+    def get(self, talk_id):
+        """Get the statistics of one talk, or None if it has no ratings."""
+        return self.talks.get(talk_id)
+    
+    def averages(self):
+        return {talk_id: stats['sum'] / stats['count'] for talk_id, stats in self.talks.items()}
+    
+    def counts(self):
+        return {talk_id: stats['count'] for talk_id, stats in self.talks.items()}
+    
+    def total(self):
+        return sum(stats['count'] for stats in self.talks.values())
+    
+    def histogram(self, talk_id, max_rating):
+        """Get the rating histogram of a talk padded to 1..max_rating."""
+        stats = self.talks.get(talk_id)
+        histogram = list(stats['histogram']) if stats else []
+        return (histogram + [0] * max_rating)[:max_rating]
+    
+    def to_dict(self):
+        return {'talks': self.talks}
+    
+    @classmethod
+    def from_dict(cls, data):
+        aggregates = cls()
+        aggregates.talks = data.get('talks', {})
+        return aggregates
+    
+    @classmethod
+    def from_histograms(cls, rows):
+        """Build from (talk_id, rating, count, updated_at) rows."""
+        aggregates = cls()
+        for talk_id, rating, count, updated_at in rows:
+            stats = aggregates._add(talk_id, rating, count)
+            stats['updated_at'] = max(stats['updated_at'] or 0, updated_at or 0) or None
+        return aggregates
+
+
 class Rating(JSONStorageModel):
     """Model for talk ratings."""
     
+    storage_table = 'ratings'
+    
+    @classmethod
+    def get_index_types(cls):
+        """Get the builders of the structures derived from the ratings data.
+        
+        Each structure is kept current on every change and provides
+        set_rating(user_id, talk_id, rating, old_rating) and
+        remove_user(user_id, user_ratings).
+        """
+        return {
+            'aggregates': cls._load_aggregates,
+            'matrix': RatingMatrix
+        }
+    
     @classmethod
     def get_file_path(cls):
         return current_app.config['RATINGS_FILE']
     
+    @classmethod
+    def get_journal(cls):
+        """Get the rating journal, or None if ratings are stored as plain JSON or in SQLite."""
+        if current_app.config.get('RATINGS_STORAGE', 'json') != 'journal' or cls.get_backend() is not None:
+            return None
+        return get_journal(cls.get_file_path(),
+                           current_app.config['RATINGS_JOURNAL_FILE'],
+                           cls._apply_journal_record,
+                           current_app.config.get('RATINGS_JOURNAL_COMPACT_THRESHOLD', 1000),
+                           current_app.config.get('RATINGS_JOURNAL_FSYNC_WINDOW', 0.0))
+    
+    @staticmethod
+    def _apply_journal_record(ratings, record):
+        """Apply one journal record to the ratings data and return the previous value."""
+        user_id = record['u']
+        if record['op'] == 'set':
+            user_ratings = ratings.setdefault(user_id, {})
+            old_rating = user_ratings.get(record['t'])
+            user_ratings[record['t']] = record['r']
+            return old_rating
+        if record['op'] == 'delete_user':
+            return ratings.pop(user_id, None)
+        logging.warning(f"Unknown rating journal operation: {record['op']}")
+        return None
+    
+    @classmethod
+    def _read_shared(cls, builders):
+        """Read the ratings, replaying the journal if journal storage is enabled."""
+        journal = cls.get_journal()
+        if journal is None:
+            return super()._read_shared(builders)
+        return journal.load_derived(builders)
+    
+    @classmethod
+    def save_all(cls, data, derived=None):
+        """Save all ratings; with journal storage this also resets the journal."""
+        journal = cls.get_journal()
+        if journal is None:
+            return super().save_all(data, derived)
+        
+        cls.discard_snapshot()
+        try:
+            journal.replace(data)
+            return True
+        except Exception as e:
+            logging.error(f"Error saving ratings to {journal.snapshot_path}: {str(e)}")
+            return False
+    
+    @classmethod
+    def load_indexed(cls, current=False):
+        """Load the ratings data together with its derived indexes.
+        
+        Both come from the same version of the data: the request snapshot,
+        or with current=True (needed before a change) the current data. The
+        data is shared and must not be modified.
+        """
+        index_types = cls.get_index_types()
+        try:
+            if not current:
+                return cls.load_shared(index_types)
+            RequestSnapshot.count_load()
+            return cls._read_shared(index_types)
+        except Exception as e:
+            logging.error(f"Error loading ratings: {str(e)}")
+            return {}, {'aggregates': RatingAggregates(), 'matrix': RatingMatrix()}
+    
+    @classmethod
+    def get_index(cls, name):
+        """Get one of the derived rating indexes (see get_index_types)."""
+        return cls.load_indexed()[1][name]
+    
+    @classmethod
+    def get_version_paths(cls):
+        """Get ratings.json and, in journal mode, the journal."""
+        paths = [cls.get_file_path()]
+        journal = cls.get_journal()
+        if journal is not None:
+            paths.append(journal.journal_path)
+        return paths
+    
+    @classmethod
+    def _source_signature(cls):
+        """Identify the current version of the stored ratings."""
+        # Lists, so the signature compares equal after a JSON round trip
+        return [list(signature) if signature else None for signature in map(file_signature, cls.get_version_paths())]
+    
+    @classmethod
+    def _load_aggregates(cls, ratings):
+        """Build the rating aggregates, reusing the persisted ones if they are current.
+        
+        Persisted aggregates are used only if they were computed from the same
+        version of the ratings data and their total count matches it. They
+        are written after each change by _after_flush(), not here: this runs
+        while the file cache is locked. With journal storage they are always
+        built from the data, which is replayed on load anyway.
+        """
+        path = current_app.config.get('RATINGS_AGGREGATES_FILE')
+        if path and cls.get_journal() is None and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    persisted = json.load(f)
+                aggregates = RatingAggregates.from_dict(persisted)
+                if (persisted.get('source') == cls._source_signature()
+                        and aggregates.total() == sum(len(r) for r in ratings.values())):
+                    return aggregates
+            except Exception as e:
+                logging.warning(f"Ignoring unreadable rating aggregates in {path}: {str(e)}")
+        return RatingAggregates(ratings)
+    
+    @classmethod
+    def _after_flush(cls, ratings, derived):
+        """Persist the rating aggregates once a batch of changes is written.
+        
+        Runs with the ratings file locked, so the recorded source signature
+        is the one of the data the aggregates were updated for.
+        """
+        path = current_app.config.get('RATINGS_AGGREGATES_FILE')
+        aggregates = derived.get('aggregates')
+        if not path or aggregates is None:
+            return
+        # Only a cache of the ratings, so it is not fsynced
+        write_json(path, dict(aggregates.to_dict(), source=cls._source_signature()), durable=False)
+    
+    @classmethod
+    def rebuild_aggregates(cls):
+        """Recompute the rating aggregates from the ratings data.
+        
+        The persisted aggregates are removed; they are written again with the
+        next change of the ratings.
+        """
+        path = current_app.config.get('RATINGS_AGGREGATES_FILE')
+        if path and os.path.exists(path):
+            os.remove(path)
+        journal = cls.get_journal()
+        if journal is not None:
+            journal.invalidate()
+        else:
+            file_cache.invalidate(cls.get_file_path())
+        cls.discard_snapshot()
+        return cls.get_aggregates()
+    
+    @classmethod
+    def get_aggregates(cls):
+        """Get the per-talk rating statistics as RatingAggregates."""
+        backend = cls.get_backend()
+        if backend is not None:
+            return RatingAggregates.from_histograms(backend.rating_histograms())
+        
+        return cls.get_index('aggregates')
+    
+    @classmethod
+    def get_matrix(cls):
+        """Get all ratings as a compact RatingMatrix (users x talks)."""
+        backend = cls.get_backend()
+        if backend is not None:
+            return RatingMatrix(backend.load('ratings'))
+        
+        return cls.get_index('matrix')
+    
+    @classmethod
+    def get_analytics(cls):
+        """Get the rating statistics per talk and topic (see RatingAnalytics).
+        
+        Computed once per version of the ratings and the talk catalog; the
+        matrix they were computed from is their ``matrix`` attribute.
+        """
+        config = current_app.config
+        version = (cls.data_version()[0], Talk.data_version()[0])
+        return get_analytics(cls.get_matrix, Talk.get_all, config['MAX_RATING'], version=version,
+                             prior_weight=config['RANKING_PRIOR_WEIGHT'],
+                             bootstrap_samples=config['BOOTSTRAP_SAMPLES'])
+    
     @classmethod
     def get_for_user(cls, user_id):
         """Get all ratings for a specific user."""
-        ratings = cls.load_all()
+        backend = cls.get_backend()
+        if backend is not None:
+            return backend.ratings_for_user(user_id)
+        
+        ratings = cls.load_all(copy=False)
         return ratings.get(user_id, {})
     
     @classmethod
     def get_for_talk(cls, talk_id):
         """Get all ratings for a specific talk."""
-        ratings = cls.load_all()
-        talk_ratings = {}
+        backend = cls.get_backend()
+        if backend is not None:
+            return backend.ratings_for_talk(talk_id)
         
-        for user_id, user_ratings in ratings.items():
-            if talk_id in user_ratings:
-                talk_ratings[user_id] = user_ratings[talk_id]
+        # A column of the rating matrix, no separate talk-major copy is kept
+        return cls.get_index('matrix').for_talk(talk_id)
+    
+    @classmethod
+    def get_rating_counts(cls):
+        """Get the number of ratings per talk."""
+        backend = cls.get_backend()
+        if backend is not None:
+            return backend.rating_counts()
         
-        return talk_ratings
+        return cls.get_aggregates().counts()
     
     @classmethod
     def get_user_rating_for_talk(cls, user_id, talk_id):
@@ -322,71 +1188,159 @@ class Rating(JSONStorageModel):
     @classmethod
     def set_rating(cls, user_id, talk_id, rating_value):
         """Set a user's rating for a talk."""
-        if rating_value < 1 or rating_value > current_app.config['MAX_RATING']:
-            return False, f"Ungültige Bewertung. Bitte wählen Sie 1-{current_app.config['MAX_RATING']} Sterne."
-        
-        ratings = cls.load_all()
-        
-        # Initialize user ratings if not exists
-        if user_id not in ratings:
-            ratings[user_id] = {}
+        return cls.set_ratings(user_id, [(talk_id, rating_value)])[0]
+    
+    @classmethod
+    def set_ratings(cls, user_id, votes):
+        """Set several of a user's ratings with a single storage commit.
         
-        # Get old rating for logging
-        old_rating = ratings[user_id].get(talk_id)
+        ``votes`` is a list of (talk_id, rating) pairs, applied in order.
+        Returns a (success, message) tuple per vote.
+        """
+        max_rating = current_app.config['MAX_RATING']
+        results = [None] * len(votes)
+        valid = []
+        for i, (talk_id, rating_value) in enumerate(votes):
+            # bool is an int subclass, but JSON true is not a rating
+            if (isinstance(rating_value, bool) or not isinstance(rating_value, int)
+                    or rating_value < 1 or rating_value > max_rating):
+                results[i] = (False, f"Ungültige Bewertung. Bitte wählen Sie 1-{max_rating} Sterne.")
+            else:
+                valid.append((i, str(talk_id), rating_value))
+        if not valid:
+            return results
         
-        # Set new rating
-        ratings[user_id][talk_id] = rating_value
+        backend = cls.get_backend()
+        journal = cls.get_journal()
+        indexes = {}
+        if backend is not None:
+            try:
+                old_ratings = backend.set_ratings(user_id, [(talk_id, rating) for _, talk_id, rating in valid])
+            except Exception as e:
+                logging.error(f"Error saving rating to database: {str(e)}")
+                return [result or (False, "Fehler beim Speichern der Bewertung.") for result in results]
+        elif journal is not None:
+            # Append the votes instead of rewriting the whole ratings file
+            indexes = cls.load_indexed(current=True)[1]
+            try:
+                old_ratings = journal.append_many([{
+                    'op': 'set',
+                    'u': user_id,
+                    't': talk_id,
+                    'r': rating_value,
+                    'ts': time.time()
+                } for _, talk_id, rating_value in valid])
+            except Exception as e:
+                logging.error(f"Error appending rating to journal: {str(e)}")
+                return [result or (False, "Fehler beim Speichern der Bewertung.") for result in results]
+        else:
+            def mutate(ratings, derived):
+                # Initialize user ratings if not exists
+                user_ratings = ratings.setdefault(user_id, {})
+                
+                # Set the new ratings, keeping the old ones for logging
+                old_ratings = []
+                for _, talk_id, rating_value in valid:
+                    old_ratings.append(user_ratings.get(talk_id))
+                    user_ratings[talk_id] = rating_value
+                
+                def on_saved(derived):
+                    for (_, talk_id, rating_value), old_rating in zip(valid, old_ratings):
+                        for index in derived.values():
+                            index.set_rating(user_id, talk_id, rating_value, old_rating)
+                return old_ratings, on_saved
+            
+            # Concurrent votes are written together by the single writer
+            try:
+                old_ratings = cls.apply_write(mutate, cls.get_index_types())
+            except Exception as e:
+                logging.error(f"Error saving rating: {str(e)}")
+                return [result or (False, "Fehler beim Speichern der Bewertung.") for result in results]
         
-        # Save updated ratings
-        if not cls.save_all(ratings):
-            return False, "Fehler beim Speichern der Bewertung."
+        for (_, talk_id, rating_value), old_rating in zip(valid, old_ratings):
+            for index in indexes.values():
+                index.set_rating(user_id, talk_id, rating_value, old_rating)
+        cls.discard_snapshot()
         
-        # Log the rating action
+        # Log the rating actions
         from utils import log_rating
-        log_rating(user_id, talk_id, rating_value, old_rating)
+        for (i, talk_id, rating_value), old_rating in zip(valid, old_ratings):
+            event_broker.publish('rating', lambda talk_id=talk_id: cls._rating_event(talk_id))
+            log_rating(user_id, talk_id, rating_value, old_rating)
+            results[i] = (True, None)
         
-        return True, None
+        return results
+    
+    @classmethod
+    def _rating_event(cls, talk_id):
+        """Build the live update sent after a talk was rated."""
+        aggregates = cls.get_aggregates()
+        stats = aggregates.get(talk_id) or {'sum': 0, 'count': 0}
+        return {
+            'talk_id': talk_id,
+            'average': stats['sum'] / stats['count'] if stats['count'] else 0,
+            'count': stats['count'],
+            'total_ratings': aggregates.total(),
+            'rated_talks': len(aggregates.talks)
+        }
     
     @classmethod
     def delete_for_user(cls, user_id):
         """Delete all ratings for a user."""
-        ratings = cls.load_all()
+        backend = cls.get_backend()
+        if backend is not None:
+            try:
+                backend.delete_ratings_for_user(user_id)
+                cls.discard_snapshot()
+                return True
+            except Exception as e:
+                logging.error(f"Error deleting ratings from database: {str(e)}")
+                return False
         
-        if user_id in ratings:
-            del ratings[user_id]
-            return cls.save_all(ratings)
+        journal = cls.get_journal()
+        if journal is None:
+            def mutate(ratings, derived):
+                user_ratings = ratings.pop(user_id, None)
+                
+                def on_saved(derived):
+                    for index in derived.values():
+                        index.remove_user(user_id, user_ratings or {})
+                return None, on_saved
+            
+            try:
+                cls.apply_write(mutate, cls.get_index_types())
+                return True
+            except Exception as e:
+                logging.error(f"Error deleting ratings: {str(e)}")
+                return False
+        
+        indexes = cls.load_indexed(current=True)[1]
+        try:
+            user_ratings = journal.append({'op': 'delete_user', 'u': user_id, 'ts': time.time()})
+        except Exception as e:
+            logging.error(f"Error appending rating deletion to journal: {str(e)}")
+            return False
         
+        for index in indexes.values():
+            index.remove_user(user_id, user_ratings or {})
+        cls.discard_snapshot()
         return True
     
     @classmethod
     def get_average_ratings(cls):
-        """Calculate average ratings for all talks."""
-        ratings = cls.load_all()
-        avg_ratings = {}
-        
-        # Get all talk IDs from ratings
-        all_talk_ids = set()
-        for user_ratings in ratings.values():
-            all_talk_ids.update(user_ratings.keys())
-        
-        # Calculate average for each talk
-        for talk_id in all_talk_ids:
-            talk_ratings = []
-            for user_ratings in ratings.values():
-                if talk_id in user_ratings:
-                    talk_ratings.append(user_ratings[talk_id])
-            
-            if talk_ratings:
-                avg_ratings[talk_id] = sum(talk_ratings) / len(talk_ratings)
-            else:
-                avg_ratings[talk_id] = 0
+        """Get the average rating of every talk that has ratings."""
+        backend = cls.get_backend()
+        if backend is not None:
+            return backend.average_ratings()
         
-        return avg_ratings
+        return cls.get_aggregates().averages()
 
 
 class Comment(JSONStorageModel):
     """Model for talk comments."""
     
+    storage_table = 'comments'
+    
     @classmethod
     def get_file_path(cls):
         return current_app.config['COMMENTS_FILE']
@@ -394,35 +1348,125 @@ class Comment(JSONStorageModel):
     @classmethod
     def get_for_talk(cls, talk_id):
         """Get all comments for a specific talk."""
-        comments = cls.load_all()
+        backend = cls.get_backend()
+        if backend is not None:
+            return backend.comments_for_talk(talk_id)
+        
+        comments = cls.load_all(copy=False)
         return comments.get(talk_id, [])
     
+    @classmethod
+    def count_all(cls):
+        """Get the total number of comments."""
+        backend = cls.get_backend()
+        if backend is not None:
+            return backend.count('comments')
+        
+        return sum(len(comments) for comments in cls.load_all(copy=False).values())
+    
     @classmethod
     def add_comment(cls, talk_id, user_id, user_name, text):
         """Add a comment to a talk."""
-        if not text.strip():
-            return False, "Bitte geben Sie einen Kommentar ein."
-            
-        # Check comment length
-        if len(text) > 600:
-            return False, "Kommentar darf maximal 600 Zeichen lang sein."
-        
-        comments = cls.load_all()
-        
-        # Initialize talk comments if not exists
-        if talk_id not in comments:
-            comments[talk_id] = []
-        
-        # Add new comment
-        comments[talk_id].append({
-            'user_id': user_id,
-            'user_name': user_name,
-            'text': text,
-            'timestamp': time.time()
-        })
-        
-        # Save updated comments
-        if cls.save_all(comments):
-            return True, None
+        return cls.add_comments(user_id, user_name, [(talk_id, text)])[0]
+    
+    @classmethod
+    def add_comments(cls, user_id, user_name, items):
+        """Add several comments of a user with a single storage commit.
+        
+        ``items`` is a list of (talk_id, text) pairs. Returns a
+        (success, message) tuple per comment.
+        """
+        results = [None] * len(items)
+        valid = []
+        for i, (talk_id, text) in enumerate(items):
+            if not text.strip():
+                results[i] = (False, "Bitte geben Sie einen Kommentar ein.")
+            # Check comment length
+            elif len(text) > 600:
+                results[i] = (False, "Kommentar darf maximal 600 Zeichen lang sein.")
+            else:
+                valid.append((i, str(talk_id), {
+                    'user_id': user_id,
+                    'user_name': user_name,
+                    'text': text,
+                    'timestamp': time.time()
+                }))
+        if not valid:
+            return results
+        
+        backend = cls.get_backend()
+        if backend is not None:
+            try:
+                backend.add_comments([(talk_id, comment) for _, talk_id, comment in valid])
+                cls.discard_snapshot()
+            except Exception as e:
+                logging.error(f"Error saving comment to database: {str(e)}")
+                return [result or (False, "Fehler beim Speichern des Kommentars.") for result in results]
+            for i, talk_id, _ in valid:
+                event_broker.publish('comment', lambda talk_id=talk_id: {
+                    'talk_id': talk_id,
+                    'count': len(backend.comments_for_talk(talk_id)),
+                    'total_comments': backend.count('comments')
+                })
+                results[i] = (True, None)
+            return results
+        
+        def mutate(comments, derived):
+            # Add the new comments, initializing the talk's comments if needed
+            counts = []
+            for _, talk_id, comment in valid:
+                comments.setdefault(talk_id, []).append(comment)
+                counts.append(len(comments[talk_id]))
+            total = sum(len(talk_comments) for talk_comments in comments.values())
+            return (counts, total), None
+        
+        # Save updated comments through the single writer
+        try:
+            counts, total = cls.apply_write(mutate)
+        except Exception as e:
+            logging.error(f"Error saving comment: {str(e)}")
+            return [result or (False, "Fehler beim Speichern des Kommentars.") for result in results]
+        for (i, talk_id, _), count in zip(valid, counts):
+            event_broker.publish('comment', {'talk_id': talk_id, 'count': count, 'total_comments': total})
+            results[i] = (True, None)
+        return results
+
+
+class SyncLog(JSONStorageModel):
+    """Results of synced items by idempotency key, per user.
+    
+    Clients that queue ratings and comments offline send each item with a
+    key; if a batch is sent again (e.g. the response was lost), items whose
+    key is known get their recorded result instead of being applied again.
+    Always a JSON file, also with the SQLite backend.
+    """
+    
+    @classmethod
+    def get_file_path(cls):
+        return current_app.config['SYNC_KEYS_FILE']
+    
+    @classmethod
+    def get_results(cls, user_id, keys):
+        """Get the recorded results {key: result} of a user's keys."""
+        recorded = cls.load_all(copy=False).get(user_id, {})
+        return {key: recorded[key]['result'] for key in keys if key in recorded}
+    
+    @classmethod
+    def record(cls, user_id, results):
+        """Record the results {key: result} of a user's items; expired keys are dropped."""
+        now = time.time()
+        expired = now - current_app.config.get('SYNC_KEY_TTL', 7 * 24 * 3600)
+        
+        def mutate(log, derived):
+            for log_user_id in list(log):
+                entries = {key: entry for key, entry in log[log_user_id].items() if entry['ts'] >= expired}
+                if entries:
+                    log[log_user_id] = entries
+                else:
+                    del log[log_user_id]
+            entries = log.setdefault(user_id, {})
+            for key, result in results.items():
+                entries[key] = {'result': result, 'ts': now}
+            return None, None
         
-        return False, "Fehler beim Speichern des Kommentars."
+        cls.apply_write(mutate)
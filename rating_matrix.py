@@ -0,0 +1,209 @@
+import threading
+
+try:
+    import numpy
+except ImportError:  # The matrix works on plain bytes without NumPy, just slower for bulk queries
+    numpy = None
+
+
+class RatingMatrix:
+    """Ratings as a dense uint8 matrix with one row per user and one column per talk.
+
+    User and talk IDs are mapped to dense row and column numbers in order of
+    first appearance; a cell holds the rating, 0 means unrated. At one byte
+    per cell 5,000 users x 300 talks take 1.5 to 2.5 MB (columns are
+    allocated in steps), a small fraction of the same ratings as nested
+    dicts of Python objects. Rows are contiguous, so a user's
+    ratings are one slice and a talk's ratings one strided slice; with
+    NumPy installed, to_array() gives the whole matrix for vector operations.
+    ``column_rows`` keeps the rated rows of each column, so for_talk() costs
+    the number of ratings of the talk, not the number of users.
+
+    Like the other derived rating structures it is kept current with
+    set_rating() and remove_user(), which also increase ``version`` so
+    results computed from the matrix can be cached. Removed users keep
+    their (zeroed) row.
+    """
+
+    def __init__(self, ratings=None):
+        self.user_ids = []
+        self.talk_ids = []
+        self.user_rows = {}
+        self.talk_columns = {}
+        # Rows with a rating per column, so a talk's ratings are read without
+        # looking at the rows of all other users
+        self.column_rows = []
+        # (cells, stride) are swapped together when the matrix is re-laid out
+        self._grid = (bytearray(), 0)
+        self._lock = threading.Lock()
+        self.version = 0
+
+        ratings = ratings or {}
+        talk_ids = dict.fromkeys(talk_id for user_ratings in ratings.values() for talk_id in user_ratings)
+        with self._lock:
+            for talk_id in talk_ids:
+                self._column(talk_id)
+            for user_id, user_ratings in ratings.items():
+                cells, stride = self._grid
+                row = self._row(user_id)
+                for talk_id, rating in user_ratings.items():
+                    column = self.talk_columns[talk_id]
+                    cells[row * stride + column] = rating
+                    self.column_rows[column].add(row)
+
+    def _row(self, user_id):
+        row = self.user_rows.get(user_id)
+        if row is None:
+            row = self.user_rows[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+            cells, stride = self._grid
+            cells.extend(bytes(stride))
+        return row
+
+    def _column(self, talk_id):
+        column = self.talk_columns.get(talk_id)
+        if column is None:
+            column = len(self.talk_ids)
+            cells, stride = self._grid
+            if column >= stride:
+                # Re-lay out with room for more talks; rows keep their order
+                new_stride = max(16, stride * 2)
+                new_cells = bytearray(len(self.user_ids) * new_stride)
+                for row in range(len(self.user_ids)):
+                    new_cells[row * new_stride:row * new_stride + stride] = cells[row * stride:(row + 1) * stride]
+                self._grid = (new_cells, new_stride)
+            self.talk_columns[talk_id] = column
+            self.talk_ids.append(talk_id)
+            self.column_rows.append(set())
+        return column
+
+    def set_rating(self, user_id, talk_id, rating, old_rating):
+        with self._lock:
+            column = self._column(talk_id)
+            row = self._row(user_id)
+            cells, stride = self._grid
+            cells[row * stride + column] = rating
+            self.column_rows[column].add(row)
+            self.version += 1
+
+    def remove_user(self, user_id, user_ratings):
+        with self._lock:
+            row = self.user_rows.get(user_id)
+            if row is not None:
+                cells, stride = self._grid
+                for column, rating in enumerate(cells[row * stride:row * stride + len(self.talk_ids)]):
+                    if rating:
+                        self.column_rows[column].discard(row)
+                cells[row * stride:(row + 1) * stride] = bytes(stride)
+                self.version += 1
+
+    def row(self, user_id):
+        """Return a user's ratings as bytes, one per talk column."""
+        cells, stride = self._grid
+        row = self.user_rows.get(user_id)
+        if row is None:
+            return bytes(len(self.talk_ids))
+        return bytes(cells[row * stride:row * stride + len(self.talk_ids)])
+
+    def column(self, talk_id):
+        """Return a talk's ratings as bytes, one per user row."""
+        cells, stride = self._grid
+        column = self.talk_columns.get(talk_id)
+        if column is None:
+            return bytes(len(self.user_ids))
+        return bytes(cells[column:len(self.user_ids) * stride:stride])
+
+    def for_user(self, user_id):
+        """Get {talk_id: rating} for one user."""
+        return {self.talk_ids[c]: rating for c, rating in enumerate(self.row(user_id)) if rating}
+
+    def for_talk(self, talk_id):
+        """Get {user_id: rating} for one talk, reading only the rated cells."""
+        with self._lock:
+            column = self.talk_columns.get(talk_id)
+            if column is None:
+                return {}
+            cells, stride = self._grid
+            return {self.user_ids[r]: cells[r * stride + column] for r in sorted(self.column_rows[column])}
+
+    def counts(self):
+        """Get the number of ratings per rated talk."""
+        if numpy is not None:
+            counts = numpy.count_nonzero(self.to_array(), axis=0)
+            return {talk_id: int(n) for talk_id, n in zip(self.talk_ids, counts) if n}
+        counts = {}
+        for talk_id in self.talk_ids:
+            column = self.column(talk_id)
+            n = len(column) - column.count(0)
+            if n:
+                counts[talk_id] = n
+        return counts
+
+    def user_counts(self):
+        """Get the number of ratings per user who rated anything."""
+        if numpy is not None:
+            counts = numpy.count_nonzero(self.to_array(), axis=1)
+            return {user_id: int(n) for user_id, n in zip(self.user_ids, counts) if n}
+        counts = {}
+        for user_id in self.user_ids:
+            row = self.row(user_id)
+            n = len(row) - row.count(0)
+            if n:
+                counts[user_id] = n
+        return counts
+
+    def block(self, talk_ids, user_ids):
+        """Get the ratings of some talks by some users as sparse cells.
+
+        Returns (talk index, user index, rating) triples for the rated cells,
+        indexes into the given lists, ordered by talk. Only the requested
+        cells are read, so a page of the matrix costs the same for any
+        number of users and talks.
+        """
+        cells, stride = self._grid
+        columns = [(i, self.talk_columns.get(talk_id)) for i, talk_id in enumerate(talk_ids)]
+        rows = [(j, self.user_rows.get(user_id)) for j, user_id in enumerate(user_ids)]
+        columns = [(i, column) for i, column in columns if column is not None]
+        rows = [(j, row * stride) for j, row in rows if row is not None]
+        result = []
+        for i, column in columns:
+            for j, offset in rows:
+                rating = cells[offset + column]
+                if rating:
+                    result.append((i, j, rating))
+        return result
+
+    def averages(self):
+        """Get the average rating per rated talk."""
+        if numpy is not None:
+            matrix = self.to_array()
+            counts = numpy.count_nonzero(matrix, axis=0)
+            sums = matrix.sum(axis=0, dtype=numpy.int64)
+            return {talk_id: float(s) / n for talk_id, s, n in zip(self.talk_ids, sums, counts) if n}
+        averages = {}
+        for talk_id in self.talk_ids:
+            column = self.column(talk_id)
+            n = len(column) - column.count(0)
+            if n:
+                averages[talk_id] = sum(column) / n
+        return averages
+
+    def to_array(self):
+        """Return a copy of the matrix as a users x talks NumPy uint8 array.
+
+        Raises RuntimeError if NumPy is not installed.
+        """
+        if numpy is None:
+            raise RuntimeError("NumPy is not installed")
+        cells, stride = self._grid
+        users, talks = len(self.user_ids), len(self.talk_ids)
+        if not users or not stride:
+            return numpy.zeros((users, talks), dtype=numpy.uint8)
+        # Copy, so the bytearray can still grow while the array is in use
+        array = numpy.frombuffer(bytes(cells[:users * stride]), dtype=numpy.uint8)
+        return array.reshape(users, stride)[:, :talks]
+
+    @property
+    def nbytes(self):
+        """Memory taken by the matrix cells."""
+        return len(self._grid[0])
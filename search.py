@@ -0,0 +1,198 @@
+import bisect
+import math
+import re
+import threading
+import unicodedata
+
+# Weight of a term occurrence per field when scoring
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'subTitle': 2.0,
+    'keywords': 2.0,
+    'speakers': 2.0,
+    'abstract': 1.0
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Prefix matches count less than exact (stemmed) matches
+PREFIX_FACTOR = 0.5
+
+STOPWORDS = {
+    'der', 'die', 'das', 'und', 'oder', 'in', 'im', 'mit', 'fur', 'von', 'zu', 'zum', 'zur',
+    'den', 'dem', 'des', 'ein', 'eine', 'einer', 'eines', 'einen', 'ist', 'sind', 'wie', 'auf',
+    'the', 'and', 'or', 'of', 'to', 'a', 'an', 'for', 'with', 'on', 'is', 'are'
+}
+
+_DIGRAPHS = re.compile(r'(?<=[a-z])([aou])e')
+_WORDS = re.compile(r'[^\W_]+')
+
+
+def fold(text):
+    """Lowercase text and fold umlauts, their ae/oe/ue spellings and ß.
+
+    'Größe', 'Groesse' and 'Grosse' all become 'grosse'.
+    """
+    text = text.lower().replace('ß', 'ss')
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _DIGRAPHS.sub(r'\1', text)
+
+
+def stem(word):
+    """Strip common German inflection suffixes (a light variant of CISTEM)."""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    for suffix in ('ungen', 'ung'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            word = word[:-len(suffix)]
+            break
+    while True:
+        if len(word) > 5 and word[-2:] in ('em', 'er', 'nd'):
+            word = word[:-2]
+        elif len(word) > 4 and word[-1] in 'esn':
+            word = word[:-1]
+        else:
+            return word
+
+
+def tokenize(text):
+    """Split text into folded, stemmed terms without stopwords."""
+    return [stem(word) for word in _WORDS.findall(fold(text or '')) if word not in STOPWORDS]
+
+
+class SearchIndex:
+    """Inverted index over the talk catalog with BM25F ranking."""
+
+    def __init__(self, talks, speakers):
+        self.talks = talks
+        self.speakers = speakers
+        # term -> {talk_id: {field: count}}
+        self.postings = {}
+        self.lengths = {}
+
+        for talk_id, talk in talks.items():
+            length = 0.0
+            for field, text in self._fields(talk, speakers):
+                terms = tokenize(text)
+                length += FIELD_WEIGHTS[field] * len(terms)
+                for term in terms:
+                    fields = self.postings.setdefault(term, {}).setdefault(talk_id, {})
+                    fields[field] = fields.get(field, 0) + 1
+            self.lengths[talk_id] = length
+
+        self.terms = sorted(self.postings)
+        self.avg_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 0.0
+
+    @staticmethod
+    def _fields(talk, speakers):
+        for field in ('title', 'subTitle', 'abstract', 'keywords'):
+            if talk.get(field):
+                yield field, talk[field]
+        names = []
+        for key in ('speakerId', 'coSpeakerId1', 'coSpeakerId2'):
+            speaker = speakers.get(str(talk.get(key))) if talk.get(key) else None
+            if speaker:
+                names.append(f"{speaker.get('firstName', '')} {speaker.get('surName', '')}")
+        if names:
+            yield 'speakers', ' '.join(names)
+
+    def _expand(self, word, prefix):
+        """Return {term: factor} for the index terms matching a query word."""
+        term = stem(word)
+        matches = {term: 1.0} if term in self.postings else {}
+        if prefix:
+            i = bisect.bisect_left(self.terms, term)
+            while i < len(self.terms) and self.terms[i].startswith(term):
+                matches.setdefault(self.terms[i], PREFIX_FACTOR)
+                i += 1
+        return matches
+
+    def search(self, query, fields=None, prefix=True):
+        """Return (talk_id, score) pairs for talks matching every query word, best first.
+
+        ``fields`` restricts matching to some fields; a query without any
+        searchable words matches all talks with score 0.
+        """
+        words = [word for word in _WORDS.findall(fold(query or '')) if word not in STOPWORDS]
+        if not words:
+            return [(talk_id, 0.0) for talk_id in self.talks]
+
+        total = len(self.talks)
+        scores = None
+        for word in words:
+            word_scores = {}
+            for term, factor in self._expand(word, prefix).items():
+                postings = self.postings[term]
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for talk_id, field_counts in postings.items():
+                    tf = sum(FIELD_WEIGHTS[f] * n for f, n in field_counts.items()
+                             if fields is None or f in fields)
+                    if not tf:
+                        continue
+                    norm = K1 * (1 - B + B * self.lengths[talk_id] / (self.avg_length or 1))
+                    score = factor * idf * tf * (K1 + 1) / (tf + norm)
+                    word_scores[talk_id] = word_scores.get(talk_id, 0.0) + score
+
+            # Every query word has to match
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {talk_id: score + word_scores[talk_id]
+                          for talk_id, score in scores.items() if talk_id in word_scores}
+            if not scores:
+                return []
+
+        return sorted(scores.items(), key=lambda item: -item[1])
+
+    def export(self, talk_ids):
+        """Export the index for searching in the browser (see static/js/scripts.js).
+
+        Talks are referenced by their position in ``talk_ids``. Each term maps
+        to a flat list of (position, weighted term frequency) pairs over all
+        fields, enough to reproduce search() without ``fields``.
+        """
+        positions = {talk_id: i for i, talk_id in enumerate(talk_ids)}
+        terms = {}
+        for term in self.terms:
+            pairs = terms[term] = []
+            for talk_id, field_counts in self.postings[term].items():
+                if talk_id in positions:
+                    tf = sum(FIELD_WEIGHTS[f] * n for f, n in field_counts.items())
+                    pairs.extend((positions[talk_id], tf))
+        return {
+            'terms': terms,
+            'lengths': [self.lengths.get(talk_id, 0.0) for talk_id in talk_ids],
+            'avg_length': self.avg_length,
+            'k1': K1,
+            'b': B,
+            'prefix_factor': PREFIX_FACTOR,
+            'stopwords': sorted(STOPWORDS)
+        }
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_search_index(talks, speakers, version=None):
+    """Get the search index for the given talks and speakers data.
+
+    With ``version``, which identifies the talks and speakers data (see
+    JSONStorageModel.data_version), the index is rebuilt only when the
+    version changes; ``talks`` and ``speakers`` are then functions loading
+    the data, called only to rebuild. Without it the index is rebuilt when
+    it is asked for with different data objects, which with the shared file
+    cache means a changed file.
+    """
+    global _index, _index_version
+    with _index_lock:
+        if version is not None:
+            if _index is None or _index_version != version:
+                _index, _index_version = SearchIndex(talks(), speakers()), version
+        elif _index is None or _index.talks is not talks or _index.speakers is not speakers:
+            _index, _index_version = SearchIndex(talks, speakers), None
+        return _index
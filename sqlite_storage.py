@@ -0,0 +1,337 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS talks (
+    id TEXT PRIMARY KEY,
+    topic_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_talks_topic ON talks (topic_id);
+
+CREATE TABLE IF NOT EXISTS speakers (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT,
+    token TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_token ON users (token);
+CREATE INDEX IF NOT EXISTS idx_users_email_lower ON users (lower(email));
+
+CREATE TABLE IF NOT EXISTS ratings (
+    user_id TEXT NOT NULL,
+    talk_id TEXT NOT NULL,
+    rating INTEGER NOT NULL,
+    updated_at REAL,
+    PRIMARY KEY (user_id, talk_id)
+);
+CREATE INDEX IF NOT EXISTS idx_ratings_talk ON ratings (talk_id);
+
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    talk_id TEXT NOT NULL,
+    user_id TEXT,
+    user_name TEXT,
+    text TEXT,
+    timestamp REAL
+);
+CREATE INDEX IF NOT EXISTS idx_comments_talk ON comments (talk_id);
+CREATE INDEX IF NOT EXISTS idx_comments_user ON comments (user_id);
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    table_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    modified REAL NOT NULL
+);
+"""
+
+TABLES = ('talks', 'speakers', 'users', 'ratings', 'comments')
+
+# Every change of a table bumps its generation counter (see data_version)
+SCHEMA += ''.join(f"""
+INSERT OR IGNORE INTO data_versions VALUES ('{table}', 0, (julianday('now') - 2440587.5) * 86400.0);
+""" + ''.join(f"""
+CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version AFTER {event} ON {table} BEGIN
+    UPDATE data_versions SET version = version + 1, modified = (julianday('now') - 2440587.5) * 86400.0
+    WHERE table_name = '{table}';
+END;
+""" for event in ('INSERT', 'UPDATE', 'DELETE')) for table in TABLES)
+
+
+class SQLiteStorage:
+    """SQLite storage for all models, used instead of the JSON files.
+
+    The database runs in WAL mode so several worker processes can read while
+    one writes. load() and save() convert whole tables to and from the dict
+    layout of the corresponding JSON file; the other methods are the indexed
+    queries the models use on their hot paths.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def connect(self):
+        """Get this thread's connection, creating the schema on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def transaction(self):
+        """Return a context manager running a write transaction."""
+        return _Transaction(self.connect())
+
+    # Whole-table access in the JSON file layout
+
+    def load(self, table):
+        """Load a whole table in the layout of its JSON file."""
+        conn = self.connect()
+        if table in ('talks', 'speakers', 'users'):
+            return {row[0]: json.loads(row[1]) for row in conn.execute(f'SELECT id, data FROM {table}')}
+        if table == 'ratings':
+            ratings = {}
+            for user_id, talk_id, rating in conn.execute('SELECT user_id, talk_id, rating FROM ratings'):
+                ratings.setdefault(user_id, {})[talk_id] = rating
+            return ratings
+        if table == 'comments':
+            comments = {}
+            for row in conn.execute('SELECT talk_id, user_id, user_name, text, timestamp FROM comments ORDER BY id'):
+                comments.setdefault(row[0], []).append(_comment_from_row(row[1:]))
+            return comments
+        raise ValueError(f"Unknown table: {table}")
+
+    def save(self, table, data):
+        """Replace a whole table with data in the layout of its JSON file."""
+        with self.transaction() as conn:
+            self._replace(conn, table, data)
+
+    def _replace(self, conn, table, data):
+        conn.execute(f'DELETE FROM {table}')
+        if table == 'talks':
+            conn.executemany(
+                'INSERT INTO talks (id, topic_id, data) VALUES (?, ?, ?)',
+                ((str(k), v.get('topicId'), json.dumps(v, ensure_ascii=False)) for k, v in data.items()))
+        elif table == 'speakers':
+            conn.executemany(
+                'INSERT INTO speakers (id, data) VALUES (?, ?)',
+                ((str(k), json.dumps(v, ensure_ascii=False)) for k, v in data.items()))
+        elif table == 'users':
+            conn.executemany(
+                'INSERT INTO users (id, email, token, data) VALUES (?, ?, ?, ?)',
+                ((k, v.get('email'), v.get('token'), json.dumps(v, ensure_ascii=False)) for k, v in data.items()))
+        elif table == 'ratings':
+            conn.executemany(
+                'INSERT INTO ratings (user_id, talk_id, rating) VALUES (?, ?, ?)',
+                ((user_id, str(talk_id), rating)
+                 for user_id, user_ratings in data.items()
+                 for talk_id, rating in user_ratings.items()))
+        elif table == 'comments':
+            conn.executemany(
+                'INSERT INTO comments (talk_id, user_id, user_name, text, timestamp) VALUES (?, ?, ?, ?, ?)',
+                ((str(talk_id), c.get('user_id'), c.get('user_name'), c.get('text'), c.get('timestamp'))
+                 for talk_id, talk_comments in data.items()
+                 for c in talk_comments))
+        else:
+            raise ValueError(f"Unknown table: {table}")
+
+    def import_json(self, files):
+        """Import JSON data files, given as a mapping of table name to path.
+
+        All tables are replaced in one transaction; missing files are skipped.
+        Returns the number of top-level entries imported per table.
+        """
+        counts = {}
+        with self.transaction() as conn:
+            for table, path in files.items():
+                if not path or not os.path.exists(path):
+                    continue
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._replace(conn, table, data)
+                counts[table] = len(data)
+        return counts
+
+    def data_version(self, table):
+        """Get (generation, last modified timestamp) of a table.
+
+        The generation is incremented by triggers on every changed row, in
+        the same transaction as the change.
+        """
+        return self.connect().execute(
+            'SELECT version, modified FROM data_versions WHERE table_name = ?', (table,)).fetchone()
+
+    # Indexed lookups
+
+    def count(self, table):
+        return self.connect().execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def get_item(self, table, item_id):
+        """Get one talk, speaker or user by ID."""
+        row = self.connect().execute(f'SELECT data FROM {table} WHERE id = ?', (str(item_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_items(self, table, item_ids):
+        """Get several talks, speakers or users by ID; missing IDs are left out."""
+        ids = list(dict.fromkeys(str(item_id) for item_id in item_ids))
+        conn = self.connect()
+        items = {}
+        # Stay below SQLite's limit on the number of query parameters
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = conn.execute(f'SELECT id, data FROM {table} WHERE id IN ({placeholders})', chunk)
+            items.update((row[0], json.loads(row[1])) for row in rows)
+        return items
+    
+    def talks_by_topic(self, topic_id):
+        rows = self.connect().execute('SELECT id, data FROM talks WHERE topic_id = ?', (topic_id,))
+        return {row[0]: json.loads(row[1]) for row in rows}
+
+    def user_by_token(self, token):
+        """Return (user_id, user_data) for a token, or None."""
+        row = self.connect().execute('SELECT id, data FROM users WHERE token = ?', (token,)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def email_exists(self, email):
+        """Check case-insensitively whether an email address is already in use."""
+        row = self.connect().execute('SELECT 1 FROM users WHERE lower(email) = ? LIMIT 1',
+                                     (email.strip().lower(),)).fetchone()
+        return row is not None
+
+    def put_user(self, user_id, user_data):
+        with self.transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO users (id, email, token, data) VALUES (?, ?, ?, ?)',
+                (user_id, user_data.get('email'), user_data.get('token'), json.dumps(user_data, ensure_ascii=False)))
+
+    def delete_user(self, user_id):
+        """Delete a user and their ratings; returns False if the user did not exist."""
+        with self.transaction() as conn:
+            deleted = conn.execute('DELETE FROM users WHERE id = ?', (user_id,)).rowcount
+            conn.execute('DELETE FROM ratings WHERE user_id = ?', (user_id,))
+        return deleted > 0
+
+    def ratings_for_user(self, user_id):
+        rows = self.connect().execute('SELECT talk_id, rating FROM ratings WHERE user_id = ?', (user_id,))
+        return dict(rows.fetchall())
+
+    def ratings_for_talk(self, talk_id):
+        rows = self.connect().execute('SELECT user_id, rating FROM ratings WHERE talk_id = ?', (str(talk_id),))
+        return dict(rows.fetchall())
+
+    def set_rating(self, user_id, talk_id, rating):
+        """Insert or update a rating and return the previous value (or None)."""
+        with self.transaction() as conn:
+            row = conn.execute('SELECT rating FROM ratings WHERE user_id = ? AND talk_id = ?',
+                               (user_id, str(talk_id))).fetchone()
+            conn.execute(
+                'INSERT INTO ratings (user_id, talk_id, rating, updated_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (user_id, talk_id) DO UPDATE SET rating = excluded.rating, updated_at = excluded.updated_at',
+                (user_id, str(talk_id), rating, time.time()))
+        return row[0] if row else None
+
+    def set_ratings(self, user_id, ratings):
+        """Insert or update several (talk_id, rating) pairs of a user in one transaction.
+
+        Returns the previous values in the same order.
+        """
+        old_ratings = []
+        with self.transaction() as conn:
+            for talk_id, rating in ratings:
+                row = conn.execute('SELECT rating FROM ratings WHERE user_id = ? AND talk_id = ?',
+                                   (user_id, str(talk_id))).fetchone()
+                conn.execute(
+                    'INSERT INTO ratings (user_id, talk_id, rating, updated_at) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (user_id, talk_id) DO UPDATE SET rating = excluded.rating, '
+                    'updated_at = excluded.updated_at',
+                    (user_id, str(talk_id), rating, time.time()))
+                old_ratings.append(row[0] if row else None)
+        return old_ratings
+
+    def delete_ratings_for_user(self, user_id):
+        with self.transaction() as conn:
+            conn.execute('DELETE FROM ratings WHERE user_id = ?', (user_id,))
+
+    def average_ratings(self):
+        rows = self.connect().execute('SELECT talk_id, AVG(rating) FROM ratings GROUP BY talk_id')
+        return dict(rows.fetchall())
+
+    def rating_counts(self):
+        rows = self.connect().execute('SELECT talk_id, COUNT(*) FROM ratings GROUP BY talk_id')
+        return dict(rows.fetchall())
+
+    def rating_histograms(self):
+        """Return (talk_id, rating, count, last_updated) rows."""
+        rows = self.connect().execute(
+            'SELECT talk_id, rating, COUNT(*), MAX(updated_at) FROM ratings GROUP BY talk_id, rating')
+        return rows.fetchall()
+
+    def comments_for_talk(self, talk_id):
+        rows = self.connect().execute(
+            'SELECT user_id, user_name, text, timestamp FROM comments WHERE talk_id = ? ORDER BY id', (str(talk_id),))
+        return [_comment_from_row(row) for row in rows]
+
+    def add_comment(self, talk_id, comment):
+        self.add_comments([(talk_id, comment)])
+
+    def add_comments(self, comments):
+        """Insert several (talk_id, comment) pairs in one transaction."""
+        with self.transaction() as conn:
+            conn.executemany(
+                'INSERT INTO comments (talk_id, user_id, user_name, text, timestamp) VALUES (?, ?, ?, ?, ?)',
+                [(str(talk_id), comment['user_id'], comment['user_name'], comment['text'], comment['timestamp'])
+                 for talk_id, comment in comments])
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+def _comment_from_row(row):
+    user_id, user_name, text, timestamp = row
+    return {'user_id': user_id, 'user_name': user_name, 'text': text, 'timestamp': timestamp}
+
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+def get_storage(path):
+    """Get the shared SQLiteStorage for a database file."""
+    with _storages_lock:
+        storage = _storages.get(path)
+        if storage is None:
+            storage = SQLiteStorage(path)
+            _storages[path] = storage
+        return storage
@@ -17,22 +17,573 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }, 5000);
     
-    // Rating form handling
+    // Rating form handling: sent as JSON, the plain form post is the fallback
     const ratingForm = document.getElementById('rating-form');
     if (ratingForm) {
         const ratingInputs = ratingForm.querySelectorAll('.rating-input');
         ratingInputs.forEach(input => {
             input.addEventListener('change', function() {
-                ratingForm.submit();
+                const firstVote = !document.getElementById('all-ratings');
+                const rating = parseInt(this.value, 10);
+                postJSON(ratingForm, {rating: rating, include_ratings: firstVote})
+                    .then(data => showRating(ratingForm, data))
+                    .catch(error => {
+                        if (!isOffline(error)) {
+                            ratingForm.submit();
+                            return;
+                        }
+                        queueItem({type: 'rating', talk_id: ratingForm.dataset.talkId, rating: rating});
+                        showRating(ratingForm, {success: true, rating: rating, message: OFFLINE_MESSAGE});
+                    });
             });
         });
     }
     
-    // Filter form handling
-    const topicFilter = document.getElementById('topic-filter');
-    if (topicFilter) {
-        topicFilter.addEventListener('change', function() {
-            document.getElementById('filter-form').submit();
+    // Comment form handling, same as the rating form
+    const commentForm = document.getElementById('comment-form');
+    if (commentForm) {
+        commentForm.addEventListener('submit', function(event) {
+            if (!window.fetch) {
+                return;
+            }
+            event.preventDefault();
+            const text = commentForm.elements['comment'].value;
+            postJSON(commentForm, {comment: text})
+                .then(data => showComment(commentForm, data))
+                .catch(error => {
+                    if (!isOffline(error) || !text.trim()) {
+                        commentForm.submit();
+                        return;
+                    }
+                    queueItem({type: 'comment', talk_id: commentForm.dataset.talkId, comment: text});
+                    showComment(commentForm, {success: true, comment: {user_name: 'Ausstehend', text: text}, message: OFFLINE_MESSAGE});
+                });
         });
     }
+    
+    // Offline support: cached pages and assets, queued votes are sent when online
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/sw.js').catch(() => {});
+    }
+    window.addEventListener('online', syncQueue);
+    if (navigator.onLine) {
+        syncQueue();
+    }
+    const logoutLink = document.getElementById('logout-link');
+    if (logoutLink) {
+        logoutLink.addEventListener('click', function() {
+            // The queue and the cached pages belong to the logged in user
+            localStorage.removeItem(SYNC_QUEUE_KEY);
+            if (navigator.serviceWorker && navigator.serviceWorker.controller) {
+                navigator.serviceWorker.controller.postMessage('clear-pages');
+            }
+        });
+    }
+    
+    // Filter form handling: filtered in the browser once the catalog is loaded,
+    // submitted to the server until then
+    const filterForm = document.getElementById('filter-form');
+    if (filterForm) {
+        initCatalogFilter(filterForm);
+    }
 });
+
+// Post data as JSON to a form's action. Resolves with the response data, also
+// for rejected input (success false); rejects if the JSON request itself
+// failed, e.g. offline or redirected to the login page.
+function postJSON(form, data) {
+    if (!window.fetch) {
+        return Promise.reject(new Error('fetch not supported'));
+    }
+    return fetch(form.action, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json', 'Accept': 'application/json'},
+        credentials: 'same-origin',
+        body: JSON.stringify(data)
+    }).then(response => {
+        const type = response.headers.get('Content-Type') || '';
+        if (response.redirected || type.indexOf('application/json') === -1) {
+            throw new Error('No JSON response');
+        }
+        return response.json();
+    });
+}
+
+// Show a message like the flashed messages of the server
+function showMessage(message, category) {
+    const container = document.getElementById('flash-messages');
+    if (!container) {
+        return;
+    }
+    const alert = document.createElement('div');
+    alert.className = 'alert alert-' + category + ' alert-dismissible fade show';
+    alert.setAttribute('role', 'alert');
+    alert.textContent = message;
+    const close = document.createElement('button');
+    close.type = 'button';
+    close.className = 'btn-close';
+    close.setAttribute('data-bs-dismiss', 'alert');
+    close.setAttribute('aria-label', 'Close');
+    alert.appendChild(close);
+    container.replaceChildren(alert);
+    setTimeout(function() {
+        bootstrap.Alert.getOrCreateInstance(alert).close();
+    }, 5000);
+}
+
+function ratingStars(rating, maxRating) {
+    let stars = '';
+    for (let i = 1; i <= maxRating; i++) {
+        stars += i <= rating ? '★' : '☆';
+    }
+    return stars + ' (' + rating + ')';
+}
+
+// Apply the new rating state returned by the server to the detail page
+function showRating(form, data) {
+    if (!data.success) {
+        showMessage(data.message, 'danger');
+        return;
+    }
+    const maxRating = parseInt(form.dataset.maxRating, 10);
+    const text = document.getElementById('rating-text');
+    if (text) {
+        const paragraph = document.createElement('p');
+        paragraph.className = 'text-success';
+        paragraph.textContent = 'Sie haben diesen Vortrag mit ' + data.rating + ' von ' + maxRating + ' Sternen bewertet.';
+        text.replaceChildren(paragraph);
+    }
+    
+    // First vote: show all ratings, which are only visible after voting
+    const template = document.getElementById('all-ratings-template');
+    if (template && data.ratings) {
+        const card = template.content.firstElementChild.cloneNode(true);
+        const body = card.querySelector('tbody');
+        data.ratings.forEach(rating => {
+            const row = body.insertRow();
+            if (rating.own) {
+                row.dataset.own = 'true';
+            }
+            row.insertCell().textContent = rating.user_name;
+            const cell = row.insertCell();
+            cell.dataset.field = 'rating';
+            cell.textContent = ratingStars(rating.rating, maxRating);
+        });
+        form.closest('.card').after(card);
+        template.remove();
+    }
+    
+    const own = document.querySelector('#all-ratings tr[data-own="true"] [data-field="rating"]');
+    if (own) {
+        own.textContent = ratingStars(data.rating, maxRating);
+    }
+    const count = document.getElementById('rating-count');
+    if (count && data.count !== undefined) {
+        count.textContent = data.count;
+    }
+    showMessage(data.message, 'success');
+}
+
+// Add the created comment to the list on the detail page
+function showComment(form, data) {
+    if (!data.success) {
+        showMessage(data.message, 'danger');
+        return;
+    }
+    const list = document.getElementById('comments-list');
+    if (list) {
+        const box = document.createElement('div');
+        box.className = 'comment-box';
+        const header = document.createElement('div');
+        header.className = 'comment-header';
+        const author = document.createElement('span');
+        author.className = 'comment-author';
+        author.textContent = data.comment.user_name;
+        header.appendChild(author);
+        const content = document.createElement('div');
+        content.className = 'comment-content';
+        content.textContent = data.comment.text;
+        box.append(header, content);
+        list.prepend(box);
+    }
+    const placeholder = document.getElementById('no-comments');
+    if (placeholder) {
+        placeholder.remove();
+    }
+    const count = document.getElementById('comment-count');
+    if (count && data.count !== undefined) {
+        count.textContent = data.count;
+    }
+    form.reset();
+    const charCount = document.getElementById('char-count');
+    if (charCount) {
+        charCount.textContent = 0;
+    }
+    showMessage(data.message, 'success');
+}
+
+// Ratings and comments made while offline, synced through /sync
+const SYNC_QUEUE_KEY = 'jfs-sync-queue';
+const OFFLINE_MESSAGE = 'Keine Verbindung: wird automatisch übertragen, sobald Sie wieder online sind.';
+
+// A failed fetch (rejected with a TypeError) means the network is unavailable
+function isOffline(error) {
+    return !navigator.onLine || error instanceof TypeError;
+}
+
+function loadQueue() {
+    try {
+        return JSON.parse(localStorage.getItem(SYNC_QUEUE_KEY)) || [];
+    } catch (e) {
+        return [];
+    }
+}
+
+// Queue an item with an idempotency key; a new rating replaces a queued one
+function queueItem(item) {
+    item.key = window.crypto && crypto.randomUUID ? crypto.randomUUID()
+        : Date.now().toString(36) + Math.random().toString(36).slice(2);
+    const queue = loadQueue().filter(queued => !(item.type === 'rating' && queued.type === 'rating'
+                                                 && queued.talk_id === item.talk_id));
+    queue.push(item);
+    localStorage.setItem(SYNC_QUEUE_KEY, JSON.stringify(queue));
+}
+
+// Send the queued items in one request; answered items are removed, the
+// others are kept for the next attempt (resending is safe thanks to the keys)
+function syncQueue() {
+    const queue = loadQueue();
+    if (!queue.length || !window.fetch || syncQueue.running) {
+        return;
+    }
+    syncQueue.running = true;
+    fetch('/sync', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json', 'Accept': 'application/json'},
+        credentials: 'same-origin',
+        body: JSON.stringify({items: queue})
+    }).then(response => {
+        const type = response.headers.get('Content-Type') || '';
+        if (!response.ok || response.redirected || type.indexOf('application/json') === -1) {
+            throw new Error('Sync failed');
+        }
+        return response.json();
+    }).then(data => {
+        const answered = new Set(data.results.map(result => result.key));
+        const pending = loadQueue().filter(item => !answered.has(item.key));
+        localStorage.setItem(SYNC_QUEUE_KEY, JSON.stringify(pending));
+        const failed = data.results.filter(result => !result.success);
+        if (failed.length) {
+            showMessage(failed[0].message, 'danger');
+        } else {
+            showMessage(data.results.length + ' offline gespeicherte Einträge übertragen.', 'success');
+        }
+    }).catch(() => {}).finally(() => {
+        syncQueue.running = false;
+    });
+}
+
+// Client-side catalog filtering. The catalog (/catalog.json) holds the talks
+// without abstracts and the search index of search.py; the functions below
+// reproduce TalkQuery and SearchIndex.search() in the browser.
+function initCatalogFilter(form) {
+    const state = {catalog: null, page: 1};
+    const userRatings = JSON.parse(form.dataset.userRatings || '{}');
+    const perPage = parseInt(form.dataset.perPage, 10) || 24;
+    const elements = form.elements;
+    let keywordTimer = null;
+    
+    function update(page) {
+        const sort = elements['sort'].value;
+        if (!state.catalog || sort === 'rating_count') {
+            // Rating counts change all the time and are not in the catalog
+            form.submit();
+            return;
+        }
+        state.page = page || 1;
+        renderCatalog(form, state.catalog, userRatings, {
+            topic: elements['topic'].value,
+            keyword: elements['keyword'].value.trim(),
+            rated: elements['rated'].value,
+            sort: sort
+        }, state.page, perPage, update);
+    }
+    
+    ['topic', 'rated', 'sort'].forEach(name => {
+        elements[name].addEventListener('change', () => update());
+    });
+    elements['keyword'].addEventListener('input', function() {
+        if (state.catalog) {
+            clearTimeout(keywordTimer);
+            keywordTimer = setTimeout(() => update(), 200);
+        }
+    });
+    form.addEventListener('submit', function(event) {
+        if (state.catalog) {
+            event.preventDefault();
+            update();
+        }
+    });
+    
+    // The browser revalidates its cached copy with the ETag
+    if (window.fetch) {
+        fetch(form.dataset.catalogUrl, {credentials: 'same-origin', cache: 'no-cache'})
+            .then(response => {
+                if (!response.ok || response.redirected) {
+                    throw new Error('Catalog not available');
+                }
+                return response.json();
+            })
+            .then(catalog => {
+                catalog.termMap = new Map(Object.entries(catalog.index.terms));
+                catalog.sortedTerms = Array.from(catalog.termMap.keys()).sort();
+                catalog.stopwords = new Set(catalog.index.stopwords);
+                state.catalog = catalog;
+            })
+            .catch(() => {});
+    }
+}
+
+// Run the filters and render one page of the matching talks
+function renderCatalog(form, catalog, userRatings, filters, page, perPage, showPage) {
+    let candidates = catalog.talks;
+    if (filters.keyword) {
+        const ranked = searchCatalog(catalog, filters.keyword);
+        if (ranked !== null) {
+            candidates = ranked.map(item => catalog.talks[item[0]]);
+        }
+    }
+    
+    // Topic counts reflect every filter except the topic itself
+    const topicCounts = {};
+    let matches = [];
+    candidates.forEach(talk => {
+        if (filters.rated && (talk.id in userRatings) !== (filters.rated === 'yes')) {
+            return;
+        }
+        if (talk.topicId) {
+            topicCounts[talk.topicId] = (topicCounts[talk.topicId] || 0) + 1;
+        }
+        if (filters.topic && talk.topicId !== filters.topic) {
+            return;
+        }
+        matches.push(talk);
+    });
+    if (filters.sort === 'title') {
+        const title = talk => (talk.title || '').toLowerCase();
+        matches.sort((a, b) => title(a) < title(b) ? -1 : title(a) > title(b) ? 1 : 0);
+    } else if (filters.sort === 'my_rating') {
+        matches.sort((a, b) => (userRatings[b.id] || 0) - (userRatings[a.id] || 0));
+    }
+    
+    const pages = Math.max(Math.ceil(matches.length / perPage), 1);
+    page = Math.min(page, pages);
+    const grid = document.getElementById('talk-grid');
+    const template = document.getElementById('talk-card-template');
+    grid.replaceChildren();
+    matches.slice((page - 1) * perPage, page * perPage).forEach(talk => {
+        grid.appendChild(talkCard(template, talk, userRatings[talk.id], catalog.max_rating, form.dataset.detailUrl));
+    });
+    if (!matches.length) {
+        const empty = document.createElement('div');
+        empty.className = 'col-12';
+        empty.innerHTML = '<div class="alert alert-info"><i class="bi bi-info-circle me-2"></i>Keine Vorträge gefunden, die den Filterkriterien entsprechen.</div>';
+        grid.appendChild(empty);
+    }
+    
+    form.querySelectorAll('option[data-topic]').forEach(option => {
+        option.textContent = option.dataset.topic + ' (' + (topicCounts[option.dataset.topic] || 0) + ')';
+    });
+    document.getElementById('filtered-count').textContent = matches.length;
+    renderActiveFilters(filters);
+    renderPagination(page, pages, showPage);
+    
+    // Keep the filters in the URL, so reloading and going back show the same talks
+    const params = new URLSearchParams({topic: filters.topic, keyword: filters.keyword,
+                                        rated: filters.rated, sort: filters.sort, page: page});
+    history.replaceState(null, '', form.action + '?' + params.toString());
+}
+
+function talkCard(template, talk, rating, maxRating, detailUrl) {
+    const card = template.content.firstElementChild.cloneNode(true);
+    ['topicId', 'languageId', 'title', 'teaser'].forEach(field => {
+        const element = card.querySelector('[data-field="' + field + '"]');
+        if (talk[field]) {
+            element.textContent = talk[field];
+        } else if (field === 'languageId') {
+            element.remove();
+        }
+    });
+    const stars = card.querySelector('[data-field="rating"]');
+    for (let i = 1; i <= maxRating; i++) {
+        const star = document.createElement('i');
+        star.className = rating && i <= rating ? 'bi bi-star-fill' : 'bi bi-star';
+        stars.append(star, ' ');
+    }
+    if (!rating) {
+        stars.classList.add('unrated');
+        const label = document.createElement('small');
+        label.className = 'text-muted ms-1';
+        label.textContent = 'Nicht bewertet';
+        stars.appendChild(label);
+    }
+    card.querySelector('[data-field="link"]').href = detailUrl.replace('__talk_id__', encodeURIComponent(talk.id));
+    return card;
+}
+
+function renderActiveFilters(filters) {
+    const container = document.getElementById('active-filters');
+    if (!container) {
+        return;
+    }
+    container.replaceChildren();
+    function badge(className, text) {
+        const span = document.createElement('span');
+        span.className = 'badge ' + className;
+        span.textContent = text;
+        container.append(span, ' ');
+    }
+    if (filters.topic) {
+        badge('bg-secondary', 'Topic: ' + filters.topic);
+    }
+    if (filters.keyword) {
+        badge('bg-info text-dark', 'Suche: ' + filters.keyword);
+    }
+    if (filters.rated === 'yes') {
+        badge('bg-success', 'Nur bewertete');
+    } else if (filters.rated === 'no') {
+        badge('bg-warning text-dark', 'Nur unbewertete');
+    }
+}
+
+function renderPagination(page, pages, showPage) {
+    const container = document.getElementById('talk-pagination');
+    if (!container) {
+        return;
+    }
+    container.replaceChildren();
+    if (pages <= 1) {
+        return;
+    }
+    const nav = document.createElement('nav');
+    nav.className = 'mb-4';
+    nav.setAttribute('aria-label', 'Seiten');
+    const list = document.createElement('ul');
+    list.className = 'pagination justify-content-center';
+    function item(label, target, active, disabled) {
+        const li = document.createElement('li');
+        li.className = 'page-item' + (active ? ' active' : '') + (disabled ? ' disabled' : '');
+        const link = document.createElement('a');
+        link.className = 'page-link';
+        link.href = '#';
+        link.innerHTML = label;
+        link.addEventListener('click', function(event) {
+            event.preventDefault();
+            showPage(target);
+            window.scrollTo(0, 0);
+        });
+        li.appendChild(link);
+        list.appendChild(li);
+    }
+    item('&laquo; Zurück', page - 1, false, page <= 1);
+    for (let p = 1; p <= pages; p++) {
+        item(String(p), p, p === page, false);
+    }
+    item('Weiter &raquo;', page + 1, false, page >= pages);
+    nav.appendChild(list);
+    container.appendChild(nav);
+}
+
+// Lowercase and fold umlauts, their ae/oe/ue spellings and ß like search.fold()
+function foldText(text) {
+    return text.toLowerCase().replace(/ß/g, 'ss')
+        .normalize('NFKD').replace(/\p{Mn}/gu, '')
+        .replace(/(?<=[a-z])([aou])e/g, '$1');
+}
+
+// Strip German inflection suffixes like search.stem()
+function stemWord(word) {
+    if (word.length <= 3 || /^\d+$/.test(word)) {
+        return word;
+    }
+    for (const suffix of ['ungen', 'ung']) {
+        if (word.endsWith(suffix) && word.length - suffix.length >= 4) {
+            word = word.slice(0, -suffix.length);
+            break;
+        }
+    }
+    while (true) {
+        if (word.length > 5 && ['em', 'er', 'nd'].includes(word.slice(-2))) {
+            word = word.slice(0, -2);
+        } else if (word.length > 4 && 'esn'.includes(word.slice(-1))) {
+            word = word.slice(0, -1);
+        } else {
+            return word;
+        }
+    }
+}
+
+// Return [position, score] pairs of the talks matching every query word,
+// best first, or null if the query has no searchable words
+function searchCatalog(catalog, query) {
+    const index = catalog.index;
+    const words = (foldText(query).match(/[\p{L}\p{N}]+/gu) || []).filter(word => !catalog.stopwords.has(word));
+    if (!words.length) {
+        return null;
+    }
+    const total = catalog.talks.length;
+    let scores = null;
+    for (const word of words) {
+        const term = stemWord(word);
+        const matches = new Map();
+        if (catalog.termMap.has(term)) {
+            matches.set(term, 1.0);
+        }
+        // Prefix matches in the sorted terms
+        let low = 0, high = catalog.sortedTerms.length;
+        while (low < high) {
+            const mid = (low + high) >> 1;
+            if (catalog.sortedTerms[mid] < term) {
+                low = mid + 1;
+            } else {
+                high = mid;
+            }
+        }
+        for (let i = low; i < catalog.sortedTerms.length && catalog.sortedTerms[i].startsWith(term); i++) {
+            if (!matches.has(catalog.sortedTerms[i])) {
+                matches.set(catalog.sortedTerms[i], index.prefix_factor);
+            }
+        }
+        
+        const wordScores = new Map();
+        matches.forEach((factor, matched) => {
+            const pairs = catalog.termMap.get(matched);
+            const count = pairs.length / 2;
+            const idf = Math.log(1 + (total - count + 0.5) / (count + 0.5));
+            for (let i = 0; i < pairs.length; i += 2) {
+                const position = pairs[i], tf = pairs[i + 1];
+                const norm = index.k1 * (1 - index.b + index.b * index.lengths[position] / (index.avg_length || 1));
+                const score = factor * idf * tf * (index.k1 + 1) / (tf + norm);
+                wordScores.set(position, (wordScores.get(position) || 0) + score);
+            }
+        });
+        
+        // Every query word has to match
+        if (scores === null) {
+            scores = wordScores;
+        } else {
+            const combined = new Map();
+            scores.forEach((score, position) => {
+                if (wordScores.has(position)) {
+                    combined.set(position, score + wordScores.get(position));
+                }
+            });
+            scores = combined;
+        }
+        if (!scores.size) {
+            return [];
+        }
+    }
+    return Array.from(scores.entries()).sort((a, b) => b[1] - a[1]);
+}
+
@@ -0,0 +1,87 @@
+// Service worker for JFS 2025 Bewertungsapp
+//
+// Keeps the app usable on an overloaded conference network: static assets
+// are served from the cache, pages (talk list and details) from the network
+// with the cached copy as fallback. Ratings and comments made while offline
+// are queued by scripts.js and sent to /sync once the network is back.
+
+// __STATIC_VERSION__ is replaced by a hash of the static files when served
+// from /sw.js, so changed assets install a new worker with new caches
+const CACHE_VERSION = 'jfs2025-v2-__STATIC_VERSION__';
+const STATIC_CACHE = CACHE_VERSION + '-static';
+const PAGE_CACHE = CACHE_VERSION + '-pages';
+
+const STATIC_ASSETS = [
+    '/static/css/styles.css',
+    '/static/js/scripts.js',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.0/font/bootstrap-icons.css'
+];
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(STATIC_CACHE)
+            .then(cache => cache.addAll(STATIC_ASSETS))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    // Drop the caches of older versions
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys
+                .filter(key => !key.startsWith(CACHE_VERSION))
+                .map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') {
+        return;
+    }
+    const url = new URL(request.url);
+
+    if (url.origin !== self.location.origin || url.pathname.startsWith('/static/')) {
+        // Static assets and fonts: cache first, fetched once
+        event.respondWith(
+            caches.match(request).then(cached => cached || fetch(request).then(response => {
+                if (response.ok) {
+                    const copy = response.clone();
+                    caches.open(STATIC_CACHE).then(cache => cache.put(request, copy));
+                }
+                return response;
+            }))
+        );
+        return;
+    }
+
+    if (isCatalogPage(url) && (request.mode === 'navigate' || url.pathname === '/catalog.json')) {
+        // Pages and the JSON catalog: network first, the last cached copy while offline
+        event.respondWith(
+            fetch(request).then(response => {
+                if (response.ok && !response.redirected) {
+                    const copy = response.clone();
+                    caches.open(PAGE_CACHE).then(cache => cache.put(request, copy));
+                }
+                return response;
+            }).catch(() => caches.match(request)
+                .then(cached => cached || caches.match('/')))
+        );
+    }
+});
+
+// The talk list, the talk detail pages and the JSON catalog, not login or admin pages
+function isCatalogPage(url) {
+    return url.pathname === '/' || url.pathname === '/catalog.json' || url.pathname.startsWith('/talk/');
+}
+
+// Sent by scripts.js on logout, the cached pages belong to the user
+self.addEventListener('message', event => {
+    if (event.data === 'clear-pages') {
+        event.waitUntil(caches.delete(PAGE_CACHE));
+    }
+});
@@ -0,0 +1,584 @@
+import json
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows: journal appends are only serialized within the process
+    fcntl = None
+
+# Process umask, for the permissions of newly created data files
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def clone_json(value):
+    """Return a deep copy of JSON-shaped data (dicts, lists and scalars)."""
+    if isinstance(value, dict):
+        return {k: clone_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [clone_json(v) for v in value]
+    return value
+
+
+def file_signature(path):
+    """Return (mtime_ns, size, inode) for a file, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def write_json(path, data, durable=True):
+    """Write data as indented JSON, the format used for all data files.
+    
+    The data goes to a temporary file in the same directory that is then
+    renamed over ``path``, so readers see either the old or the new file,
+    never a partial one. With durable=True the file and the directory
+    entry are fsynced. Returns the signature (see file_signature) of the
+    written file.
+    """
+    return _replace_file(path, lambda f: json.dump(data, f, indent=4, ensure_ascii=False), durable)
+
+
+def copy_file(src_path, dst_path, durable=True):
+    """Copy a text file, replacing ``dst_path`` atomically like write_json."""
+    with open(src_path, 'r', encoding='utf-8') as src:
+        return _replace_file(dst_path, lambda f: shutil.copyfileobj(src, f), durable)
+
+
+def _replace_file(path, write, durable):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        # mkstemp creates the file private; keep the permissions of the file it replaces
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        if hasattr(os, 'fchmod'):
+            os.fchmod(fd, mode)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            write(f)
+            f.flush()
+            if durable:
+                os.fsync(f.fileno())
+            # Renaming keeps the inode and mtime, so this is the signature of path
+            st = os.fstat(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if durable:
+        fsync_directory(directory)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def fsync_directory(directory):
+    """Persist the entries of a directory, e.g. after a rename into it."""
+    if not hasattr(os, 'O_DIRECTORY'):  # Not supported on Windows
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def locked_file(path):
+    """Hold an exclusive advisory lock on ``path`` across processes."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _derive_all(derived, data, builders, lock):
+    with lock:
+        result = {}
+        for name, build in builders.items():
+            value = derived.get(name)
+            if value is None:
+                value = build(data)
+                derived[name] = value
+            result[name] = value
+        return result
+
+
+class _CacheEntry:
+    __slots__ = ('signature', 'data', 'derived')
+
+    def __init__(self, signature, data, derived=None):
+        self.signature = signature
+        self.data = data
+        self.derived = derived if derived is not None else {}
+
+
+class FileCache:
+    """Process-wide cache of parsed JSON files, keyed by file path.
+
+    Every access compares the file's mtime, size and inode with the values
+    recorded when it was parsed, so changes made by other processes (or by
+    hand) are picked up on the next read. Cached data is shared between all
+    callers and must be treated as read-only.
+    
+    Structures derived from a file (indexes, aggregates) can be attached to
+    its entry with derive(); they live exactly as long as the parsed data.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path):
+        """Return the parsed content of ``path``, or None if it does not exist.
+
+        Raises the underlying exception if the file cannot be read or parsed;
+        nothing is cached in that case.
+        """
+        entry = self._load_entry(path)
+        return entry.data if entry is not None else None
+
+    def derive(self, path, name, build):
+        """Return the structure ``name`` derived from the content of ``path``.
+        
+        It is built with build(data) on first use and dropped together with
+        the cached data when the file changes. A missing file counts as {}.
+        """
+        return self.load_derived(path, {name: build})[1][name]
+
+    def load_derived(self, path, builders):
+        """Return (data, derived) for ``path``, both taken from the same cache entry.
+        
+        ``builders`` maps names to build functions as for derive(). Use this
+        instead of separate load() and derive() calls when the data and the
+        derived structures have to match, e.g. before an update. data is None
+        if the file does not exist.
+        """
+        entry = self._load_entry(path)
+        if entry is None:
+            return None, {name: build({}) for name, build in builders.items()}
+        return entry.data, _derive_all(entry.derived, entry.data, builders, self._lock)
+
+    def store(self, path, data, derived=None, signature=None):
+        """Cache data that was just written to ``path``.
+        
+        ``derived`` maps names to derived structures the caller has already
+        updated for the new data; all others are rebuilt on next use. The
+        stored object is shared from now on, so the caller must not modify it.
+        ``signature`` is the one returned by write_json; without it the file
+        is stat'ed, which can pick up a newer write by another process.
+        """
+        if signature is None:
+            signature = file_signature(path)
+        with self._lock:
+            if signature is None:
+                self._entries.pop(path, None)
+            else:
+                self._entries[path] = _CacheEntry(signature, data, dict(derived or {}))
+
+    def _load_entry(self, path):
+        signature = file_signature(path)
+        if signature is None:
+            self.invalidate(path)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.signature == signature:
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            # Take the signature from the open file so it matches the parsed content
+            st = os.fstat(f.fileno())
+            data = json.load(f)
+
+        entry = _CacheEntry((st.st_mtime_ns, st.st_size, st.st_ino), data)
+        with self._lock:
+            self._entries[path] = entry
+        return entry
+
+    def invalidate(self, path=None):
+        """Drop the cached entry for ``path``, or all entries if no path is given."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    def stats(self):
+        """Return hit/miss counters and the number of cached files."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries)
+            }
+
+    def reset_stats(self):
+        """Reset the hit/miss counters."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+# Shared cache used by all JSONStorageModel subclasses
+file_cache = FileCache()
+
+
+class JournaledDocument:
+    """A JSON snapshot file plus an append-only journal of changes to it.
+    
+    Each change is appended to the journal as one compact JSON line, so a
+    write costs the same no matter how large the document is. Loading
+    replays the journal tail on top of the snapshot; only records appended
+    since the last load are read. Once the journal holds ``compact_threshold``
+    records it is folded into the snapshot and replaced by an empty file.
+    
+    ``apply_record(data, record)`` applies one record to the document in
+    place and returns whatever the caller of append() should get back. It
+    must be idempotent for a replayed journal suffix, because a crash during
+    compaction can leave records that are already part of the snapshot.
+    
+    Derived structures work as in FileCache. Records replayed from the
+    journal drop them; after its own append() the caller updates them.
+    
+    append() returns once the record is fsynced. Appends that arrive while
+    an fsync is pending share the next one; with ``fsync_window`` seconds
+    the syncing thread first waits that long for more appends to join.
+    ``fsync_window=None`` leaves flushing to the operating system.
+    """
+
+    def __init__(self, snapshot_path, journal_path, apply_record, compact_threshold=1000, fsync_window=0.0):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.lock_path = journal_path + '.lock'
+        self.compact_threshold = compact_threshold
+        self._apply_record = apply_record
+        self._lock = threading.RLock()
+        self._data = None
+        self._snapshot_signature = None
+        self._journal_inode = None
+        self._offset = 0
+        self.records = 0
+        self._derived = {}
+        self.fsync_window = fsync_window
+        self._sync_lock = threading.Lock()
+        self._synced = (None, 0)
+        self.fsyncs = 0
+
+    def load(self):
+        """Return the current document; shared, so it must be treated as read-only."""
+        with self._lock:
+            self._refresh()
+            return self._data
+
+    def load_derived(self, builders):
+        """Return (data, derived) as FileCache.load_derived() does."""
+        with self._lock:
+            self._refresh()
+            return self._data, _derive_all(self._derived, self._data, builders, self._lock)
+
+    def append(self, record):
+        """Append a record to the journal and apply it to the document."""
+        return self.append_many([record])[0]
+
+    def append_many(self, records):
+        """Append several records with one write and one fsync; return their results."""
+        lines = b''.join((json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n').encode('utf-8')
+                         for record in records)
+        with self._lock, locked_file(self.lock_path):
+            self._refresh()
+            os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+            with open(self.journal_path, 'ab') as f:
+                f.write(lines)
+                f.flush()
+                self._offset = f.tell()
+                self._journal_inode = os.fstat(f.fileno()).st_ino
+            written = (self._journal_inode, self._offset)
+            self.records += len(records)
+            results = [self._apply_record(self._data, record) for record in records]
+
+            if self.compact_threshold and self.records >= self.compact_threshold:
+                # The new snapshot is durable and contains the records
+                self._write_snapshot(self._data)
+                written = None
+        if written is not None and self.fsync_window is not None:
+            self._sync(*written)
+        return results
+
+    def _sync(self, inode, offset):
+        """Fsync the journal up to ``offset``, unless another append already did."""
+        with self._sync_lock:
+            synced_inode, synced_offset = self._synced
+            if synced_inode == inode and synced_offset >= offset:
+                return
+            if self.fsync_window:
+                # Let appends arriving meanwhile be covered by the same fsync
+                time.sleep(self.fsync_window)
+            try:
+                with open(self.journal_path, 'rb') as f:
+                    st = os.fstat(f.fileno())
+                    if st.st_ino != inode:
+                        return  # Compacted meanwhile; the snapshot is durable
+                    os.fsync(f.fileno())
+                self._synced = (inode, st.st_size)
+                self.fsyncs += 1
+            except FileNotFoundError:
+                pass
+
+    def compact(self):
+        """Fold the journal into the snapshot file."""
+        with self._lock, locked_file(self.lock_path):
+            self._refresh()
+            self._write_snapshot(self._data)
+
+    def replace(self, data):
+        """Replace the whole document, discarding the journal."""
+        with self._lock, locked_file(self.lock_path):
+            self._write_snapshot(data)
+            # Re-read on next access so the caller's object is not shared
+            self._data = None
+            self._derived = {}
+
+    def invalidate(self):
+        """Forget the loaded document so the next access re-reads it."""
+        with self._lock:
+            self._data = None
+            self._derived = {}
+
+    def _write_snapshot(self, data):
+        self._snapshot_signature = write_json(self.snapshot_path, data)
+
+        # Start a new journal file instead of truncating the old one, so other
+        # processes notice the inode change and do not replay from a stale offset
+        tmp_path = self.journal_path + '.new'
+        open(tmp_path, 'wb').close()
+        os.replace(tmp_path, self.journal_path)
+        fsync_directory(os.path.dirname(self.journal_path))
+        self._journal_inode = os.stat(self.journal_path).st_ino
+        self._offset = 0
+        self.records = 0
+
+    def _refresh(self):
+        journal_signature = file_signature(self.journal_path)
+        journal_inode = journal_signature[2] if journal_signature else None
+        journal_size = journal_signature[1] if journal_signature else 0
+
+        if (self._data is None
+                or file_signature(self.snapshot_path) != self._snapshot_signature
+                or journal_inode != self._journal_inode
+                or journal_size < self._offset):
+            self._read_snapshot()
+            self._journal_inode = journal_inode
+
+        if journal_size > self._offset:
+            self._replay()
+
+    def _read_snapshot(self):
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8', errors='ignore') as f:
+                st = os.fstat(f.fileno())
+                data = json.load(f)
+            self._snapshot_signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            data = {}
+            self._snapshot_signature = None
+        self._data = data
+        self._derived = {}
+        self._offset = 0
+        self.records = 0
+
+    def _replay(self):
+        with open(self.journal_path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read()
+
+        # A record without its newline is still being written; leave it for later
+        end = chunk.rfind(b'\n') + 1
+        if end:
+            self._derived = {}
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logging.warning(f"Skipping corrupt journal record in {self.journal_path}: {line[:80]!r}")
+                continue
+            self._apply_record(self._data, record)
+            self.records += 1
+        self._offset += end
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(snapshot_path, journal_path, apply_record, compact_threshold=1000, fsync_window=0.0):
+    """Get the shared JournaledDocument for a snapshot/journal pair."""
+    key = (snapshot_path, journal_path)
+    with _journals_lock:
+        journal = _journals.get(key)
+        if journal is None:
+            journal = JournaledDocument(snapshot_path, journal_path, apply_record, compact_threshold, fsync_window)
+            _journals[key] = journal
+        journal.compact_threshold = compact_threshold
+        journal.fsync_window = fsync_window
+        return journal
+
+
+class WriteQueue:
+    """Single writer for one JSON file that batches concurrent changes.
+    
+    Callers submit mutations and get a Future back. A background thread
+    applies all mutations waiting in the queue, in order, to one copy of
+    the current data, writes the file once per batch and then resolves the
+    futures, so a burst of writes costs one rewrite instead of one each.
+    Writers in other processes take turns through an exclusive lock on
+    ``path + '.lock'`` and always start from the current file content, so
+    no update is lost.
+    
+    A mutation is mutate(data, derived) -> (result, on_saved). It changes
+    ``data`` in place and must raise, if at all, before changing anything.
+    ``derived`` holds the structures built by the ``builders`` passed to
+    submit(), still matching the old data; the optional on_saved(derived)
+    callback runs after the write to bring them up to date. A structure may
+    be missing if an earlier mutation of the batch replaced the data. An
+    error in on_saved() drops the cached file instead of failing the write,
+    which has already succeeded.
+    
+    ``batch_window`` makes the writer wait that many seconds for more
+    mutations after the first one; without it a batch is whatever arrived
+    while the previous one was written. ``context`` is an optional
+    factory of a context manager each batch runs in (e.g. an app context).
+    ``on_flush(data, derived)`` is called after each written batch, once
+    the derived structures are current and still holding the file lock, but
+    not the cache lock; its errors are logged, the batch counts as written.
+    """
+
+    def __init__(self, path, batch_window=0.0, context=None, cache=None, on_flush=None):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.batch_window = batch_window
+        self.context = context
+        self.on_flush = on_flush
+        self.cache = cache or file_cache
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.writes = 0
+
+    def submit(self, mutate, builders=None):
+        """Queue a mutation and return a Future for its result."""
+        future = Future()
+        with self._cond:
+            self._pending.append((mutate, builders or {}, future))
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name=f"writer:{os.path.basename(self.path)}",
+                                                daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            if self.batch_window:
+                time.sleep(self.batch_window)
+            with self._cond:
+                batch, self._pending = self._pending, []
+            try:
+                self._flush(batch)
+            except BaseException as e:
+                logging.error(f"Error writing {self.path}: {str(e)}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _flush(self, batch):
+        builders = {}
+        for _, mutation_builders, _ in batch:
+            builders.update(mutation_builders)
+
+        context = self.context() if self.context is not None else nullcontext()
+        with context, locked_file(self.lock_path):
+            data, derived = self.cache.load_derived(self.path, builders)
+            data = clone_json(data) if data is not None else {}
+
+            applied = []
+            for mutate, _, future in batch:
+                try:
+                    result, on_saved = mutate(data, derived)
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+                applied.append((future, result, on_saved))
+            if not applied:
+                return
+
+            signature = write_json(self.path, data)
+            self.cache.store(self.path, data, derived, signature)
+            for _, _, on_saved in applied:
+                if on_saved is None:
+                    continue
+                try:
+                    on_saved(derived)
+                except Exception as e:
+                    # The data is saved; only the derived structures are off,
+                    # so they are dropped and built again on the next read
+                    logging.error(f"Error updating structures derived from {self.path}: {str(e)}")
+                    self.cache.invalidate(self.path)
+            if self.on_flush is not None:
+                try:
+                    self.on_flush(data, derived)
+                except Exception as e:
+                    logging.error(f"Error after writing {self.path}: {str(e)}")
+        self.batches += 1
+        self.writes += len(applied)
+        for future, result, _ in applied:
+            future.set_result(result)
+
+
+_write_queues = {}
+_write_queues_lock = threading.Lock()
+
+
+def get_write_queue(path, batch_window=0.0, context=None, on_flush=None):
+    """Get the shared WriteQueue for a file."""
+    with _write_queues_lock:
+        queue = _write_queues.get(path)
+        if queue is None:
+            queue = WriteQueue(path, batch_window, context)
+            _write_queues[path] = queue
+        queue.batch_window = batch_window
+        queue.context = context
+        queue.on_flush = on_flush
+        return queue
@@ -1,10 +1,21 @@
 import unittest
+import unittest.mock
 import os
+import gzip
+import io
 import json
+import math
 import tempfile
+import time
 import shutil
 from app import create_app
-from models import Talk, Speaker, User, Rating, Comment
+from flask import session
+from models import Talk, TalkQuery, Speaker, User, Rating, Comment, RatingAggregates, UserIdentityMap
+from storage import file_cache
+from search import SearchIndex, fold, stem
+from rating_matrix import RatingMatrix
+from events import EventBroker
+from fragments import FragmentCache, fragment_cache
 
 class TestJFSRatingApp(unittest.TestCase):
     """Test cases for the JFS 2025 Rating App."""
@@ -25,6 +36,8 @@ class TestJFSRatingApp(unittest.TestCase):
         self.app.config['USERS_FILE'] = os.path.join(self.test_dir, 'users.json')
         self.app.config['RATINGS_FILE'] = os.path.join(self.test_dir, 'ratings.json')
         self.app.config['COMMENTS_FILE'] = os.path.join(self.test_dir, 'comments.json')
+        self.app.config['RATINGS_AGGREGATES_FILE'] = os.path.join(self.test_dir, 'rating_aggregates.json')
+        self.app.config['SYNC_KEYS_FILE'] = os.path.join(self.test_dir, 'sync_keys.json')
         self.app.config['LOG_DIR'] = os.path.join(self.test_dir, 'logs')
         self.app.config['RATING_LOG_FILE'] = os.path.join(self.app.config['LOG_DIR'], 'ratings.log')
         
@@ -120,6 +133,35 @@ class TestJFSRatingApp(unittest.TestCase):
         with open(self.app.config['COMMENTS_FILE'], 'w') as f:
             json.dump({}, f)
     
+    def test_user_get_many(self):
+        """Test resolving several users at once."""
+        user, _ = User.create("Second User", "second@example.com")
+        users = User.get_many(["user1", user.id, "missing"])
+        self.assertEqual(set(users), {"user1", user.id})
+        self.assertEqual(users[user.id].name, "Second User")
+        self.assertEqual(User.get_names(["user1", "missing"], default="?"), {"user1": "Test User", "missing": "?"})
+    
+    def test_user_identity_map(self):
+        """Test the cached user loader and its invalidation."""
+        user, _ = User.create("Cached User", "cached@example.com")
+        cached = User.load_cached(user.id)
+        self.assertEqual(cached.name, "Cached User")
+        self.assertIs(User.load_cached(user.id), cached)
+        
+        new_token, _ = User.regenerate_token(user.id)
+        self.assertEqual(User.load_cached(user.id).token, new_token)
+        
+        User.delete(user.id)
+        self.assertIsNone(User.load_cached(user.id))
+        
+        # Least recently used entries are evicted
+        identity_map = UserIdentityMap(max_size=2)
+        for user_id in ("a", "b", "c"):
+            identity_map.put(user_id, 1, user_id)
+        self.assertIsNone(identity_map.get("a", 1))
+        self.assertEqual(identity_map.get("c", 1), "c")
+        self.assertIsNone(identity_map.get("c", 2))
+    
     def test_talk_model(self):
         """Test Talk model functionality."""
         # Test get_all
@@ -185,6 +227,30 @@ class TestJFSRatingApp(unittest.TestCase):
         self.assertTrue(success)
         self.assertIsNone(error)
     
+    def test_user_index(self):
+        """Test token and email lookups through the user index."""
+        user, token = User.create("Index User", "Index@Example.com")
+        self.assertEqual(User.get_by_token(token).id, user.id)
+        
+        # Email uniqueness is case-insensitive
+        self.assertIsNone(User.create("Other", "index@example.COM")[0])
+        
+        # Regenerating revokes the old token
+        new_token, error = User.regenerate_token(user.id)
+        self.assertIsNone(User.get_by_token(token))
+        self.assertEqual(User.get_by_token(new_token).id, user.id)
+        
+        User.delete(user.id)
+        self.assertIsNone(User.get_by_token(new_token))
+        self.assertIsNotNone(User.create("Index User", "index@example.com")[0])
+        
+        # Changes to users.json made elsewhere rebuild the index
+        users = User.load_all()
+        users["user2"] = {"name": "External", "email": "ext@example.com", "token": "e" * 32}
+        with open(self.app.config['USERS_FILE'], 'w') as f:
+            json.dump(users, f)
+        self.assertEqual(User.get_by_token("e" * 32).id, "user2")
+    
     def test_rating_model(self):
         """Test Rating model functionality."""
         # Test set_rating
@@ -205,6 +271,370 @@ class TestJFSRatingApp(unittest.TestCase):
         avg_ratings = Rating.get_average_ratings()
         self.assertEqual(avg_ratings["1"], 5)
     
+    def test_atomic_write(self):
+        """Test atomic data file writes and grouped journal fsyncs."""
+        import threading
+        from storage import write_json, file_signature, JournaledDocument
+        path = os.path.join(self.test_dir, 'atomic.json')
+        signature = write_json(path, {"a": 1})
+        self.assertEqual(signature, file_signature(path))
+        self.assertEqual(write_json(path, {"a": 2}, durable=False)[2], file_signature(path)[2])
+        with open(path) as f:
+            self.assertEqual(json.load(f), {"a": 2})
+        self.assertEqual(os.listdir(self.test_dir).count('atomic.json'), 1)
+        self.assertFalse([name for name in os.listdir(self.test_dir) if name.endswith('.tmp')])
+        
+        # Appends arriving during the fsync window share one fsync
+        journal = JournaledDocument(path, path + '.journal', lambda data, record: data.update(record),
+                                    compact_threshold=0, fsync_window=0.05)
+        threads = [threading.Thread(target=journal.append, args=({str(i): i},)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(journal.load()), 9)
+        self.assertLess(journal.fsyncs, 8)
+    
+    def test_write_queue(self):
+        """Test that concurrent rating and comment writes are batched without losing any."""
+        import threading
+        self.app.config['WRITE_BATCH_WINDOW'] = 0.05
+        
+        def vote(i):
+            with self.app.app_context():
+                Rating.set_rating(f"user{i}", str(i % 2 + 1), i % 5 + 1)
+                Comment.add_comment("1", f"user{i}", "Test User", f"Comment {i}")
+        
+        threads = [threading.Thread(target=vote, args=(i,)) for i in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(Rating.load_all()), 12)
+        self.assertEqual(len(Comment.get_for_talk("1")), 12)
+        self.assertEqual(sum(Rating.get_rating_counts().values()), 12)
+        queue = Rating.get_write_queue()
+        self.assertEqual(queue.writes, 12)
+        self.assertLess(queue.batches, 12)
+        
+        # A failing mutation is reported to its caller only
+        def fail(data, derived):
+            raise ValueError("rejected")
+        with self.assertRaises(ValueError):
+            Comment.apply_write(fail)
+        self.assertEqual(Comment.add_comment("2", "user1", "Test User", "Still works"), (True, None))
+        
+        # Users are written by the same writer; duplicates in one batch are caught
+        def register(i):
+            with self.app.app_context():
+                User.create(f"User {i}", f"same{i % 3}@example.com")
+        
+        threads = [threading.Thread(target=register, args=(i,)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        emails = sorted(user['email'] for user in User.load_all().values())
+        self.assertEqual([email for email in emails if email.startswith('same')],
+                         ["same0@example.com", "same1@example.com", "same2@example.com"])
+        # save_all() goes through the writer too
+        self.assertTrue(User.save_all(User.load_all()))
+        self.assertEqual(User.get_write_queue().writes, 7)
+        
+        # A callback error after the write does not fail the saved change
+        def broken(data, derived):
+            data["broken"] = []
+            return "saved", lambda derived: derived['missing'].update()
+        self.assertEqual(Comment.apply_write(broken), "saved")
+        self.assertIn("broken", Comment.load_all())
+        
+        # A user added in the same batch as a whole-file save keeps its result
+        created, saved = [], []
+        def replace():
+            with self.app.app_context():
+                saved.append(User.save_all(User.load_all()))
+        def create():
+            with self.app.app_context():
+                time.sleep(0.05)
+                created.append(User.create("Batched", "batched@example.com")[0])
+        self.app.config['WRITE_BATCH_WINDOW'] = 0.2
+        batches = User.get_write_queue().batches
+        threads = [threading.Thread(target=replace), threading.Thread(target=create)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((saved, User.get_write_queue().batches), ([True], batches + 1))
+        self.assertIsNotNone(created[0])
+        self.assertEqual(User.get_by_token(created[0].token).id, created[0].id)
+    
+    def test_rating_journal(self):
+        """Test journal storage for ratings."""
+        self.app.config['RATINGS_STORAGE'] = 'journal'
+        self.app.config['RATINGS_JOURNAL_FILE'] = os.path.join(self.test_dir, 'ratings.journal')
+        self.app.config['RATINGS_JOURNAL_COMPACT_THRESHOLD'] = 3
+        
+        # Votes are appended to the journal, not written to ratings.json
+        self.assertEqual(Rating.set_rating("user1", "1", 4), (True, None))
+        self.assertEqual(Rating.set_rating("user1", "2", 2), (True, None))
+        with open(self.app.config['RATINGS_FILE']) as f:
+            self.assertEqual(json.load(f), {})
+        self.assertEqual(Rating.get_for_user("user1"), {"1": 4, "2": 2})
+        
+        # Records appended by another process are replayed on the next load
+        with open(self.app.config['RATINGS_JOURNAL_FILE'], 'a') as f:
+            f.write(json.dumps({"op": "set", "u": "user2", "t": "1", "r": 5}) + "\n")
+        self.assertEqual(Rating.get_for_talk("1"), {"user1": 4, "user2": 5})
+        
+        # Reaching the threshold folds the journal into the snapshot
+        self.assertEqual(Rating.set_rating("user1", "1", 3), (True, None))
+        with open(self.app.config['RATINGS_FILE']) as f:
+            self.assertEqual(json.load(f), {"user1": {"1": 3, "2": 2}, "user2": {"1": 5}})
+        self.assertEqual(os.path.getsize(self.app.config['RATINGS_JOURNAL_FILE']), 0)
+        
+        self.assertTrue(Rating.delete_for_user("user2"))
+        self.assertEqual(Rating.get_for_talk("1"), {"user1": 3})
+    
+    def test_sqlite_backend(self):
+        """Test the SQLite storage backend."""
+        from sqlite_storage import get_storage
+        self.app.config['STORAGE_BACKEND'] = 'sqlite'
+        self.app.config['SQLITE_DATABASE'] = os.path.join(self.test_dir, 'test.sqlite3')
+        
+        # Import the JSON test data
+        counts = get_storage(self.app.config['SQLITE_DATABASE']).import_json({
+            'talks': self.app.config['TALKS_FILE'],
+            'speakers': self.app.config['SPEAKERS_FILE'],
+            'users': self.app.config['USERS_FILE']
+        })
+        self.assertEqual(counts, {'talks': 2, 'speakers': 2, 'users': 1})
+        
+        self.assertEqual(Talk.get_by_id("2")['title'], "Test Talk 2")
+        self.assertEqual(len(Talk.get_by_topic("Java")), 1)
+        self.assertEqual(Speaker.get_sanitized("101")['firstName'], "John")
+        self.assertEqual(User.get_by_id("user1").name, "Test User")
+        
+        user, token = User.create("New User", "new@example.com")
+        self.assertEqual(User.get_by_token(token).id, user.id)
+        self.assertEqual(User.create("Other", "new@example.com")[0], None)
+        self.assertEqual(User.get_names(["user1", user.id, "missing"]),
+                         {"user1": "Test User", user.id: "New User", "missing": "Unknown"})
+        
+        Rating.set_rating("user1", "1", 4)
+        Rating.set_rating(user.id, "1", 2)
+        Rating.set_rating("user1", "1", 5)
+        self.assertEqual(Rating.get_for_talk("1"), {"user1": 5, user.id: 2})
+        self.assertEqual(Rating.get_average_ratings(), {"1": 3.5})
+        
+        # Deleting a user also deletes their ratings
+        self.assertEqual(User.delete(user.id), (True, None))
+        self.assertEqual(Rating.load_all(), {"user1": {"1": 5}})
+        
+        Comment.add_comment("1", "user1", "Test User", "SQLite comment")
+        self.assertEqual(Comment.get_for_talk("1")[0]['text'], "SQLite comment")
+        
+        # The analytics are reused until a table changes, not rebuilt per load
+        analytics = Rating.get_analytics()
+        self.assertIs(Rating.get_analytics(), analytics)
+        Rating.set_rating("user1", "1", 2)
+        self.assertEqual(Rating.get_analytics().get("1")['mean'], 2.0)
+        self.assertEqual(Rating.get_analytics().matrix.for_talk("1"), {"user1": 2})
+        index = Talk.get_search_index()
+        self.assertIs(Talk.get_search_index(), index)
+        self.assertEqual(list(Talk.search("smith")), ["2"])
+        self.assertIs(Talk.get_catalog()[0], Talk.get_catalog()[0])
+        
+        # The JSON files are left untouched
+        with open(self.app.config['RATINGS_FILE']) as f:
+            self.assertEqual(json.load(f), {})
+    
+    def test_talk_ratings_index(self):
+        """Test that the per-talk ratings follow rating changes."""
+        Rating.set_rating("user1", "1", 3)
+        Rating.set_rating("user2", "1", 4)
+        Rating.set_rating("user2", "2", 1)
+        for i in range(50):
+            Rating.set_rating(f"other{i}", "2", 5)
+        matrix = Rating.get_index('matrix')
+        self.assertEqual(Rating.get_for_talk("1"), {"user1": 3, "user2": 4})
+        
+        # Only the rated rows are read, not those of all users
+        self.assertEqual(len(matrix.column_rows[matrix.talk_columns["1"]]), 2)
+        with unittest.mock.patch.object(RatingMatrix, 'column', side_effect=AssertionError("full column scan")):
+            self.assertEqual(Rating.get_for_talk("1"), {"user1": 3, "user2": 4})
+        
+        # Updated in place, not rebuilt
+        Rating.set_rating("user1", "1", 5)
+        self.assertIs(Rating.get_index('matrix'), matrix)
+        self.assertEqual(Rating.get_for_talk("1"), {"user1": 5, "user2": 4})
+        
+        Rating.delete_for_user("user2")
+        self.assertEqual(Rating.get_for_talk("1"), {"user1": 5})
+        self.assertEqual(len(Rating.get_for_talk("2")), 50)
+        self.assertEqual(Rating.get_for_talk("3"), {})
+        self.assertEqual(Rating.get_rating_counts(), {"1": 1, "2": 50})
+        
+        # The rated rows always match a full rebuild
+        rebuilt = RatingMatrix(Rating.load_all())
+        for talk_id in ("1", "2"):
+            self.assertEqual(matrix.for_talk(talk_id), rebuilt.for_talk(talk_id))
+            self.assertEqual(matrix.for_talk(talk_id), {user_id: ratings[talk_id] for user_id, ratings
+                                                         in Rating.load_all().items() if talk_id in ratings})
+    
+    def test_rating_matrix(self):
+        """Test the compact rating matrix with and without NumPy."""
+        import rating_matrix
+        ratings = {"u1": {"1": 3, "2": 5}, "u2": {"1": 4}}
+        ratings["u3"] = {str(talk_id): talk_id % 5 + 1 for talk_id in range(3, 40)}
+        
+        numpy = rating_matrix.numpy
+        try:
+            for rating_matrix.numpy in {numpy, None}:
+                matrix = RatingMatrix(ratings)
+                self.assertEqual(matrix.for_user("u1"), {"1": 3, "2": 5})
+                self.assertEqual(matrix.for_talk("1"), {"u1": 3, "u2": 4})
+                self.assertEqual(matrix.averages()["1"], 3.5)
+                self.assertEqual(matrix.counts(), {talk_id: sum(talk_id in r for r in ratings.values())
+                                                   for talk_id in matrix.talk_ids})
+                
+                # Growing past the allocated columns keeps all ratings
+                matrix.set_rating("u4", "new", 2, None)
+                matrix.remove_user("u2", ratings["u2"])
+                self.assertEqual(matrix.for_talk("1"), {"u1": 3})
+                self.assertEqual(matrix.for_user("u3"), ratings["u3"])
+                self.assertEqual(matrix.for_user("u4"), {"new": 2})
+        finally:
+            rating_matrix.numpy = numpy
+        
+        # Kept current as a derived rating structure
+        Rating.set_rating("user1", "1", 3)
+        Rating.set_rating("user2", "1", 5)
+        self.assertEqual(Rating.get_matrix().averages(), {"1": 4.0})
+    
+    def test_rating_analytics(self):
+        """Test the per-talk and per-topic statistics with and without NumPy."""
+        import analytics
+        ratings = {"u1": {"1": 1, "2": 4}, "u2": {"1": 2}, "u3": {"1": 5}, "u4": {"1": 4}}
+        talks = {"1": {"topicId": "Java"}, "2": {"topicId": "Spring"}, "3": {"topicId": "Java"}}
+        
+        numpy = analytics.numpy
+        try:
+            for analytics.numpy in {numpy, None}:
+                result = analytics.RatingAnalytics(RatingMatrix(ratings), talks)
+                stats = result.get("1")
+                self.assertEqual((stats['count'], stats['mean'], stats['median']), (4, 3.0, 3.0))
+                self.assertAlmostEqual(stats['std'], 1.5811388, places=6)
+                self.assertEqual(stats['histogram'], [1, 1, 0, 1, 1])
+                self.assertEqual(result.get("3")['count'], 0)
+                self.assertEqual(result.counts(), {"1": 4, "2": 1})
+                self.assertEqual(result.topics["Java"]['talks'], 2)
+                self.assertEqual(result.topics["Java"]['rated_talks'], 1)
+                self.assertEqual(result.topics["Spring"]['median'], 4.0)
+        finally:
+            analytics.numpy = numpy
+        
+        # Cached until the ratings change
+        Rating.set_rating("user1", "1", 4)
+        cached = Rating.get_analytics()
+        self.assertIs(Rating.get_analytics(), cached)
+        Rating.set_rating("user2", "1", 2)
+        self.assertEqual(Rating.get_analytics().get("1")['mean'], 3.0)
+
+    def test_rating_rankings(self):
+        """Test the ranking modes with and without NumPy."""
+        import analytics
+        # u1 rates harshly, u3 gives a single rating
+        ratings = {"u1": {"1": 2, "2": 1}, "u2": {"1": 5, "2": 4, "3": 5}, "u3": {"3": 5}}
+        talks = {"1": {}, "2": {}, "3": {}}
+
+        numpy = analytics.numpy
+        try:
+            for analytics.numpy in {numpy, None}:
+                result = analytics.RatingAnalytics(RatingMatrix(ratings), talks)
+                self.assertEqual(result.ranking('average'), ["3", "1", "2"])
+                self.assertEqual(result.ranking('zscore'), ["1", "3", "2"])
+                self.assertAlmostEqual(result.scores('zscore')["1"], (1 + 1 / math.sqrt(2)) / 2)
+                self.assertAlmostEqual(result.scores('bayesian')["3"], 13 / 3)
+                self.assertLess(result.scores('wilson')["3"], 5)
+                self.assertEqual(result.confidence_intervals()["3"], (5.0, 5.0))
+                low, high = result.confidence_intervals()["1"]
+                self.assertTrue(2 <= low < 3.5 < high <= 5)
+                self.assertEqual(result.scores('bootstrap')["1"], low)
+                self.assertEqual(analytics.RatingAnalytics(RatingMatrix(ratings), talks, prior_weight=0)
+                                 .scores('bayesian'), result.averages())
+                with self.assertRaises(ValueError):
+                    result.scores('unknown')
+        finally:
+            analytics.numpy = numpy
+
+        # Scores are kept with the analytics until the ratings change
+        Rating.set_rating("user1", "1", 4)
+        scores = Rating.get_analytics().scores('wilson')
+        self.assertIs(Rating.get_analytics().scores('wilson'), scores)
+
+    def test_rating_aggregates(self):
+        """Test the running per-talk rating aggregates."""
+        Rating.set_rating("user1", "1", 3)
+        Rating.set_rating("user2", "1", 5)
+        Rating.set_rating("user1", "1", 4)
+        aggregates = Rating.get_aggregates()
+        self.assertEqual(aggregates.get("1")['sum'], 9)
+        self.assertEqual(aggregates.histogram("1", 5), [0, 0, 0, 1, 1])
+        self.assertEqual(Rating.get_average_ratings(), {"1": 4.5})
+        
+        Rating.delete_for_user("user2")
+        self.assertEqual(Rating.get_rating_counts(), {"1": 1})
+        rebuilt = RatingAggregates(Rating.load_all())
+        self.assertEqual(aggregates.averages(), rebuilt.averages())
+        self.assertEqual(aggregates.histogram("1", 5), rebuilt.histogram("1", 5))
+        
+        # Persisted with every written change, and reused on the next load
+        with open(self.app.config['RATINGS_AGGREGATES_FILE']) as f:
+            persisted = json.load(f)
+        self.assertEqual(persisted['source'], Rating._source_signature())
+        persisted['talks']["1"]['sum'] = 2
+        with open(self.app.config['RATINGS_AGGREGATES_FILE'], 'w') as f:
+            json.dump(persisted, f)
+        file_cache.invalidate()
+        self.assertEqual(Rating.get_aggregates().get("1")['sum'], 2)
+        
+        # Persisted aggregates are reused only while they match the ratings
+        persisted['talks']["1"]['count'] = 7
+        with open(self.app.config['RATINGS_AGGREGATES_FILE'], 'w') as f:
+            json.dump(persisted, f)
+        file_cache.invalidate()
+        self.assertEqual(Rating.get_rating_counts(), {"1": 1})
+        self.assertEqual(Rating.rebuild_aggregates().counts(), {"1": 1})
+    
+    def test_talk_search(self):
+        """Test the full-text search index behind Talk.search."""
+        self.assertEqual(fold("Größe"), fold("Groesse"))
+        self.assertEqual(stem(fold("Optimierungen")), stem(fold("optimieren")))
+        
+        talks = {
+            "1": {"title": "Spring Boot Performance", "abstract": "Wir optimieren Anwendungen.", "keywords": "spring"},
+            "2": {"title": "Java Streams", "abstract": "Über Spring und die Größe von Heaps.", "speakerId": 101},
+            "3": {"title": "Kotlin", "abstract": "Nichts davon."}
+        }
+        index = SearchIndex(talks, {"101": {"firstName": "John", "surName": "Doe"}})
+        
+        # Title and keyword matches rank above abstract matches
+        self.assertEqual([talk_id for talk_id, _ in index.search("spring")], ["1", "2"])
+        # Umlaut variants, word forms and prefixes
+        self.assertEqual([talk_id for talk_id, _ in index.search("groesse")], ["2"])
+        self.assertEqual([talk_id for talk_id, _ in index.search("Optimierung")], ["1"])
+        self.assertEqual([talk_id for talk_id, _ in index.search("perf")], ["1"])
+        # Speaker names, all words have to match
+        self.assertEqual([talk_id for talk_id, _ in index.search("doe spring")], ["2"])
+        self.assertEqual(index.search("kotlin spring"), [])
+        self.assertEqual([talk_id for talk_id, _ in index.search("spring", fields=("abstract",))], ["2"])
+        
+        # Talk.search uses an index that is reused until the data changes
+        self.assertEqual(list(Talk.search("smith")), ["2"])
+        self.assertIs(Talk.get_catalog()[0], Talk.get_catalog()[0])
+        self.assertIs(Talk.get_search_index(), Talk.get_search_index())
+    
     def test_comment_model(self):
         """Test Comment model functionality."""
         # Test add_comment
@@ -217,6 +647,362 @@ class TestJFSRatingApp(unittest.TestCase):
         self.assertEqual(len(comments), 1)
         self.assertEqual(comments[0]['text'], "This is a test comment")
     
+    def test_file_cache(self):
+        """Test that parsed JSON files are cached and revalidated."""
+        Talk.get_all()
+        stats = Talk.cache_stats()
+        Talk.get_all()
+        self.assertEqual(Talk.cache_stats()['hits'], stats['hits'] + 1)
+        
+        # Read-only views share the cached object, copies do not
+        self.assertIs(Talk.load_all(copy=False), Talk.load_all(copy=False))
+        self.assertIsNot(Talk.load_all(), Talk.load_all(copy=False))
+        
+        # Saving replaces the cached entry
+        talks = Talk.load_all()
+        talks["3"] = {"id": 3, "title": "Test Talk 3", "topicId": "Java"}
+        self.assertTrue(Talk.save_all(talks))
+        self.assertEqual(len(Talk.get_all()), 3)
+        
+        # External changes are picked up through the file signature
+        with open(self.app.config['TALKS_FILE'], 'w') as f:
+            json.dump({"1": {"id": 1, "title": "Changed"}}, f)
+        self.assertEqual(Talk.get_by_id("1")['title'], "Changed")
+    
+    def test_talk_query(self):
+        """Test filtering, topic facets, sorting and pagination of the overview."""
+        Rating.set_rating("user1", "2", 5)
+        Rating.set_rating("other", "2", 3)
+        Rating.set_rating("other", "1", 4)
+        user_ratings = Rating.get_for_user("user1")
+        
+        result = TalkQuery().run(user_ratings)
+        self.assertEqual(list(result.talks), ["1", "2"])
+        self.assertEqual(result.topic_counts, {"Java": 1, "Spring": 1})
+        
+        # Facet counts ignore the topic filter but follow all others
+        result = TalkQuery(topic="Java", rated="no").run(user_ratings)
+        self.assertEqual(list(result.talks), ["1"])
+        self.assertEqual(result.topic_counts, {"Java": 1})
+        
+        result = TalkQuery(keyword="spring", topic="Java").run(user_ratings)
+        self.assertEqual(result.total, 0)
+        self.assertEqual(result.topic_counts, {"Spring": 1})
+        
+        self.assertEqual(list(TalkQuery(sort="my_rating").run(user_ratings).talks), ["2", "1"])
+        self.assertEqual(list(TalkQuery(sort="rating_count").run(user_ratings).talks), ["2", "1"])
+        self.assertEqual(list(TalkQuery(sort="title").run(user_ratings).talks), ["1", "2"])
+        
+        result = TalkQuery(page=5, per_page=1).run(user_ratings)
+        self.assertEqual((result.page, result.pages, result.total), (2, 2, 2))
+        self.assertEqual(list(result.talks), ["2"])
+    
+    def test_request_snapshot(self):
+        """Test that a page view reads each data file at most once."""
+        self.app.config['DEBUG_DATA_LOADS'] = True
+        user, token = User.create("Snapshot User", "snapshot@example.com")
+        Rating.set_rating(user.id, "1", 4)
+        self.client.get(f'/login?token={token}')
+        
+        response = self.client.get('/?keyword=test&rated=yes')
+        self.assertEqual(response.status_code, 200)
+        # At most users (login), talks, speakers (search) and ratings
+        self.assertLessEqual(int(response.headers['X-Data-Loads']), 4)
+        self.assertIn(b'Test Talk 1', response.data)
+
+    def test_export_ratings(self):
+        """Test the streamed CSV exports."""
+        Rating.set_rating("user1", "2", 5)
+        self.client.post('/admin-login', data={'username': 'admin', 'password': 'admin'})
+
+        response = self.client.get('/admin/export-ratings')
+        self.assertTrue(response.is_streamed)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertTrue(lines[0].startswith('Talk ID,Booking Number'))
+        self.assertTrue(lines[1].startswith('2,TX-002'))
+
+        response = self.client.get('/admin/export-ratings?layout=detailed', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(response.get_data()).decode('utf-8').splitlines()
+        self.assertTrue(lines[0].startswith('Talk ID,Title,Average Rating,Number of Ratings,Test User'))
+        self.assertTrue(lines[1].startswith('2,Test Talk 2,5.00,1,5'))
+        self.assertTrue(lines[2].startswith('1,Test Talk 1,0.00,0,'))
+
+    def test_json_rating_and_comment(self):
+        """Test the JSON variants of the rating and comment forms."""
+        user, token = User.create("Json User", "json@example.com")
+        Rating.set_rating("user1", "1", 2)
+        self.client.get(f'/login?token={token}')
+
+        response = self.client.post('/rate/1', json={'rating': 4, 'include_ratings': True})
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual((data['rating'], data['count'], data['average']), (4, 2, 3.0))
+        self.assertIn({'user_name': "Json User", 'rating': 4, 'own': True}, data['ratings'])
+        self.assertNotIn('ratings', self.client.post('/rate/1', json={'rating': 5}).get_json())
+
+        response = self.client.post('/rate/1', json={'rating': 9})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.get_json()['success'])
+        # JSON values are not converted: no 1-star vote from true, no 4 from 4.7
+        for value in (True, 4.7, "4"):
+            self.assertEqual(self.client.post('/rate/2', json={'rating': value}).status_code, 400)
+        self.assertEqual(Rating.get_user_rating_for_talk(user.id, "2"), 0)
+
+        response = self.client.post('/comment/1', data={'comment': 'Gut'}, headers={'Accept': 'application/json'})
+        self.assertEqual(response.get_json()['comment'], {'user_name': "Json User", 'text': 'Gut'})
+        self.assertEqual(response.get_json()['count'], 1)
+        self.assertEqual(self.client.post('/comment/1', json={'comment': ' '}).status_code, 400)
+
+        # Plain form posts still redirect to the detail page
+        self.assertEqual(self.client.post('/rate/1', data={'rating': '3'}).status_code, 302)
+
+    def test_admin_events(self):
+        """Test the live updates pushed to the admin dashboard."""
+        broker = EventBroker(history_size=2)
+        broker.publish('rating', lambda: self.fail("built without subscribers"))
+        subscription = broker.subscribe()
+        broker.publish('rating', {'talk_id': "1"})
+        self.assertEqual(subscription.get(timeout=1), (2, 'rating', {'talk_id': "1"}))
+        broker.publish('comment', {})
+        broker.publish('comment', {})
+        # Reconnects replay kept events, or ask for a reload if some are gone
+        self.assertEqual(broker.subscribe(last_event_id=3).get(timeout=1)[0], 4)
+        self.assertEqual(broker.subscribe(last_event_id=1).get(timeout=1)[1], 'reload')
+
+        self.client.post('/admin-login', data={'username': 'admin', 'password': 'admin'})
+        response = self.client.get('/admin/events', buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        stream = (chunk.decode('utf-8') for chunk in response.response)
+        self.assertTrue(next(stream).startswith('retry:'))
+        Rating.set_rating("user1", "2", 4)
+        Comment.add_comment("2", "user1", "Test User", "Live")
+        rating = next(stream)
+        self.assertIn('event: rating', rating)
+        self.assertIn('"total_ratings": 1', rating)
+        self.assertIn('"total_comments": 1', next(stream))
+        response.close()
+
+    def test_columnar_export(self):
+        """Test the npz and Arrow exports of the ratings."""
+        import analytics
+        import exports
+        matrix = RatingMatrix({"u1": {"2": 4}, "u2": {"1": 2, "2": 5}})
+        talks = Talk.get_all()
+        users = {"u1": {"name": "Ärger"}, "u2": {"name": "B"}, "u3": {"name": "C"}}
+
+        # Unknown talks stay unrated even if the talk is added while streaming
+        rows = exports.rating_rows(matrix, ["2", "new", "1"], ["u1", "u2", "u3"])
+        self.assertEqual(next(rows), bytes([4, 0, 0]))
+        matrix.set_rating("u2", "other", 3, None)
+        matrix.set_rating("u2", "new", 1, None)
+        self.assertEqual(list(rows), [bytes([5, 0, 2]), bytes(3)])
+        self.assertEqual(list(exports.rating_rows(matrix, ["new"], ["u2"])), [bytes([1])])
+        matrix = RatingMatrix({"u1": {"2": 4}, "u2": {"1": 2, "2": 5}})
+
+        output = io.BytesIO()
+        exports.write_npz(output, matrix, talks, ["1", "2"], users)
+        output.seek(0)
+        numpy = analytics.numpy
+        if numpy is not None:
+            with numpy.load(output) as data:
+                self.assertEqual(data['ratings'].tolist(), [[0, 4], [2, 5], [0, 0]])
+                self.assertEqual(data['user_names'].tolist(), ["Ärger", "B", "C"])
+                self.assertEqual(data['topic_id'].tolist(), ["Java", "Spring"])
+
+        if exports.pyarrow is not None:
+            table = exports.ratings_table(matrix, talks, ["2", "1"], users)
+            self.assertEqual(table.column('title').to_pylist(), ["Test Talk 2", "Test Talk 1"])
+            self.assertEqual(table.column('u2').to_pylist(), [5, 2])
+            self.assertEqual(table.column('u3').to_pylist(), [None, None])
+
+        self.client.post('/admin-login', data={'username': 'admin', 'password': 'admin'})
+        response = self.client.get('/admin/export-ratings?format=npz')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_data().startswith(b'PK'))
+
+    def test_talk_catalog(self):
+        """Test the JSON catalog for filtering in the browser."""
+        user, token = User.create("Catalog User", "catalog@example.com")
+        self.client.get(f'/login?token={token}')
+
+        response = self.client.get('/catalog.json')
+        self.assertEqual(response.status_code, 200)
+        catalog = response.get_json()
+        self.assertEqual(catalog['talks'][0], {'id': "1", 'title': "Test Talk 1", 'topicId': "Java",
+                                               'bookingNumber': "TX-001",
+                                               'teaser': "This is a test talk abstract."})
+        self.assertEqual(catalog['topics'], ["Java", "Spring"])
+        self.assertEqual(catalog['max_rating'], self.app.config['MAX_RATING'])
+        # Positions and weighted term frequencies of the talks matching a term
+        self.assertEqual(catalog['index']['terms']['smith'], [1, 2.0])
+        self.assertIn('abstract', self.client.get('/catalog.json?abstracts=1').get_json()['talks'][0])
+
+        # Revalidation downloads the catalog again only after a change
+        etag = response.headers['ETag']
+        self.assertEqual(self.client.get('/catalog.json', headers={'If-None-Match': etag}).status_code, 304)
+        talks = Talk.load_all()
+        talks["2"]["title"] = "Renamed Talk"
+        Talk.save_all(talks)
+        response = self.client.get('/catalog.json', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['talks'][1]['title'], "Renamed Talk")
+
+    def test_conditional_responses(self):
+        """Test the ETag and Last-Modified validators of pages and exports."""
+        user, token = User.create("Cached User", "cached@example.com")
+        self.client.get(f'/login?token={token}')
+        self.client.get('/')
+
+        response = self.client.get('/talk/1')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertIsNotNone(response.last_modified)
+        response = self.client.get('/talk/1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+
+        # A new rating changes the page, its flashed message is never cached
+        self.client.post('/rate/1', data={'rating': '4'})
+        response = self.client.get('/talk/1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response.headers)
+        etag = self.client.get('/talk/1').headers['ETag']
+        self.assertEqual(self.client.get('/talk/1', headers={'If-None-Match': etag}).status_code, 304)
+
+        # The overview depends on the filters; a 304 still stores them in the session
+        etag = self.client.get('/?topic=Java').headers['ETag']
+        self.assertNotEqual(self.client.get('/?topic=Spring').headers['ETag'], etag)
+        self.assertEqual(self.client.get('/?topic=Java', headers={'If-None-Match': etag}).status_code, 304)
+        with self.client.session_transaction() as sess:
+            self.assertEqual(sess['topic_filter'], "Java")
+        # Reading the filters for the ETag does not change the session
+        from main import read_filters
+        with self.app.test_request_context('/?topic=Spring'):
+            session['topic_filter'] = "Java"
+            self.assertEqual(read_filters()['topic'], "Spring")
+            self.assertEqual(dict(session), {'topic_filter': "Java"})
+            self.assertEqual(read_filters()['keyword'], '')
+
+        self.client.post('/admin-login', data={'username': 'admin', 'password': 'admin'})
+        self.client.get('/admin/')
+        for url in ('/admin/ratings-matrix', '/admin/export-ratings'):
+            etag = self.client.get(url).headers['ETag']
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        # Compressed and plain exports are different representations
+        gzip_etag = self.client.get('/admin/export-ratings', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+        self.assertNotEqual(gzip_etag, etag)
+
+    def test_ratings_matrix_data(self):
+        """Test the paged JSON data of the admin ratings matrix."""
+        alice, _ = User.create("Alice", "alice@example.com")
+        bob, _ = User.create("Bob", "bob@example.com")
+        Rating.set_rating(alice.id, "1", 2)
+        Rating.set_rating(alice.id, "2", 5)
+        Rating.set_rating(bob.id, "2", 4)
+        self.assertEqual(Rating.get_matrix().block(["2", "3", "1"], [bob.id, "missing", alice.id]),
+                         [(0, 0, 4), (0, 2, 5), (2, 2, 2)])
+
+        self.client.post('/admin-login', data={'username': 'admin', 'password': 'admin'})
+        data = self.client.get('/admin/ratings-matrix/data?sort=average&order=desc&limit=1&user_sort=name&active=1').get_json()
+        self.assertEqual((data['total_rows'], data['total_columns']), (2, 2))
+        self.assertEqual(data['rows'], [{'id': "2", 'title': "Test Talk 2", 'speaker': "Jane Smith",
+                                         'topic': "Spring", 'average': 4.5, 'count': 2}])
+        self.assertEqual([column['name'] for column in data['columns']], ["Alice", "Bob"])
+        # Only the rated cells of the page are sent
+        self.assertEqual(data['cells'], [[0, 0, 5], [0, 1, 4]])
+
+        data = self.client.get('/admin/ratings-matrix/data?topic=Java&reviewer=BOB').get_json()
+        self.assertEqual([row['id'] for row in data['rows']], ["1"])
+        self.assertEqual([column['id'] for column in data['columns']], [bob.id])
+        self.assertEqual(data['cells'], [])
+        data = self.client.get('/admin/ratings-matrix/data?offset=1&user_offset=1&user_sort=count&active=1').get_json()
+        self.assertEqual(([row['id'] for row in data['rows']], [column['id'] for column in data['columns']]),
+                         (["2"], [bob.id]))
+
+        # Both directions keep unrated talks last
+        talks = Talk.load_all()
+        talks["3"] = {"title": "Unrated Talk", "topicId": "Java"}
+        Talk.save_all(talks)
+        for query, expected in (('sort=average', ["1", "2", "3"]), ('sort=average&order=desc', ["2", "1", "3"]),
+                                ('sort=count', ["1", "2", "3"]), ('sort=count&order=desc', ["2", "1", "3"]),
+                                ('sort=id&order=desc', ["3", "2", "1"])):
+            data = self.client.get(f'/admin/ratings-matrix/data?{query}').get_json()
+            self.assertEqual([row['id'] for row in data['rows']], expected, query)
+
+    def test_fragment_cache(self):
+        """Test the cache of rendered talk cards and detail sections."""
+        cache = FragmentCache(max_entries=2, max_chars=10)
+        cache.put('a', 1, "aaaa")
+        cache.put('b', 1, "bbbb")
+        self.assertIsNone(cache.get('a', 2))
+        self.assertEqual(cache.get('a', 1), "aaaa")
+        cache.put('c', 1, "cccc")
+        # The least recently used fragment is dropped, also when too large in total
+        self.assertIsNone(cache.get('b', 1))
+        cache.put('a', 2, "aaaaaaaa")
+        self.assertEqual((cache.get('a', 2), cache.get('c', 1)), ("aaaaaaaa", None))
+
+        user, token = User.create("Fragment User", "fragment@example.com")
+        self.client.get(f'/login?token={token}')
+        self.client.get('/')
+        fragment_cache.clear()
+        first = self.client.get('/').get_data(as_text=True)
+        hits = fragment_cache.stats()['hits']
+        self.assertEqual(self.client.get('/').get_data(as_text=True), first)
+        self.assertEqual(fragment_cache.stats()['hits'], hits + 2)
+
+        # The user's own stars are spliced into the cached cards
+        Rating.set_rating(user.id, "1", 3)
+        page = self.client.get('/').get_data(as_text=True)
+        self.assertEqual(page.count('<i class="bi bi-star-fill"></i>'), 3)
+        self.assertEqual(fragment_cache.stats()['hits'], hits + 4)
+
+        # A new comment renders the comments again, but not the talk description
+        self.client.get('/talk/1')
+        Comment.add_comment("1", user.id, user.name, "Neu <b>")
+        self.assertIn("Neu &lt;b&gt;", self.client.get('/talk/1').get_data(as_text=True))
+
+    def test_sync_batch(self):
+        """Test syncing ratings and comments queued offline."""
+        user, token = User.create("Offline User", "offline@example.com")
+        self.client.get(f'/login?token={token}')
+        items = [
+            {'key': 'a', 'type': 'rating', 'talk_id': "1", 'rating': 3},
+            {'key': 'b', 'type': 'rating', 'talk_id': "2", 'rating': 9},
+            {'key': 'c', 'type': 'comment', 'talk_id': "1", 'comment': 'Offline'},
+            {'key': 'd', 'type': 'rating', 'talk_id': "1", 'rating': 5},
+        ]
+        results = self.client.post('/sync', json={'items': items}).get_json()['results']
+        self.assertEqual([(r['key'], r['success'], r['duplicate']) for r in results],
+                         [('a', True, False), ('b', False, False), ('c', True, False), ('d', True, False)])
+        self.assertEqual(Rating.get_for_user(user.id), {"1": 5})
+        self.assertEqual(len(Comment.get_for_talk("1")), 1)
+
+        # A resent batch is not applied again; failed items can be retried
+        items[1]['rating'] = 4
+        results = self.client.post('/sync', json={'items': items}).get_json()['results']
+        self.assertEqual([(r['success'], r['duplicate']) for r in results],
+                         [(True, True), (True, False), (True, True), (True, True)])
+        self.assertEqual(Rating.get_for_user(user.id), {"1": 5, "2": 4})
+        self.assertEqual(len(Comment.get_for_talk("1")), 1)
+        self.assertEqual(self.client.post('/sync', json={}).status_code, 400)
+
+        # Items need an existing talk and a numeric rating
+        items = [
+            {'key': 'e', 'type': 'rating', 'rating': 3},
+            {'key': 'f', 'type': 'rating', 'talk_id': "99", 'rating': 3},
+            {'key': 'g', 'type': 'rating', 'talk_id': "2", 'rating': True},
+        ]
+        results = self.client.post('/sync', json={'items': items}).get_json()['results']
+        self.assertEqual([r['success'] for r in results], [False, False, False])
+        self.assertEqual(Rating.get_for_user(user.id), {"1": 5, "2": 4})
+
+        # The worker's caches are versioned by the static files
+        script = self.client.get('/sw.js').get_data(as_text=True)
+        self.assertNotIn('__STATIC_VERSION__', script)
+        self.assertRegex(script, r"CACHE_VERSION = 'jfs2025-v2-[0-9a-f]{12}'")
+
     def test_login_page(self):
         """Test login page."""
         response = self.client.get('/login')
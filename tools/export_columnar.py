@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Export the ratings with talk metadata in a columnar format for pandas & co.
+
+Formats: npz (always available), parquet and arrow (with pyarrow installed).
+Usage:
+
+    python tools/export_columnar.py [npz|parquet|arrow] [output_file]
+"""
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# Make the application modules importable when run from the tools directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import exports
+from config import Config
+from models import Rating
+from rating_matrix import RatingMatrix
+from storage import JournaledDocument
+
+
+def load_json_file(filepath):
+    """Load JSON data from file."""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading {filepath}: {e}")
+        return {}
+
+
+def export_columnar(export_format='npz', output_file=None):
+    """Export ratings, talks and users to a columnar file."""
+    if export_format not in exports.COLUMNAR_FORMATS:
+        print(f"Error: Unknown format {export_format}, use one of {', '.join(exports.COLUMNAR_FORMATS)}")
+        return
+    if export_format != 'npz' and exports.pyarrow is None:
+        print("Error: pyarrow is required for Parquet and Arrow exports")
+        return
+
+    talks = load_json_file(Config.TALKS_FILE)
+    users = load_json_file(Config.USERS_FILE)
+    if os.path.exists(Config.RATINGS_JOURNAL_FILE):
+        # Include the votes not yet compacted into ratings.json
+        journal = JournaledDocument(Config.RATINGS_FILE, Config.RATINGS_JOURNAL_FILE,
+                                    Rating._apply_journal_record, compact_threshold=0)
+        ratings = journal.load()
+    else:
+        ratings = load_json_file(Config.RATINGS_FILE)
+
+    if not output_file:
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        extension = exports.COLUMNAR_FORMATS[export_format][1]
+        output_file = Path(Config.DATA_DIR) / f'ratings_{timestamp}.{extension}'
+
+    with open(output_file, 'wb') as f:
+        exports.write_columnar(f, export_format, RatingMatrix(ratings), talks, list(talks), users)
+
+    print(f"Successfully exported {len(talks)} talks and {len(users)} users to {output_file}")
+
+
+if __name__ == '__main__':
+    export_columnar(*sys.argv[1:3])
@@ -5,9 +5,17 @@ Export detailed ratings CSV with one column per user showing their ratings.
 import json
 import csv
 import os
+import sys
 from datetime import datetime
 from pathlib import Path
 
+# Make the application modules importable when run from the tools directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from analytics import RatingAnalytics
+from exports import detailed_rows
+from rating_matrix import RatingMatrix
+
 def load_json_file(filepath):
     """Load JSON data from file."""
     try:
@@ -32,31 +40,19 @@ def export_detailed_ratings():
         print("Error: Missing required data files")
         return
     
+    # Per-talk statistics from the shared analytics engine
+    matrix = RatingMatrix(ratings)
+    analytics = RatingAnalytics(matrix, talks)
+    
     # Prepare output filename with timestamp
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     output_file = data_dir / f'ratings_detailed_{timestamp}.csv'
     
-    # Create CSV writer
+    # Write the same layout as the detailed export in the admin area
+    # (/admin/export-ratings?layout=detailed), in catalog order
     with open(output_file, 'w', encoding='utf-8', newline='') as csvfile:
         writer = csv.writer(csvfile)
-        
-        # Write header row
-        header = ['Talk ID', 'Title']
-        header.extend(users[user_id]['name'] for user_id in users)
-        writer.writerow(header)
-        
-        # Write data rows
-        for talk_id, talk in talks.items():
-            row = [talk_id, talk.get('title', '')]
-            
-            # Add ratings from each user
-            for user_id in users:
-                if user_id in ratings and talk_id in ratings[user_id]:
-                    row.append(ratings[user_id][talk_id])
-                else:
-                    row.append('')  # Empty if no rating
-            
-            writer.writerow(row)
+        writer.writerows(detailed_rows(matrix, analytics, talks, list(talks), users))
     
     print(f"Successfully exported detailed ratings to {output_file}")
 
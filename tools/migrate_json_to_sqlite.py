@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Import the JSON data files into the SQLite database used with STORAGE_BACKEND=sqlite.
+
+Existing rows in the database are replaced. Usage:
+
+    python tools/migrate_json_to_sqlite.py [database_path]
+"""
+import os
+import sys
+from pathlib import Path
+
+# Make the application modules importable when run from the tools directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import Config
+from models import Rating
+from sqlite_storage import SQLiteStorage
+from storage import JournaledDocument
+
+
+def migrate_json_to_sqlite(database_path=None):
+    """Import talks, speakers, users, ratings and comments into SQLite."""
+    database_path = database_path or Config.SQLITE_DATABASE
+    storage = SQLiteStorage(database_path)
+
+    counts = storage.import_json({
+        'talks': Config.TALKS_FILE,
+        'speakers': Config.SPEAKERS_FILE,
+        'users': Config.USERS_FILE,
+        'ratings': Config.RATINGS_FILE,
+        'comments': Config.COMMENTS_FILE
+    })
+
+    # Votes still in the rating journal are not part of ratings.json yet
+    if os.path.exists(Config.RATINGS_JOURNAL_FILE):
+        journal = JournaledDocument(Config.RATINGS_FILE, Config.RATINGS_JOURNAL_FILE,
+                                    Rating._apply_journal_record, compact_threshold=0)
+        ratings = journal.load()
+        storage.save('ratings', ratings)
+        counts['ratings'] = len(ratings)
+
+    for table, count in counts.items():
+        print(f"Imported {count} entries into {table}")
+    print(f"Successfully migrated JSON data to {database_path}")
+
+
+if __name__ == '__main__':
+    migrate_json_to_sqlite(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -59,10 +59,8 @@ def recover_ratings_from_log():
     """Recover ratings from log file in case of data loss."""
     from flask import current_app
     import re
-    import json
     
     log_file = current_app.config['RATING_LOG_FILE']
-    ratings_file = current_app.config['RATINGS_FILE']
     
     if not os.path.exists(log_file):
         return False, "Log-Datei nicht gefunden."
@@ -94,10 +92,11 @@ def recover_ratings_from_log():
                     ratings[user_id] = {}
                 ratings[user_id][talk_id] = int(new_rating)
     
-    # Save reconstructed ratings
+    # Save reconstructed ratings (through the model so a rating journal is reset too)
+    from models import Rating
     try:
-        with open(ratings_file, 'w') as f:
-            json.dump(ratings, f, indent=4)
+        if not Rating.save_all(ratings):
+            return False, "Fehler beim Speichern der wiederhergestellten Bewertungen."
         return True, f"Bewertungen erfolgreich aus Log-Datei wiederhergestellt. {sum(len(user_ratings) for user_ratings in ratings.values())} Bewertungen wiederhergestellt."
     except Exception as e:
         return False, f"Fehler beim Speichern der wiederhergestellten Bewertungen: {str(e)}"